@@ -0,0 +1,140 @@
+"""
+Benchmark of batched vs per-frame vision requests in analyze_frames.
+
+Runs the same frames through the per-frame path and through batches of
+several frames (as separate images and as a contact sheet) and reports the
+number of requests, prompt/completion tokens and wall time for each.
+
+With --simulate the OpenAI call is replaced by a fake with a fixed latency
+per request plus a latency per image, and token usage is estimated with
+OpenAI's published image token formula, so no API key is needed:
+
+    python bench_batching.py --video sample_video.mp4 --simulate --batch-sizes 4 8
+
+Without --simulate the real API is called and billed.
+"""
+
+import argparse
+import base64
+import json
+import math
+import re
+import time
+
+import cv2
+import numpy as np
+import openai
+from openai.util import convert_to_openai_object
+
+from processor import AudioDescriptionProcessor
+
+
+def image_tokens(width: int, height: int) -> int:
+    """Prompt tokens for one high-detail image"""
+    scale = min(1.0, 2048 / max(width, height))
+    width, height = width * scale, height * scale
+    scale = min(1.0, 768 / min(width, height))
+    width, height = width * scale, height * scale
+    return 85 + 170 * math.ceil(width / 512) * math.ceil(height / 512)
+
+
+def patch_openai(request_latency: float, image_latency: float):
+    def fake_create(*args, **kwargs):
+        text, images = "", []
+        for message in kwargs["messages"]:
+            content = message["content"]
+            if isinstance(content, str):
+                text += content
+                continue
+            for part in content:
+                if part["type"] == "text":
+                    text += part["text"]
+                else:
+                    data = base64.b64decode(part["image_url"]["url"].split(",", 1)[1])
+                    images.append(cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR).shape[:2])
+
+        time.sleep(request_latency + image_latency * len(images))
+        frame_numbers = [int(n) for n in re.findall(r"frame_number (\d+)", text)]
+        if "response_format" in kwargs:
+            content = json.dumps({
+                "frames": [
+                    {"frame_number": n, "description": f"Players contest the ball in frame {n}."}
+                    for n in frame_numbers
+                ]
+            })
+        else:
+            content = "Players contest the ball near the halfway line."
+        usage = {
+            "prompt_tokens": len(text) // 4 + sum(image_tokens(w, h) for h, w in images),
+            "completion_tokens": len(content) // 4,
+        }
+        return convert_to_openai_object({
+            "choices": [{"message": {"content": content}}],
+            "usage": usage,
+        })
+
+    openai.ChatCompletion.create = fake_create
+
+
+def synthetic_frames(count: int, fps: float = 1.0):
+    rng = np.random.default_rng(0)
+    for i in range(count):
+        frame = np.full((720, 1280, 3), (i * 37) % 255, dtype=np.uint8)
+        frame[::8, ::8] = rng.integers(0, 255, (90, 160, 3), dtype=np.uint8)
+        yield i, i / fps, cv2.resize(frame, (768, 432), interpolation=cv2.INTER_AREA)
+
+
+def run(frames: list, batch_size: int, layout: str) -> dict:
+    processor = AudioDescriptionProcessor()
+    processor.batch_layout = layout
+    processor.cache = None  # every run must pay for its own requests
+    start = time.perf_counter()
+    results = processor.analyze_frames(iter(frames), batch_size=batch_size)
+    elapsed = time.perf_counter() - start
+    return {
+        "mode": "per-frame" if batch_size == 1 else f"{layout} x{batch_size}",
+        "frames": len(results),
+        "requests": processor.usage["requests"],
+        "prompt_tokens": processor.usage["prompt_tokens"],
+        "completion_tokens": processor.usage["completion_tokens"],
+        "seconds": elapsed,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--video", help="video to sample frames from (default: synthetic frames)")
+    parser.add_argument("--frames", type=int, default=40, help="number of frames to analyze")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[4, 8])
+    parser.add_argument("--simulate", action="store_true", help="fake the OpenAI API")
+    parser.add_argument("--request-latency", type=float, default=1.0)
+    parser.add_argument("--image-latency", type=float, default=0.15)
+    args = parser.parse_args()
+
+    if args.simulate:
+        patch_openai(args.request_latency, args.image_latency)
+
+    if args.video:
+        frames = []
+        for item in AudioDescriptionProcessor().extract_frames(args.video):
+            frames.append(item)
+            if len(frames) == args.frames:
+                break
+    else:
+        frames = list(synthetic_frames(args.frames))
+
+    runs = [run(frames, 1, "frames")]
+    for batch_size in args.batch_sizes:
+        for layout in ("frames", "contact_sheet"):
+            runs.append(run(frames, batch_size, layout))
+
+    print(f"{'mode':>18} {'frames':>7} {'requests':>9} {'prompt tok':>11} {'compl tok':>10} {'wall (s)':>9}")
+    for stats in runs:
+        print(
+            f"{stats['mode']:>18} {stats['frames']:>7} {stats['requests']:>9} "
+            f"{stats['prompt_tokens']:>11} {stats['completion_tokens']:>10} {stats['seconds']:>9.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""
+Peak memory of upload handling for large video and audio files.
+
+Builds an upload the way FastAPI does (a SpooledTemporaryFile that rolls
+over to disk past 1 MB) and measures the peak Python heap with tracemalloc
+while it is handed to handle_flutter_upload and AudioProcessor.transcribe_audio.
+The previous read-everything-then-write handling is measured alongside
+as a baseline. Video processing and the Whisper call are replaced by fakes
+that read their input in chunks, so only the upload handling is measured:
+
+    python bench_upload_memory.py --size-mb 200
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import tracemalloc
+
+import openai
+
+# The fake pipeline never reads the cache; don't create its database
+os.environ.setdefault("RESULT_CACHE", "0")
+
+from processor import AudioDescriptionProcessor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "chatbots"))
+from preorder_chatbot.main import AudioProcessor  # noqa: E402
+
+CHUNK = 1024 * 1024
+
+
+def make_upload(size_mb: int):
+    upload = tempfile.SpooledTemporaryFile(max_size=CHUNK)
+    block = os.urandom(CHUNK)
+    for _ in range(size_mb):
+        upload.write(block)
+    upload.seek(0)
+    return upload
+
+
+def drain(file):
+    while file.read(CHUNK):
+        pass
+
+
+def measure(label: str, size_mb: int, handler) -> dict:
+    upload = make_upload(size_mb)
+    tracemalloc.start()
+    handler(upload)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    upload.close()
+    return {"case": label, "size_mb": size_mb, "peak_mb": peak / CHUNK}
+
+
+def legacy_video(upload):
+    with tempfile.NamedTemporaryFile(delete=False, suffix=".mp4") as temp_video:
+        temp_video.write(upload.read())
+    with open(temp_video.name, "rb") as f:
+        drain(f)
+    os.unlink(temp_video.name)
+
+
+def legacy_audio(upload):
+    with tempfile.NamedTemporaryFile(delete=False, suffix=".wav") as temp_audio:
+        audio_content = upload.read()
+        upload.seek(0)
+        temp_audio.write(audio_content)
+    with open(temp_audio.name, "rb") as audio:
+        openai.Audio.transcribe(model="whisper-1", file=audio)
+    os.unlink(temp_audio.name)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--size-mb", type=int, nargs="+", default=[50, 200])
+    args = parser.parse_args()
+
+    processor = AudioDescriptionProcessor()
+
+    def fake_process_video(video_path, on_progress=None):
+        with open(video_path, "rb") as f:
+            drain(f)
+        return {"status": "success", "narrative": "", "scenes": []}
+
+    def fake_transcribe(model, file, **kwargs):
+        drain(file)
+        return openai.util.convert_to_openai_object({"text": ""})
+
+    processor.process_video = fake_process_video
+    processor.save_results = lambda output_path, results: output_path
+    openai.Audio.transcribe = fake_transcribe
+    audio_processor = AudioProcessor()
+
+    cases = [
+        ("video, read + write", legacy_video),
+        ("video, streamed", lambda upload: processor.handle_flutter_upload({"file": upload})),
+        ("audio, read + write", legacy_audio),
+        ("audio, streamed", lambda upload: audio_processor.transcribe_audio(upload, "speech.m4a")),
+    ]
+
+    print(f"{'case':>22} {'upload (MB)':>12} {'peak heap (MB)':>15}")
+    for size_mb in args.size_mb:
+        for label, handler in cases:
+            stats = measure(label, size_mb, handler)
+            print(f"{stats['case']:>22} {stats['size_mb']:>12} {stats['peak_mb']:>15.1f}")
+
+
+if __name__ == "__main__":
+    main()
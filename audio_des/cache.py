@@ -0,0 +1,233 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional
+
+import numpy as np
+
+try:
+    from .keyframes import dhash, hamming
+except ImportError:  # running from inside audio_des/
+    from keyframes import dhash, hamming
+
+logger = logging.getLogger(__name__)
+
+
+def file_sha256(path: str, chunk_size: int = 1 << 20) -> str:
+    """Hex SHA-256 of a file, read in chunks"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def frame_key(frame: np.ndarray) -> str:
+    """
+    Perceptual key of a frame: a 256-bit difference hash as hex. Re-encoded
+    copies differ in a few bits, which ResultCache.get_frame tolerates.
+    """
+    return f"{dhash(frame, size=16):064x}"
+
+
+def frame_bands(key: str, bands: int) -> list:
+    """
+    LSH bands of a "<model>:<hash>" frame key. Two hashes within `bands - 1`
+    bits of each other agree exactly on at least one band.
+    """
+    prefix, _, digest = key.rpartition(":")
+    width = len(digest) // bands
+    return [f"{prefix}:{i}:{digest[i * width:(i + 1) * width]}" for i in range(bands)]
+
+
+class ResultCache:
+    """
+    Content-addressed cache of audio descriptions and frame descriptions.
+
+    Whole videos are keyed by the SHA-256 of the file, frames by a
+    perceptual hash of the decoded image; both keys also include the model
+    names so changing a model does not return stale text. A frame matches
+    the closest stored hash within `frame_distance` bits, found through
+    banded LSH buckets rather than a scan. Entries live in one SQLite file
+    whose stored payload is capped at `max_bytes`, evicting the least
+    recently used entries of either kind first. Access times are kept in
+    memory and written in batches, so a lookup does not commit.
+    """
+
+    BANDS = 16  # 16-bit bands of the 256-bit frame hash
+    TOUCH_BATCH = 256
+
+    def __init__(self, db_path: str, max_bytes: int = 256 * 1024 * 1024, frame_distance: int = 10):
+        self.db_path = db_path
+        self.max_bytes = max_bytes
+        # Must stay below BANDS for every match within the radius to share a band
+        self.frame_distance = min(frame_distance, self.BANDS - 1)
+        self._lock = threading.Lock()
+        self._touched: Dict[tuple, float] = {}
+        self.hits = {"video": 0, "frame": 0}
+        self.misses = {"video": 0, "frame": 0}
+
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS entries (
+                kind TEXT NOT NULL,
+                key TEXT NOT NULL,
+                value TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                last_used REAL NOT NULL,
+                PRIMARY KEY (kind, key)
+            );
+            CREATE INDEX IF NOT EXISTS idx_entries_last_used ON entries (last_used);
+            CREATE TABLE IF NOT EXISTS frame_bands (
+                band TEXT NOT NULL,
+                key TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_frame_bands_band ON frame_bands (band);
+            CREATE INDEX IF NOT EXISTS idx_frame_bands_key ON frame_bands (key);
+            """
+        )
+        self.conn.commit()
+        self.total_bytes = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+
+    def get_video(self, video_hash: str) -> Optional[Dict[str, Any]]:
+        value = self._get("video", video_hash)
+        return json.loads(value) if value is not None else None
+
+    def put_video(self, video_hash: str, result: Dict[str, Any]):
+        self._put("video", video_hash, json.dumps(result, ensure_ascii=False, default=str))
+
+    def get_frame(self, key: str) -> Optional[str]:
+        """Description of the stored frame closest to `key`, within frame_distance bits"""
+        with self._lock:
+            value = self._lookup("frame", key)
+            if value is None and self.frame_distance > 0:
+                nearest = self._nearest_frame(key)
+                if nearest is not None:
+                    value = self._lookup("frame", nearest)
+            self._count("frame", value)
+            return value
+
+    def put_frame(self, key: str, description: str):
+        self._put("frame", key, description)
+
+    def _get(self, kind: str, key: str) -> Optional[str]:
+        with self._lock:
+            value = self._lookup(kind, key)
+            self._count(kind, value)
+            return value
+
+    def _lookup(self, kind: str, key: str) -> Optional[str]:
+        row = self.conn.execute(
+            "SELECT value FROM entries WHERE kind = ? AND key = ?", (kind, key)
+        ).fetchone()
+        if row is None:
+            return None
+        self._touched[(kind, key)] = time.time()
+        if len(self._touched) >= self.TOUCH_BATCH:
+            self._flush_touched()
+            self.conn.commit()
+        return row[0]
+
+    def _count(self, kind: str, value: Optional[str]):
+        if value is None:
+            self.misses[kind] += 1
+        else:
+            self.hits[kind] += 1
+
+    def _nearest_frame(self, key: str) -> Optional[str]:
+        bands = frame_bands(key, self.BANDS)
+        rows = self.conn.execute(
+            f"SELECT DISTINCT key FROM frame_bands WHERE band IN ({', '.join('?' * len(bands))})",
+            bands,
+        ).fetchall()
+        target = int(key.rpartition(":")[2], 16)
+        best, best_distance = None, self.frame_distance + 1
+        for (candidate,) in rows:
+            distance = hamming(target, int(candidate.rpartition(":")[2], 16))
+            if distance < best_distance:
+                best, best_distance = candidate, distance
+        return best
+
+    def _flush_touched(self):
+        if self._touched:
+            self.conn.executemany(
+                "UPDATE entries SET last_used = ? WHERE kind = ? AND key = ?",
+                [(used, kind, key) for (kind, key), used in self._touched.items()],
+            )
+            self._touched.clear()
+
+    def flush(self):
+        """Write pending access times, e.g. before shutdown"""
+        with self._lock:
+            self._flush_touched()
+            self.conn.commit()
+
+    def _put(self, kind: str, key: str, value: str):
+        size = len(value.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT size FROM entries WHERE kind = ? AND key = ?", (kind, key)
+            ).fetchone()
+            self.conn.execute(
+                "INSERT OR REPLACE INTO entries (kind, key, value, size, last_used) VALUES (?, ?, ?, ?, ?)",
+                (kind, key, value, size, time.time()),
+            )
+            if kind == "frame" and row is None:
+                self.conn.executemany(
+                    "INSERT INTO frame_bands (band, key) VALUES (?, ?)",
+                    [(band, key) for band in frame_bands(key, self.BANDS)],
+                )
+            self.total_bytes += size - (row[0] if row else 0)
+            self._flush_touched()
+            if self.total_bytes > self.max_bytes:
+                self._evict()
+            self.conn.commit()
+
+    def _evict(self):
+        while self.total_bytes > self.max_bytes:
+            rows = self.conn.execute(
+                "SELECT kind, key, size FROM entries ORDER BY last_used LIMIT 100"
+            ).fetchall()
+            if not rows:
+                break
+            for kind, key, size in rows:
+                self.conn.execute("DELETE FROM entries WHERE kind = ? AND key = ?", (kind, key))
+                if kind == "frame":
+                    self.conn.execute("DELETE FROM frame_bands WHERE key = ?", (key,))
+                self.total_bytes -= size
+                if self.total_bytes <= self.max_bytes:
+                    break
+        logger.info(f"Result cache evicted down to {self.total_bytes} bytes")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "bytes": self.total_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": dict(self.hits),
+                "misses": dict(self.misses),
+            }
+
+
+def create_result_cache() -> Optional[ResultCache]:
+    """
+    Build the cache from RESULT_CACHE, RESULT_CACHE_PATH, RESULT_CACHE_MAX_MB
+    and RESULT_CACHE_FRAME_DISTANCE, or None if disabled
+    """
+    if os.environ.get("RESULT_CACHE", "1") != "1":
+        return None
+    db_path = os.environ.get(
+        "RESULT_CACHE_PATH",
+        os.path.join(os.path.dirname(os.path.abspath(__file__)), "result_cache.db"),
+    )
+    max_bytes = int(float(os.environ.get("RESULT_CACHE_MAX_MB", 256)) * 1024 * 1024)
+    frame_distance = int(os.environ.get("RESULT_CACHE_FRAME_DISTANCE", 10))
+    return ResultCache(db_path, max_bytes, frame_distance)
@@ -0,0 +1,221 @@
+import json
+import logging
+import os
+import queue
+import shutil
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, BinaryIO, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class JobQueue:
+    """
+    Persistent queue of audio-description jobs processed by a bounded worker pool.
+
+    Submitting copies the video into `data_dir` and records the job in
+    SQLite, so queued work survives a restart: jobs found queued or running
+    at startup are put back on the queue. Progress of running jobs is held
+    in memory and written to the database at each stage change, as are the
+    narration cues finished so far.
+    """
+
+    def __init__(self, processor, db_path: str, data_dir: str, max_workers: int = 1):
+        self.processor = processor
+        self.db_path = db_path
+        self.data_dir = data_dir
+        self.max_workers = max_workers
+        os.makedirs(data_dir, exist_ok=True)
+
+        self._queue: "queue.Queue[Optional[str]]" = queue.Queue()
+        self._progress: Dict[str, Dict[str, Any]] = {}
+        self._cues: Dict[str, List[Dict[str, Any]]] = {}
+        self._db_lock = threading.Lock()
+        self._workers = []
+
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS jobs (
+                job_id TEXT PRIMARY KEY,
+                status TEXT NOT NULL,
+                stage TEXT NOT NULL,
+                video_path TEXT NOT NULL,
+                frames_decoded INTEGER NOT NULL DEFAULT 0,
+                frames_analyzed INTEGER NOT NULL DEFAULT 0,
+                result TEXT,
+                error TEXT,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, created_at);
+            """
+        )
+        self.conn.commit()
+
+    def start(self):
+        """Requeue unfinished jobs from a previous run and start the workers"""
+        with self._db_lock:
+            rows = self.conn.execute(
+                "SELECT job_id FROM jobs WHERE status IN ('queued', 'running') ORDER BY created_at"
+            ).fetchall()
+            self.conn.execute(
+                "UPDATE jobs SET status = 'queued', stage = 'queued' WHERE status = 'running'"
+            )
+            self.conn.commit()
+        for (job_id,) in rows:
+            self._queue.put(job_id)
+        if rows:
+            logger.info(f"Requeued {len(rows)} unfinished jobs")
+
+        for i in range(self.max_workers):
+            worker = threading.Thread(target=self._work, name=f"job-worker-{i}", daemon=True)
+            worker.start()
+            self._workers.append(worker)
+
+    def stop(self, timeout: Optional[float] = None):
+        """Let the workers finish their current job and exit"""
+        for _ in self._workers:
+            self._queue.put(None)
+        for worker in self._workers:
+            worker.join(timeout)
+        self._workers = []
+
+    def submit(self, video: BinaryIO, suffix: str = ".mp4") -> str:
+        """Store an uploaded video and queue it; returns the job id"""
+        job_id = uuid.uuid4().hex
+        video_path = os.path.join(self.data_dir, f"{job_id}{suffix}")
+        with open(video_path, "wb") as f:
+            shutil.copyfileobj(video, f)
+
+        now = time.time()
+        with self._db_lock:
+            self.conn.execute(
+                "INSERT INTO jobs (job_id, status, stage, video_path, created_at, updated_at) "
+                "VALUES (?, 'queued', 'queued', ?, ?, ?)",
+                (job_id, video_path, now, now),
+            )
+            self.conn.commit()
+        self._queue.put(job_id)
+        return job_id
+
+    def status(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Status and progress of a job, or None if it does not exist"""
+        with self._db_lock:
+            row = self.conn.execute(
+                "SELECT status, stage, frames_decoded, frames_analyzed, error, created_at, updated_at "
+                "FROM jobs WHERE job_id = ?",
+                (job_id,),
+            ).fetchone()
+        if row is None:
+            return None
+        status = {
+            "job_id": job_id,
+            "status": row[0],
+            "stage": row[1],
+            "frames_decoded": row[2],
+            "frames_analyzed": row[3],
+            "error": row[4],
+            "created_at": row[5],
+            "updated_at": row[6],
+        }
+        status.update(self._progress.get(job_id, {}))
+        if status["status"] == "queued":
+            status["queue_position"] = self._queue_position(job_id)
+        return status
+
+    def result(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """The audio description of a finished job, or None if it is not done"""
+        with self._db_lock:
+            row = self.conn.execute(
+                "SELECT result FROM jobs WHERE job_id = ? AND status = 'done'", (job_id,)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def partial_timeline(self, job_id: str) -> Optional[List[Dict[str, Any]]]:
+        """Cues finished so far by a running job, or None if it is not running"""
+        cues = self._cues.get(job_id)
+        return list(cues) if cues is not None else None
+
+    def _queue_position(self, job_id: str) -> Optional[int]:
+        with self._queue.mutex:
+            pending = list(self._queue.queue)
+        return pending.index(job_id) + 1 if job_id in pending else None
+
+    def _update(self, job_id: str, **fields):
+        fields["updated_at"] = time.time()
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        with self._db_lock:
+            self.conn.execute(
+                f"UPDATE jobs SET {assignments} WHERE job_id = ?", (*fields.values(), job_id)
+            )
+            self.conn.commit()
+
+    def _work(self):
+        while True:
+            job_id = self._queue.get()
+            if job_id is None:
+                return
+            try:
+                self._run(job_id)
+            finally:
+                self._queue.task_done()
+
+    def _run(self, job_id: str):
+        with self._db_lock:
+            row = self.conn.execute(
+                "SELECT video_path, status FROM jobs WHERE job_id = ?", (job_id,)
+            ).fetchone()
+        if row is None or row[1] != "queued":
+            return
+        video_path = row[0]
+
+        self._progress[job_id] = {"status": "running", "stage": "starting"}
+        self._cues[job_id] = []
+        self._update(job_id, status="running", stage="starting")
+
+        def on_progress(progress: Dict[str, Any]):
+            previous = self._progress.get(job_id, {})
+            self._progress[job_id] = {"status": "running", **progress}
+            if progress["stage"] != previous.get("stage"):
+                self._update(job_id, **progress)
+
+        try:
+            result = self.processor.process_video(
+                video_path, on_progress=on_progress, on_cue=self._cues[job_id].append
+            )
+            if result.get("status") == "error":
+                raise RuntimeError(result.get("message", "audio description failed"))
+            progress = self._progress.get(job_id, {})
+            self._update(
+                job_id,
+                status="done",
+                stage="done",
+                frames_decoded=progress.get("frames_decoded", 0),
+                frames_analyzed=progress.get("frames_analyzed", 0),
+                result=json.dumps(result, ensure_ascii=False, default=str),
+            )
+            logger.info(f"Job {job_id} finished")
+        except Exception as e:
+            logger.error(f"Job {job_id} failed: {str(e)}")
+            self._update(job_id, status="error", stage="error", error=str(e))
+        finally:
+            self._progress.pop(job_id, None)
+            self._cues.pop(job_id, None)
+            if os.path.exists(video_path):
+                os.unlink(video_path)
+
+
+def create_job_queue(processor) -> JobQueue:
+    """Build the job queue from the JOB_DB_PATH, JOB_DATA_DIR and JOB_WORKERS environment variables"""
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+    return JobQueue(
+        processor,
+        db_path=os.environ.get("JOB_DB_PATH", os.path.join(base_dir, "jobs.db")),
+        data_dir=os.environ.get("JOB_DATA_DIR", os.path.join(base_dir, "job_videos")),
+        max_workers=int(os.environ.get("JOB_WORKERS", 1)),
+    )
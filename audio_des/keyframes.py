@@ -0,0 +1,150 @@
+import logging
+from collections import Counter
+from typing import Any, Dict, Iterable, Iterator, Tuple
+
+import cv2
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+def color_histogram(frame: np.ndarray) -> np.ndarray:
+    """Normalized hue/saturation histogram of an RGB frame"""
+    hsv = cv2.cvtColor(frame, cv2.COLOR_RGB2HSV)
+    hist = cv2.calcHist([hsv], [0, 1], None, [16, 8], [0, 180, 0, 256])
+    return cv2.normalize(hist, hist).flatten()
+
+
+def histogram_distance(a: np.ndarray, b: np.ndarray) -> float:
+    """Bhattacharyya distance: 0 for identical color distributions, 1 for disjoint"""
+    return float(cv2.compareHist(a, b, cv2.HISTCMP_BHATTACHARYYA))
+
+
+def dhash(frame: np.ndarray, size: int = 8) -> int:
+    """64-bit difference hash of an RGB frame"""
+    gray = cv2.cvtColor(frame, cv2.COLOR_RGB2GRAY)
+    small = cv2.resize(gray, (size + 1, size), interpolation=cv2.INTER_AREA)
+    bits = (small[:, 1:] > small[:, :-1]).flatten()
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+def hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+def ssim(a: np.ndarray, b: np.ndarray, size: int = 64) -> float:
+    """Mean structural similarity of two RGB frames, computed on small grayscale copies"""
+    def prepare(frame):
+        gray = cv2.cvtColor(frame, cv2.COLOR_RGB2GRAY)
+        return cv2.resize(gray, (size, size), interpolation=cv2.INTER_AREA).astype(np.float64)
+
+    x, y = prepare(a), prepare(b)
+    c1, c2 = (0.01 * 255) ** 2, (0.03 * 255) ** 2
+    blur = lambda img: cv2.GaussianBlur(img, (7, 7), 1.5)
+    mu_x, mu_y = blur(x), blur(y)
+    sigma_x = blur(x * x) - mu_x ** 2
+    sigma_y = blur(y * y) - mu_y ** 2
+    sigma_xy = blur(x * y) - mu_x * mu_y
+    ssim_map = ((2 * mu_x * mu_y + c1) * (2 * sigma_xy + c2)) / (
+        (mu_x ** 2 + mu_y ** 2 + c1) * (sigma_x + sigma_y + c2)
+    )
+    return float(ssim_map.mean())
+
+
+class KeyframeFilter:
+    """
+    Drops near-duplicate frames before they are sent to the vision model.
+
+    Each frame is compared with the last kept frame. A large color histogram
+    distance is a scene change and is kept; a near-identical perceptual hash
+    and histogram is a duplicate and is dropped; anything in between is
+    decided by SSIM. A frame is always kept after `max_gap_seconds` without
+    one, so long static shots are still described periodically.
+
+    Histograms of kept frames are kept in `signatures` (by frame index) for
+    scene segmentation.
+    """
+
+    def __init__(
+        self,
+        scene_threshold: float = 0.35,
+        duplicate_hist_threshold: float = 0.1,
+        duplicate_hash_distance: int = 6,
+        ssim_threshold: float = 0.9,
+        max_gap_seconds: float = 10.0,
+    ):
+        self.scene_threshold = scene_threshold
+        self.duplicate_hist_threshold = duplicate_hist_threshold
+        self.duplicate_hash_distance = duplicate_hash_distance
+        self.ssim_threshold = ssim_threshold
+        self.max_gap_seconds = max_gap_seconds
+
+        self.signatures: Dict[int, np.ndarray] = {}
+        self.reasons = Counter()
+        self._last = None  # (timestamp, frame, histogram, hash) of the last kept frame
+        self._first_timestamp = None
+        self._last_timestamp = None
+
+    def check(self, timestamp: float, frame: np.ndarray) -> Tuple[bool, str]:
+        """Decide whether a frame is a keyframe; returns (keep, reason)"""
+        hist = color_histogram(frame)
+        frame_hash = dhash(frame)
+        keep, reason = self._compare(timestamp, frame, hist, frame_hash)
+        if keep:
+            self._last = (timestamp, frame, hist, frame_hash)
+        return keep, reason
+
+    def _compare(self, timestamp: float, frame: np.ndarray, hist: np.ndarray, frame_hash: int):
+        if self._last is None:
+            return True, "first"
+
+        last_timestamp, last_frame, last_hist, last_hash = self._last
+        if timestamp - last_timestamp >= self.max_gap_seconds:
+            return True, "max_gap"
+
+        distance = histogram_distance(hist, last_hist)
+        if distance >= self.scene_threshold:
+            return True, "scene_change"
+        if (
+            distance < self.duplicate_hist_threshold
+            and hamming(frame_hash, last_hash) <= self.duplicate_hash_distance
+        ):
+            return False, "duplicate"
+        if ssim(frame, last_frame) >= self.ssim_threshold:
+            return False, "similar"
+        return True, "content_change"
+
+    def filter(self, frames: Iterable[Tuple[int, float, Any]]) -> Iterator[Tuple[int, float, Any]]:
+        """Yield only the keyframes of a (frame_index, timestamp, frame) stream"""
+        for frame_index, timestamp, frame in frames:
+            if self._first_timestamp is None:
+                self._first_timestamp = timestamp
+            self._last_timestamp = timestamp
+
+            keep, reason = self.check(timestamp, frame)
+            self.reasons[reason] += 1
+            if keep:
+                self.signatures[frame_index] = self._last[2]
+                yield frame_index, timestamp, frame
+
+        logger.info(f"Keyframe selection: {self.stats()}")
+
+    def stats(self) -> Dict[str, Any]:
+        """Kept/dropped counts and the resulting vision requests per minute of video"""
+        total = sum(self.reasons.values())
+        dropped = self.reasons["duplicate"] + self.reasons["similar"]
+        kept = total - dropped
+        duration = (
+            self._last_timestamp - self._first_timestamp
+            if self._first_timestamp is not None
+            else 0.0
+        )
+        minutes = duration / 60 if duration > 0 else None
+        return {
+            "frames_sampled": total,
+            "frames_kept": kept,
+            "frames_dropped": dropped,
+            "reasons": dict(self.reasons),
+            "requests_per_minute_before": total / minutes if minutes else None,
+            "requests_per_minute_after": kept / minutes if minutes else None,
+        }
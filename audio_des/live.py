@@ -0,0 +1,334 @@
+"""
+Near-real-time audio description over a video stream.
+
+Reads a file that may still be growing, a named pipe or a stream URL
+(rtsp://, udp://, ...), keeps keyframes, and every `window_seconds` of video
+describes the window's keyframes and emits one narration chunk.
+
+Replay a local file at real-time speed to try it:
+
+    python live.py sample_video.mp4 --realtime
+"""
+
+import argparse
+import asyncio
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Optional
+
+import cv2
+import openai
+
+try:
+    from .keyframes import KeyframeFilter
+    from .rate_limit import TokenBucket
+    from .scenes import iter_scenes
+except ImportError:  # running from inside audio_des/
+    from keyframes import KeyframeFilter
+    from rate_limit import TokenBucket
+    from scenes import iter_scenes
+
+logger = logging.getLogger(__name__)
+
+
+class LiveDescriber:
+    """
+    Sliding-window audio description for live sources.
+
+    A reader thread samples one frame every `sample_interval` seconds of
+    video (other frames are grabbed but not decoded), drops near-duplicates
+    with KeyframeFilter and groups the rest into windows. The caller's thread
+    describes each window and emits a chunk. At most `max_pending_windows`
+    windows wait for analysis; when analysis falls behind the oldest are
+    dropped, so narration lag and memory stay bounded instead of growing
+    with the stream. One token bucket and one request pool serve every
+    window of a run, so the request rate (and any backoff after a 429)
+    carries over from window to window.
+    """
+
+    def __init__(
+        self,
+        processor,
+        window_seconds: float = 6.0,
+        sample_interval: float = 1.0,
+        max_pending_windows: int = 2,
+        realtime: bool = False,
+        follow: bool = False,
+        idle_timeout: float = 10.0,
+        narrate: bool = True,
+    ):
+        """
+        Args:
+            processor: AudioDescriptionProcessor used for frame analysis
+            window_seconds: Video time covered by each narration chunk
+            sample_interval: Seconds of video between sampled frames
+            max_pending_windows: Windows that may wait for analysis before
+                the oldest is dropped
+            realtime: Pace reading at the video's own speed (for replaying files)
+            follow: Keep reading a local file as it grows, like `tail -f`.
+                The container must be streamable (MPEG-TS, MKV), not MP4.
+            idle_timeout: With `follow`, stop after this long without new frames
+            narrate: Condense each window into one line with the text model;
+                otherwise the scene descriptions are used as is
+        """
+        self.processor = processor
+        self.window_seconds = window_seconds
+        self.sample_interval = sample_interval
+        self.max_pending_windows = max_pending_windows
+        self.realtime = realtime
+        self.follow = follow
+        self.idle_timeout = idle_timeout
+        self.narrate = narrate
+
+        self.dropped_windows = 0
+        self._stop = threading.Event()
+        self._bucket = None
+        self._pool = None
+
+    def stop(self):
+        self._stop.set()
+
+    # ----- reading -----
+
+    def _open(self, source: str, position_ms: float = 0.0):
+        cap = cv2.VideoCapture(source)
+        if position_ms > 0:
+            cap.set(cv2.CAP_PROP_POS_MSEC, position_ms)
+        return cap
+
+    def read_frames(self, source: str) -> Iterator[tuple]:
+        """
+        Yield sampled (frame_index, timestamp_seconds, RGB frame) tuples from a source
+        """
+        cap = self._open(source)
+        if not cap.isOpened():
+            raise ValueError(f"Could not open video source: {source}")
+
+        fps = cap.get(cv2.CAP_PROP_FPS) or 0
+        started = time.monotonic()
+        frame_index = 0
+        next_sample = 0.0
+        position_ms = 0.0
+        idle_since = None
+        try:
+            while not self._stop.is_set():
+                if not cap.grab():
+                    if not self.follow:
+                        break
+                    # End of what has been written so far: wait and reopen there
+                    idle_since = idle_since or time.monotonic()
+                    if time.monotonic() - idle_since > self.idle_timeout:
+                        break
+                    time.sleep(0.5)
+                    cap.release()
+                    cap = self._open(source, position_ms)
+                    continue
+                idle_since = None
+
+                timestamp = cap.get(cv2.CAP_PROP_POS_MSEC) / 1000.0
+                if timestamp <= 0 and frame_index > 0:
+                    timestamp = frame_index / fps if fps > 0 else time.monotonic() - started
+                position_ms = timestamp * 1000
+                frame_index += 1
+
+                if timestamp < next_sample:
+                    continue
+                next_sample = timestamp + self.sample_interval
+
+                if self.realtime:
+                    delay = started + timestamp - time.monotonic()
+                    if delay > 0:
+                        time.sleep(delay)
+
+                ok, frame = cap.retrieve()
+                if ok:
+                    yield frame_index - 1, timestamp, self.processor._prepare_frame(
+                        frame, self.processor.frame_max_dim
+                    )
+        finally:
+            cap.release()
+
+    def _read_windows(self, source: str, pending: deque, ready: threading.Condition, finished: threading.Event):
+        """Reader thread: group keyframes into windows and hand them over"""
+        keyframes = KeyframeFilter(max_gap_seconds=self.window_seconds)
+        window: List[tuple] = []
+        window_start = None
+        timestamp = None
+
+        def hand_over(frames, start, end):
+            with ready:
+                if len(pending) == pending.maxlen:
+                    self.dropped_windows += 1
+                    logger.warning("Analysis is behind the stream; dropping the oldest window")
+                pending.append({"frames": frames, "start": start, "end": end, "closed_at": time.monotonic()})
+                ready.notify()
+
+        try:
+            for frame_number, timestamp, frame in self.read_frames(source):
+                if window_start is None:
+                    window_start = timestamp
+                if timestamp - window_start >= self.window_seconds:
+                    if window:
+                        hand_over(window, window_start, timestamp)
+                    window, window_start = [], timestamp
+
+                keep, _ = keyframes.check(timestamp, frame)
+                if keep:
+                    window.append((frame_number, timestamp, frame))
+            if window:
+                hand_over(window, window_start, timestamp + self.sample_interval)
+        except Exception as e:
+            logger.error(f"Error reading live source: {str(e)}")
+        finally:
+            with ready:
+                finished.set()
+                ready.notify()
+
+    # ----- narration -----
+
+    def _describe_window(self, window: Dict[str, Any], previous_text: str) -> Dict[str, Any]:
+        descriptions = self.processor.analyze_frames(
+            iter(window["frames"]), bucket=self._bucket, pool=self._pool
+        )
+        scenes = list(iter_scenes(descriptions))
+        text = " ".join(scene["description"] for scene in scenes)
+        if self.narrate and descriptions:
+            text = self._narrate(descriptions, previous_text) or text
+        return {
+            "start": window["start"],
+            "end": window["end"],
+            "text": text,
+            "scenes": scenes,
+        }
+
+    def _narrate(self, descriptions: List[Dict[str, Any]], previous_text: str) -> Optional[str]:
+        """One or two sentences of live narration for a window"""
+        descriptions_text = "\n".join(
+            f"{desc['timestamp']:.1f}s: {desc['description']}" for desc in descriptions
+        )
+        try:
+            response = openai.ChatCompletion.create(
+                model=self.processor.text_model,
+                messages=[
+                    {
+                        "role": "system",
+                        "content": (
+                            "You are a live audio describer for blind and low-vision fans in a football stadium. "
+                            "Turn the latest frame descriptions into one or two short sentences of narration "
+                            "that continue naturally from the previous line. Describe only what is new."
+                        )
+                    },
+                    {
+                        "role": "user",
+                        "content": f"Previous line: {previous_text or '(start of match)'}\n\nLatest frames:\n{descriptions_text}"
+                    }
+                ],
+                max_tokens=80,
+                request_timeout=self.processor.request_timeout,
+            )
+            return response.choices[0].message.content.strip()
+        except Exception as e:
+            logger.error(f"Error narrating live window: {str(e)}")
+            return None
+
+    def run(self, source: str, on_chunk: Callable[[Dict[str, Any]], None]):
+        """
+        Describe a source until it ends or stop() is called, calling
+        `on_chunk` with each narration chunk: start/end in video seconds,
+        text, scenes and `lag`, the seconds between the window closing and
+        its narration being ready.
+        """
+        self._stop.clear()
+        pending: deque = deque(maxlen=self.max_pending_windows)
+        ready = threading.Condition()
+        finished = threading.Event()
+        reader = threading.Thread(
+            target=self._read_windows,
+            args=(source, pending, ready, finished),
+            name="live-reader",
+            daemon=True,
+        )
+        reader.start()
+
+        self._bucket = TokenBucket(self.processor.requests_per_second)
+        self._pool = ThreadPoolExecutor(
+            max_workers=self.processor.max_workers, thread_name_prefix="live-vision"
+        )
+        previous_text = ""
+        try:
+            while True:
+                with ready:
+                    while not pending and not finished.is_set():
+                        ready.wait()
+                    if not pending:
+                        break
+                    window = pending.popleft()
+                chunk = self._describe_window(window, previous_text)
+                chunk["lag"] = time.monotonic() - window["closed_at"]
+                previous_text = chunk["text"]
+                on_chunk(chunk)
+        finally:
+            self.stop()
+            reader.join()
+            self._pool.shutdown()
+            self._bucket, self._pool = None, None
+
+    async def stream(self, source: str) -> AsyncIterator[Dict[str, Any]]:
+        """Async iterator over narration chunks; runs the pipeline in a worker thread"""
+        loop = asyncio.get_running_loop()
+        chunks: asyncio.Queue = asyncio.Queue()
+        done = object()
+
+        def worker():
+            try:
+                self.run(source, lambda chunk: loop.call_soon_threadsafe(chunks.put_nowait, chunk))
+            finally:
+                loop.call_soon_threadsafe(chunks.put_nowait, done)
+
+        task = loop.run_in_executor(None, worker)
+        try:
+            while True:
+                chunk = await chunks.get()
+                if chunk is done:
+                    break
+                yield chunk
+        finally:
+            self.stop()
+            await task
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("source", help="video file, named pipe or stream URL")
+    parser.add_argument("--window", type=float, default=6.0, help="seconds of video per narration chunk")
+    parser.add_argument("--realtime", action="store_true", help="replay a file at real-time speed")
+    parser.add_argument("--follow", action="store_true", help="keep reading a growing file")
+    parser.add_argument("--no-narrate", action="store_true", help="emit scene descriptions without the text model")
+    args = parser.parse_args()
+
+    from processor import AudioDescriptionProcessor
+
+    live = LiveDescriber(
+        AudioDescriptionProcessor(),
+        window_seconds=args.window,
+        realtime=args.realtime,
+        follow=args.follow,
+        narrate=not args.no_narrate,
+    )
+
+    def print_chunk(chunk):
+        print(f"[{chunk['start']:7.1f}s - {chunk['end']:7.1f}s] (lag {chunk['lag']:.1f}s) {chunk['text']}")
+
+    try:
+        live.run(args.source, print_chunk)
+    except KeyboardInterrupt:
+        live.stop()
+    if live.dropped_windows:
+        print(f"Dropped {live.dropped_windows} windows to keep up with the stream")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,17 +1,38 @@
 import os
 import tempfile
 import traceback
-from typing import Dict, Any
+from bisect import bisect_right
+from collections import Counter, deque
+from contextlib import nullcontext
+from typing import Any, Callable, Dict, Iterator, Optional
 import cv2
 import numpy as np
 import logging
 import json
 import base64
+import math
+import random
 import requests
+import shutil
+import threading
 import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 import openai
 from dotenv import load_dotenv
 
+try:
+    from .cache import create_result_cache, file_sha256, frame_key
+    from .keyframes import KeyframeFilter
+    from .rate_limit import TokenBucket, retry_after_seconds
+    from .scenes import iter_scenes, segment_scenes
+    from .timeline import build_timeline, iter_cues
+except ImportError:  # running from inside audio_des/
+    from cache import create_result_cache, file_sha256, frame_key
+    from keyframes import KeyframeFilter
+    from rate_limit import TokenBucket, retry_after_seconds
+    from scenes import iter_scenes, segment_scenes
+    from timeline import build_timeline, iter_cues
+
 # Load environment variables
 load_dotenv()
 
@@ -28,60 +49,142 @@ class AudioDescriptionProcessor:
         openai.api_key = self.api_key
         self.vision_model = "gpt-4.1-mini"  # OpenAI's vision model   (gpt-4-vision-preview)
         self.text_model = "gpt-4.1-mini"  # OpenAI's text model for narrative generation
+
+        # Concurrency and pacing for frame analysis
+        self.max_workers = int(os.environ.get("VISION_WORKERS", 4))
+        self.requests_per_second = float(os.environ.get("VISION_RPS", 2))
+        self.max_retries = int(os.environ.get("VISION_MAX_RETRIES", 3))
+        self.request_timeout = float(os.environ.get("VISION_TIMEOUT", 60))
+        # Frames per vision request, sent as separate images ("frames") or
+        # tiled into one numbered image ("contact_sheet")
+        self.batch_size = int(os.environ.get("VISION_BATCH_SIZE", 1))
+        self.batch_layout = os.environ.get("VISION_BATCH_LAYOUT", "frames")
+        self.batch_max_dim = int(os.environ.get("VISION_BATCH_MAX_DIM", 512))
+        # Content-addressed cache of video and frame descriptions (None if disabled)
+        self.cache = create_result_cache()
+        # Requests and tokens used by vision calls
+        self.usage = Counter()
+        self._usage_lock = threading.Lock()
+
+        # Frame extraction
+        self.frame_max_dim = int(os.environ.get("FRAME_MAX_DIM", 768))
+        self.seek_threshold_seconds = 5
+        # Uploads that are not already on disk are spooled in chunks of this size
+        self.upload_chunk_size = 1024 * 1024
+        # Drop near-duplicate frames locally before paying for vision requests
+        self.keyframe_filter = os.environ.get("KEYFRAME_FILTER", "1") == "1"
+        # "local" (histogram/text similarity) or "llm" (extra model call)
+        self.scene_segmentation = os.environ.get("SCENE_SEGMENTATION", "local")
         
         logger.info("OpenAI client initialized")
 
-    def extract_frames(self, video_path: str, sample_rate: int = 24) -> list:
+    def extract_frames(
+        self,
+        video_path: str,
+        sample_rate: int = None,
+        max_dim: int = None,
+    ):
         """
-        Extract frames from video at specified sampling rate
-        
+        Lazily extract frames from video at specified sampling rate
+
+        Skipped frames are only grabbed, never decoded into images, and long
+        gaps are skipped with a seek. Frames are downscaled so their longest
+        side is at most `max_dim`, which is all the vision model needs.
+
         Args:
             video_path: Path to the video file
-            sample_rate: Extract every Nth frame
-            
-        Returns:
-            List of extracted frames as numpy arrays
+            sample_rate: Extract every Nth frame (default: based on video length)
+            max_dim: Longest side of yielded frames in pixels (default FRAME_MAX_DIM)
+
+        Yields:
+            (frame_index, timestamp_seconds, frame) with frame as an RGB numpy array
         """
+        max_dim = max_dim or self.frame_max_dim
+        cap = cv2.VideoCapture(video_path)
+        if not cap.isOpened():
+            raise ValueError(f"Could not open video: {video_path}")
+
         try:
-            frames = []
-            cap = cv2.VideoCapture(video_path)
             fps = cap.get(cv2.CAP_PROP_FPS)
             total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
             duration = total_frames / fps if fps > 0 else 0
-            
-            # Calculate appropriate sampling rate based on video length
-            # For longer videos, we want fewer samples
-            if duration > 60:  # If longer than 1 minute
-                # Sample one frame every 2 seconds
-                sample_rate = int(fps * 2)
-            elif duration > 30:  # If longer than 30 seconds
-                # Sample one frame every second
-                sample_rate = int(fps)
-            else:
-                # For short videos, sample every half second
-                sample_rate = max(1, int(fps / 2))
-            
-            frame_count = 0
-            
-            while cap.isOpened():
-                ret, frame = cap.read()
-                if not ret:
+
+            if not sample_rate:
+                # Calculate appropriate sampling rate based on video length
+                # For longer videos, we want fewer samples
+                if duration > 60:  # If longer than 1 minute
+                    # Sample one frame every 2 seconds
+                    sample_rate = int(fps * 2)
+                elif duration > 30:  # If longer than 30 seconds
+                    # Sample one frame every second
+                    sample_rate = int(fps)
+                else:
+                    # For short videos, sample every half second
+                    sample_rate = int(fps / 2)
+            sample_rate = max(1, sample_rate)
+            seek_threshold = max(1, int(fps * self.seek_threshold_seconds))
+
+            logger.info(
+                f"Extracting every {sample_rate}th frame from video with {fps} fps, "
+                f"duration: {duration:.2f}s"
+            )
+
+            position = 0  # index of the next frame the decoder will return
+            frame_index = 0
+            extracted = 0
+            while True:
+                if frame_index - position > seek_threshold:
+                    cap.set(cv2.CAP_PROP_POS_FRAMES, frame_index)
+                    position = frame_index
+                while position < frame_index:
+                    if not cap.grab():
+                        return
+                    position += 1
+
+                if not cap.grab():
                     break
-                
-                if frame_count % sample_rate == 0:
-                    # Convert BGR to RGB
-                    frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-                    frames.append(frame_rgb)
-                
-                frame_count += 1
-            
-            cap.release()
-            logger.info(f"Extracted {len(frames)} frames from video with {fps} fps, duration: {duration:.2f}s")
-            return frames
+                ok, frame = cap.retrieve()
+                position += 1
+                if not ok:
+                    break
+
+                timestamp = cap.get(cv2.CAP_PROP_POS_MSEC) / 1000.0
+                if timestamp <= 0 and frame_index > 0 and fps > 0:
+                    timestamp = frame_index / fps
+
+                yield frame_index, timestamp, self._prepare_frame(frame, max_dim)
+                extracted += 1
+                frame_index += sample_rate
+
+            logger.info(f"Extracted {extracted} frames")
         except Exception as e:
             logger.error(f"Error extracting frames: {str(e)}")
             raise
-    
+        finally:
+            cap.release()
+
+    def probe_duration(self, video_path: str) -> Optional[float]:
+        """Video length in seconds from the container metadata, without decoding"""
+        cap = cv2.VideoCapture(video_path)
+        try:
+            fps = cap.get(cv2.CAP_PROP_FPS)
+            total_frames = cap.get(cv2.CAP_PROP_FRAME_COUNT)
+            return total_frames / fps if fps > 0 and total_frames > 0 else None
+        finally:
+            cap.release()
+
+    def _fit(self, frame, max_dim: int):
+        """Downscale a frame to fit within max_dim"""
+        height, width = frame.shape[:2]
+        scale = max_dim / max(height, width)
+        if scale >= 1:
+            return frame
+        return cv2.resize(frame, (int(width * scale), int(height * scale)), interpolation=cv2.INTER_AREA)
+
+    def _prepare_frame(self, frame, max_dim: int):
+        """Downscale a decoded BGR frame and convert it to RGB"""
+        return cv2.cvtColor(self._fit(frame, max_dim), cv2.COLOR_BGR2RGB)
+
     def _encode_image_to_base64(self, image_array):
         """Convert a numpy array image to base64 encoded string"""
         success, encoded_image = cv2.imencode('.jpg', cv2.cvtColor(image_array, cv2.COLOR_RGB2BGR))
@@ -89,75 +192,363 @@ class AudioDescriptionProcessor:
             return None
         return base64.b64encode(encoded_image.tobytes()).decode('utf-8')
     
-    def analyze_frames(self, frames: list) -> list:
+    def _record_usage(self, response):
+        usage = getattr(response, "usage", None)
+        with self._usage_lock:
+            self.usage["requests"] += 1
+            if usage:
+                self.usage["prompt_tokens"] += usage.get("prompt_tokens", 0)
+                self.usage["completion_tokens"] += usage.get("completion_tokens", 0)
+
+    def _describe_frame(self, base64_image: str) -> str:
+        """Send one frame to OpenAI's vision model and return its description"""
+        response = openai.ChatCompletion.create(
+            model=self.vision_model,
+            messages=[
+                {
+                    "role": "system",
+                    "content": (
+                        "You are a sports video analysis expert. Analyze the image with a focus on identifying key details relevant to football or sports action. "
+                        "Describe the scene in 1–2 sentences, including the players' positions, movements, ball location, play type (e.g., pass, tackle, goal attempt), "
+                        "and any notable context such as crowd reaction, referee involvement, or score indicators. Be precise, action-focused, and avoid generic descriptions."
+                    )
+                },
+                {
+                    "role": "user",
+                    "content": [
+                        {"type": "text", "text": "What is happening in this frame? Describe the key football/sport action clearly."},
+                        {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{base64_image}"}}
+                    ]
+                }
+            ],
+            request_timeout=self.request_timeout,
+        )
+        self._record_usage(response)
+        return response.choices[0].message.content
+
+    def _build_contact_sheet(self, frames: list):
+        """Tile RGB frames into one numbered grid image, left to right and top to bottom"""
+        cols = math.ceil(math.sqrt(len(frames)))
+        rows = math.ceil(len(frames) / cols)
+        cells = [self._fit(frame, self.batch_max_dim) for frame in frames]
+        cell_h = max(cell.shape[0] for cell in cells)
+        cell_w = max(cell.shape[1] for cell in cells)
+
+        sheet = np.zeros((rows * cell_h, cols * cell_w, 3), dtype=np.uint8)
+        for i, cell in enumerate(cells):
+            y, x = (i // cols) * cell_h, (i % cols) * cell_w
+            sheet[y:y + cell.shape[0], x:x + cell.shape[1]] = cell
+            cv2.rectangle(sheet, (x, y), (x + 44, y + 36), (0, 0, 0), -1)
+            cv2.putText(sheet, str(i + 1), (x + 6, y + 28), cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 255, 0), 2)
+        return sheet
+
+    def _batch_content(self, batch: list) -> list:
+        """
+        User message content for a batch of (frame_index, timestamp, frame) tuples
+
+        Frames are sent either as separate labelled images or as a single
+        numbered contact sheet, depending on `batch_layout`.
+        """
+        listing = "\n".join(
+            f"{i + 1}. frame_number {frame_number} at {timestamp:.2f}s"
+            for i, (frame_number, timestamp, _) in enumerate(batch)
+        )
+        if self.batch_layout == "contact_sheet":
+            intro = (
+                f"The image is a contact sheet of {len(batch)} consecutive frames, numbered in the "
+                f"top-left corner of each tile, left to right and top to bottom:\n{listing}"
+            )
+            images = [self._build_contact_sheet([frame for _, _, frame in batch])]
+        else:
+            intro = f"The following {len(batch)} images are consecutive frames, in this order:\n{listing}"
+            images = [self._fit(frame, self.batch_max_dim) for _, _, frame in batch]
+
+        content = [{"type": "text", "text": intro}]
+        for image in images:
+            base64_image = self._encode_image_to_base64(image)
+            if not base64_image:
+                raise ValueError("failed to encode batch image")
+            content.append({"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{base64_image}"}})
+        content.append({
+            "type": "text",
+            "text": (
+                "Describe the key football/sport action in each frame. Respond with JSON only: "
+                '{"frames": [{"frame_number": int, "description": string}, ...]} with one entry per frame.'
+            ),
+        })
+        return content
+
+    def _describe_batch(self, content: list) -> Dict[int, str]:
+        """Send several frames in one vision request; returns descriptions by frame number"""
+        response = openai.ChatCompletion.create(
+            model=self.vision_model,
+            messages=[
+                {
+                    "role": "system",
+                    "content": (
+                        "You are a sports video analysis expert. Analyze each video frame with a focus on identifying key details relevant to football or sports action. "
+                        "Describe each frame in 1–2 sentences, including the players' positions, movements, ball location, play type (e.g., pass, tackle, goal attempt), "
+                        "and any notable context such as crowd reaction, referee involvement, or score indicators. Be precise, action-focused, and avoid generic descriptions. "
+                        "Describe every frame on its own, even when it is similar to the previous one."
+                    )
+                },
+                {"role": "user", "content": content}
+            ],
+            response_format={"type": "json_object"},
+            request_timeout=self.request_timeout,
+        )
+        self._record_usage(response)
+        data = json.loads(response.choices[0].message.content)
+        return {
+            int(item["frame_number"]): item["description"]
+            for item in data.get("frames", [])
+            if isinstance(item, dict) and "frame_number" in item and item.get("description")
+        }
+
+    def _call_with_retries(self, label: str, call, bucket: TokenBucket):
+        """
+        Run one vision request, retrying rate limits and transient API errors
+
+        Returns:
+            The request's result, or None if it kept failing
+        """
+        for attempt in range(self.max_retries + 1):
+            bucket.acquire()
+            try:
+                result = call()
+                bucket.reward()
+                return result
+            except openai.error.RateLimitError as e:
+                retry_after = retry_after_seconds(e)
+                logger.warning(f"Rate limited on {label}, retry after {retry_after}s")
+                bucket.penalize(retry_after)
+            except (
+                openai.error.APIError,
+                openai.error.APIConnectionError,
+                openai.error.ServiceUnavailableError,
+                openai.error.Timeout,
+            ) as e:
+                backoff = 0.5 * 2 ** attempt + random.uniform(0, 0.5)
+                logger.warning(f"Transient error on {label}: {e}; retrying in {backoff:.1f}s")
+                time.sleep(backoff)
+
+        logger.error(f"Giving up on {label} after {self.max_retries + 1} attempts")
+        return None
+
+    def _describe_frame_with_retries(self, index: int, frame, bucket: TokenBucket):
+        """
+        Describe one frame, retrying rate limits and transient API errors
+
+        Returns:
+            The description, or None if the frame could not be analyzed
+        """
+        base64_image = self._encode_image_to_base64(frame)
+        if not base64_image:
+            logger.warning(f"Failed to encode frame {index}")
+            return None
+        try:
+            return self._call_with_retries(f"frame {index}", lambda: self._describe_frame(base64_image), bucket)
+        except openai.error.InvalidRequestError as e:
+            # Retrying an identical rejected request cannot succeed
+            logger.error(f"Request rejected for frame {index}: {e}")
+            return None
+
+    def _describe_frames(self, batch: list, bucket: TokenBucket) -> Dict[int, str]:
+        """
+        Describe a batch of (frame_index, timestamp, frame) tuples
+
+        Batches of more than one frame go out as a single request; frames the
+        model skipped, or every frame if its reply could not be parsed or the
+        API rejected the batch request (too many images, unsupported
+        response_format, ...), are then described one by one.
+
+        Returns:
+            Descriptions by frame number; frames that failed are left out
+        """
+        descriptions = {}
+        if len(batch) > 1:
+            label = f"frames {batch[0][0]}-{batch[-1][0]}"
+            try:
+                content = self._batch_content(batch)
+                descriptions = self._call_with_retries(label, lambda: self._describe_batch(content), bucket) or {}
+            except (ValueError, KeyError, TypeError) as e:
+                logger.warning(f"Could not parse batch response for {label}: {e}")
+            except openai.error.InvalidRequestError as e:
+                logger.warning(f"Batch request rejected for {label}, describing frames one by one: {e}")
+
+        for frame_number, _, frame in batch:
+            if frame_number not in descriptions:
+                description = self._describe_frame_with_retries(frame_number, frame, bucket)
+                if description is not None:
+                    descriptions[frame_number] = description
+        return descriptions
+
+    @staticmethod
+    def _batched(frames, batch_size: int):
+        batch = []
+        for item in frames:
+            batch.append(item)
+            if len(batch) == batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def analyze_frames(
+        self,
+        frames,
+        max_workers: int = None,
+        requests_per_second: float = None,
+        batch_size: int = None,
+        on_progress: Optional[Callable[[int], None]] = None,
+        bucket: Optional[TokenBucket] = None,
+        pool: Optional[ThreadPoolExecutor] = None,
+    ) -> list:
         """
         Generate descriptions for the extracted frames using OpenAI's vision model
-        
+
+        Frames are analyzed concurrently by `max_workers` threads, paced by a
+        token bucket that backs off on 429 responses. Each request is retried
+        on rate limits and transient errors; frames that still fail are
+        skipped. `frames` is consumed lazily with a bounded number of requests
+        in flight, so analysis starts while the video is still being decoded.
+
+        When the result cache is enabled, frames whose perceptual hash was
+        described before reuse the stored description without a request.
+
+        With `batch_size` > 1, consecutive frames are grouped and described
+        in a single request (as separate images or a contact sheet, see
+        VISION_BATCH_LAYOUT), and the per-frame answers are mapped back to
+        their frame numbers and timestamps.
+
         Args:
-            frames: List of video frames
-            
+            frames: Iterable of (frame_index, timestamp_seconds, frame) tuples,
+                as yielded by extract_frames
+            max_workers: Concurrent vision requests (default VISION_WORKERS)
+            requests_per_second: Initial request rate (default VISION_RPS)
+            batch_size: Frames per request (default VISION_BATCH_SIZE)
+            on_progress: Called with the number of frames analyzed so far
+            bucket: Token bucket to pace requests with, for callers that
+                analyze many small groups of frames and want one rate across
+                them (default: a new bucket at `requests_per_second`)
+            pool: Executor to run requests on, owned by the caller
+                (default: a new pool of `max_workers` threads)
+
         Returns:
-            List of descriptions for each analyzed frame
+            List of descriptions for each analyzed frame, ordered by frame index
         """
-        frame_descriptions = []
-        
+        results = list(self.iter_frame_descriptions(
+            frames, max_workers, requests_per_second, batch_size, on_progress, bucket, pool
+        ))
+        results.sort(key=lambda desc: desc["frame_number"])
+        return results
+
+    def iter_frame_descriptions(
+        self,
+        frames,
+        max_workers: int = None,
+        requests_per_second: float = None,
+        batch_size: int = None,
+        on_progress: Optional[Callable[[int], None]] = None,
+        bucket: Optional[TokenBucket] = None,
+        pool: Optional[ThreadPoolExecutor] = None,
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        analyze_frames as a generator: yields each frame's description in
+        input order as soon as it and every frame before it are done, while
+        later frames are still being analyzed. Frames that fail are skipped.
+        """
+        max_workers = max_workers or self.max_workers
+        batch_size = max(1, batch_size or self.batch_size)
+        if bucket is None:
+            bucket = TokenBucket(requests_per_second or self.requests_per_second)
+        pending = {}
+        cache_keys = {}
+        order = deque()  # frame numbers in input order, not yet yielded
+        finished = {}  # frame number -> description, or None when it failed
+        analyzed = 0
+
+        def record(frame_number, timestamp, description):
+            nonlocal analyzed
+            analyzed += 1
+            finished[frame_number] = {
+                "frame_number": frame_number,
+                "timestamp": timestamp,
+                "description": description
+            }
+            if analyzed % 10 == 0:
+                logger.info(f"Analyzed {analyzed} frames")
+            if on_progress is not None:
+                on_progress(analyzed)
+
+        def ready():
+            while order and order[0] in finished:
+                desc = finished.pop(order.popleft())
+                if desc is not None:
+                    yield desc
+
+        def uncached(frames):
+            # Frames seen before (by perceptual hash) reuse their stored description
+            for frame_number, timestamp, frame in frames:
+                order.append(frame_number)
+                if self.cache is not None:
+                    key = f"{self.vision_model}:{frame_key(frame)}"
+                    description = self.cache.get_frame(key)
+                    if description is not None:
+                        record(frame_number, timestamp, description)
+                        continue
+                    cache_keys[frame_number] = key
+                yield frame_number, timestamp, frame
+
+        def collect(futures):
+            for future in futures:
+                batch = pending.pop(future)
+                descriptions = future.result()
+                for frame_number, timestamp in batch:
+                    key = cache_keys.pop(frame_number, None)
+                    if frame_number in descriptions:
+                        record(frame_number, timestamp, descriptions[frame_number])
+                        if key is not None:
+                            self.cache.put_frame(key, descriptions[frame_number])
+                    else:
+                        finished[frame_number] = None
+
+        if pool is None:
+            pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="vision")
+        else:
+            pool = nullcontext(pool)  # the caller's pool stays up for its next call
+
         try:
-            for i, frame in enumerate(frames):
-                if i % 10 == 0:
-                    logger.info(f"Processing frame {i+1}/{len(frames)}")
-                
-                # Encode image to base64
-                base64_image = self._encode_image_to_base64(frame)
-                
-                if not base64_image:
-                    logger.warning(f"Failed to encode frame {i}")
-                    continue
-                
-                # Use OpenAI's vision model to analyze the frame
-                response = openai.ChatCompletion.create(
-                    model=self.vision_model,
-                messages = [
-    {
-        "role": "system",
-        "content": (
-            "You are a sports video analysis expert. Analyze the image with a focus on identifying key details relevant to football or sports action. "
-            "Describe the scene in 1–2 sentences, including the players' positions, movements, ball location, play type (e.g., pass, tackle, goal attempt), "
-            "and any notable context such as crowd reaction, referee involvement, or score indicators. Be precise, action-focused, and avoid generic descriptions."
-        )
-    },
-    {
-        "role": "user",
-        "content": [
-            {"type": "text", "text": "What is happening in this frame? Describe the key football/sport action clearly."},
-            {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{base64_image}"}}
-        ]
-    }
-]
-                )
-                
-                description = response.choices[0].message.content
-                
-                frame_descriptions.append({
-                    "frame_number": i,
-                    "timestamp": i / len(frames),  # Normalized timestamp (0-1)
-                    "description": description
-                })
-                
-                # Rate limit to avoid hitting OpenAI's rate limits
-                if i < len(frames) - 1:
-                    time.sleep(0.5)
-            
-            return frame_descriptions
+            with pool as pool:
+                for batch in self._batched(uncached(frames), batch_size):
+                    if len(pending) >= max_workers * 2:
+                        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                        collect(done)
+                    future = pool.submit(self._describe_frames, batch, bucket)
+                    pending[future] = [(frame_number, timestamp) for frame_number, timestamp, _ in batch]
+                    yield from ready()
+                while pending:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    collect(done)
+                    yield from ready()
+                yield from ready()
         except Exception as e:
             logger.error(f"Error analyzing frames with OpenAI: {str(e)}")
             raise
-    
-    def generate_audio_description(self, frame_descriptions: list) -> Dict[str, Any]:
+
+    def generate_audio_description(
+        self,
+        frame_descriptions: list,
+        signatures: Optional[dict] = None,
+        scenes: Optional[list] = None,
+    ) -> Dict[str, Any]:
         """
         Generate consolidated audio description from frame analysis using GPT-4
         
         Args:
             frame_descriptions: List of frame descriptions
+            signatures: Optional color histograms of the frames, used for scene segmentation
+            scenes: Scenes already segmented while the frames were analyzed, if any
             
         Returns:
             Dictionary with audio description data
@@ -191,7 +582,8 @@ class AudioDescriptionProcessor:
             narrative = response.choices[0].message.content
             
             # Create timestamps for the narrative
-            scenes = self._segment_into_scenes(frame_descriptions)
+            if scenes is None:
+                scenes = self._segment_into_scenes(frame_descriptions, signatures)
             
             return {
                 "status": "success",
@@ -203,96 +595,84 @@ class AudioDescriptionProcessor:
             logger.error(f"Error generating audio description: {str(e)}")
             return {"status": "error", "message": str(e)}
     
-    def _segment_into_scenes(self, frame_descriptions: list) -> list:
+    def _segment_into_scenes(self, frame_descriptions: list, signatures: Optional[dict] = None) -> list:
         """
         Segment the frame descriptions into coherent scenes
-        
+
+        Boundaries come from the local visual/text segmentation unless
+        SCENE_SEGMENTATION=llm, in which case the LLM is asked first and the
+        local result is the fallback.
+
         Args:
             frame_descriptions: List of frame descriptions
-            
+            signatures: Optional color histograms of the frames, by frame number
+
         Returns:
             List of scene descriptions with timestamps
         """
-        # If we have too few descriptions, each is its own scene
-        if len(frame_descriptions) <= 3:
-            return [
-                {
-                    "start_time": desc["timestamp"],
-                    "end_time": desc["timestamp"],
-                    "description": desc["description"]
-                }
-                for desc in frame_descriptions
-            ]
-        
-        # Use OpenAI to identify scene boundaries
+        if self.scene_segmentation == "llm" and len(frame_descriptions) > 3:
+            try:
+                return self._segment_with_llm(frame_descriptions)
+            except Exception as e:
+                logger.error(f"Error segmenting scenes with the LLM, using local segmentation: {str(e)}")
+        return segment_scenes(frame_descriptions, signatures)
+
+    def _segment_with_llm(self, frame_descriptions: list) -> list:
+        """Ask the text model for scene boundaries, given as frame numbers"""
         descriptions_text = "\n".join([
             f"Frame {desc['frame_number']} ({desc['timestamp']:.2f}): {desc['description']}"
             for desc in frame_descriptions
         ])
-        
-        try:
-            response = openai.ChatCompletion.create(
-                model=self.text_model,
-              messages = [
-    {
-        "role": "system",
-        "content": (
-            "You are a professional video scene segmentation expert. Your task is to analyze a sequence of frame descriptions and detect major scene changes. "
-            "A 'scene' is defined as a continuous segment where the visual action, setting, or context remains consistent. "
-            "Identify the start and end frame numbers for each distinct scene. Each scene should represent a clear transition in time, location, or activity. "
-            "Be precise and avoid over-segmentation. Your output must be a well-structured JSON array, where each object includes: 'start_frame', 'end_frame', and a concise 'scene_description'."
+
+        response = openai.ChatCompletion.create(
+            model=self.text_model,
+            messages=[
+                {
+                    "role": "system",
+                    "content": (
+                        "You are a professional video scene segmentation expert. Your task is to analyze a sequence of frame descriptions and detect major scene changes. "
+                        "A 'scene' is defined as a continuous segment where the visual action, setting, or context remains consistent. "
+                        "Identify the start and end frame numbers for each distinct scene. Each scene should represent a clear transition in time, location, or activity. "
+                        "Be precise and avoid over-segmentation. Your output must be a well-structured JSON array, where each object includes: 'start_frame', 'end_frame', and a concise 'scene_description'."
+                    )
+                },
+                {
+                    "role": "user",
+                    "content": f"Analyze the following frame descriptions and return a list of distinct scenes:\n\n{descriptions_text}\n\nOutput a JSON array formatted as:\n[\n  {{\"start_frame\": int, \"end_frame\": int, \"scene_description\": string}},\n  ...\n]"
+                }
+            ]
         )
-    },
-    {
-        "role": "user",
-        "content": f"Analyze the following frame descriptions and return a list of distinct scenes:\n\n{descriptions_text}\n\nOutput a JSON array formatted as:\n[\n  {{\"start_frame\": int, \"end_frame\": int, \"scene_description\": string}},\n  ...\n]"
-    }
-]
-            )
-            
-            scene_data = json.loads(response.choices[0].message.content)
-            
-            # Process scene data
-            scenes = []
-            for scene in scene_data.get("scenes", []):
-                start_frame = max(0, min(scene.get("start_frame", 0), len(frame_descriptions) - 1))
-                end_frame = max(0, min(scene.get("end_frame", len(frame_descriptions) - 1), len(frame_descriptions) - 1))
-                
-                scenes.append({
-                    "start_time": frame_descriptions[start_frame]["timestamp"],
-                    "end_time": frame_descriptions[end_frame]["timestamp"],
-                    "description": scene.get("scene_description", "")
-                })
-            
-            return scenes
-            
-        except Exception as e:
-            logger.error(f"Error segmenting scenes: {str(e)}")
-            # Fallback: simple scene segmentation
-            scenes = []
-            current_scene = {
-                "start_time": frame_descriptions[0]["timestamp"],
-                "end_time": frame_descriptions[0]["timestamp"],
-                "description": frame_descriptions[0]["description"]
-            }
-            
-            for i in range(1, len(frame_descriptions)):
-                # Simple heuristic: if descriptions are very different, it might be a new scene
-                current_scene["end_time"] = frame_descriptions[i]["timestamp"]
-                
-                # Every third frame, start a new scene (simple fallback)
-                if i % 3 == 0:
-                    scenes.append(current_scene)
-                    current_scene = {
-                        "start_time": frame_descriptions[i]["timestamp"],
-                        "end_time": frame_descriptions[i]["timestamp"],
-                        "description": frame_descriptions[i]["description"]
-                    }
-            
-            # Add the last scene
-            scenes.append(current_scene)
-            return scenes
-    
+
+        content = response.choices[0].message.content.strip()
+        # Models often wrap JSON in a markdown code fence
+        content = content.removeprefix("```json").removeprefix("```").removesuffix("```").strip()
+        scene_data = json.loads(content)
+        if isinstance(scene_data, dict):
+            scene_data = scene_data.get("scenes", [])
+        if not scene_data:
+            raise ValueError("no scenes in LLM response")
+
+        # Scene bounds are frame numbers from the prompt; map each to the
+        # nearest analyzed frame at or before it
+        frame_numbers = [desc["frame_number"] for desc in frame_descriptions]
+
+        def timestamp_of(frame_number):
+            position = max(0, bisect_right(frame_numbers, int(frame_number)) - 1)
+            return frame_descriptions[position]["timestamp"]
+
+        scenes = []
+        for scene in scene_data:
+            start_frame = scene.get("start_frame", frame_numbers[0])
+            end_frame = scene.get("end_frame", frame_numbers[-1])
+            scenes.append({
+                "start_time": timestamp_of(start_frame),
+                "end_time": timestamp_of(end_frame),
+                "start_frame": start_frame,
+                "end_frame": end_frame,
+                "description": scene.get("scene_description", "")
+            })
+        return scenes
+
     def save_results(self, output_path: str, results: Dict[str, Any]) -> str:
         """
         Save the audio description results to a file
@@ -309,12 +689,112 @@ class AudioDescriptionProcessor:
         
         return output_path
     
+    def process_video(
+        self,
+        video_path: str,
+        on_progress: Optional[Callable[[Dict[str, Any]], None]] = None,
+        on_cue: Optional[Callable[[Dict[str, Any]], None]] = None,
+    ) -> Dict[str, Any]:
+        """
+        Run the full pipeline on a video file: extraction, frame analysis and narration
+
+        Frames are decoded lazily, filtered down to keyframes and analyzed as
+        they are produced. With local scene segmentation, scenes and their
+        timeline cues are built from the descriptions as they arrive, so each
+        cue is available as soon as the scene after it starts; with
+        SCENE_SEGMENTATION=llm the cues follow the full analysis. A video
+        whose content was processed before returns the cached result
+        immediately.
+
+        Args:
+            video_path: Path to the video file
+            on_progress: Called with progress updates (stage, frames_decoded,
+                frames_analyzed) as the video is processed
+            on_cue: Called with each narration cue as soon as it is final
+        """
+        progress = {"stage": "analyzing", "frames_decoded": 0, "frames_analyzed": 0}
+
+        def report(**update):
+            progress.update(update)
+            if on_progress is not None:
+                on_progress(dict(progress))
+
+        def counted(frames):
+            for item in frames:
+                report(frames_decoded=progress["frames_decoded"] + 1)
+                yield item
+
+        logger.info(f"Starting video processing: {video_path}")
+        video_key = None
+        if self.cache is not None:
+            video_key = f"{self.vision_model}:{self.text_model}:{file_sha256(video_path)}"
+            cached = self.cache.get_video(video_key)
+            if cached is not None:
+                logger.info("Returning cached audio description")
+                report(stage="cached")
+                cached["cached"] = True
+                return cached
+        report()
+        frames = counted(self.extract_frames(video_path))
+        keyframes = None
+        if self.keyframe_filter:
+            keyframes = KeyframeFilter()
+            frames = keyframes.filter(frames)
+        signatures = keyframes.signatures if keyframes is not None else None
+        # Container metadata only; known before analysis so the last cue can end on time
+        duration = self.probe_duration(video_path)
+        described = self.iter_frame_descriptions(
+            frames, on_progress=lambda analyzed: report(frames_analyzed=analyzed)
+        )
+
+        frame_descriptions, scenes, cues = [], None, []
+        if self.scene_segmentation == "llm":
+            frame_descriptions.extend(described)
+        else:
+            def kept(items, into):
+                # Pass items through while keeping them for the final result
+                for item in items:
+                    into.append(item)
+                    yield item
+
+            scenes = []
+            scene_stream = kept(iter_scenes(kept(described, frame_descriptions), signatures), scenes)
+            for cue in iter_cues(scene_stream, duration):
+                cues.append(cue)
+                if on_cue is not None:
+                    on_cue(cue)
+        logger.info(f"Frame analysis complete ({len(frame_descriptions)} frames). Generating audio description")
+        report(stage="narrating")
+        audio_description = self.generate_audio_description(
+            frame_descriptions, signatures=signatures, scenes=scenes
+        )
+        if keyframes is not None:
+            audio_description["frame_selection"] = keyframes.stats()
+        if audio_description.get("status") == "success":
+            # Narration cues with real start/end times, ready for WebVTT/SRT
+            audio_description["duration"] = duration
+            if scenes is None:
+                cues = build_timeline(audio_description["scenes"], duration)
+                if on_cue is not None:
+                    for cue in cues:
+                        on_cue(cue)
+            audio_description["timeline"] = cues
+        if video_key is not None and audio_description.get("status") == "success":
+            self.cache.put_video(video_key, audio_description)
+        logger.info("Audio description generation complete")
+        return audio_description
+
     def handle_flutter_upload(self, video_data: Dict[str, Any]) -> Dict[str, Any]:
         """
         Handle video upload from Flutter frontend
+
+        The video is read from disk in place when it is a path or a named
+        file; bytes and in-memory streams are spooled to a temporary file in
+        chunks, so memory use does not grow with the upload size.
         
         Args:
-            video_data: Dictionary containing video file information
+            video_data: Dictionary whose "file" is the video as bytes, a path
+                or a binary file object
             
         Returns:
             Dictionary with audio description results
@@ -325,42 +805,48 @@ class AudioDescriptionProcessor:
             if not video_file:
                 return {"status": "error", "message": "No video file provided"}
             
-            # Create a temporary file to process
-            with tempfile.NamedTemporaryFile(delete=False, suffix='.mp4') as temp_video:
-                temp_video_path = temp_video.name
-                # Write the video data to the temporary file
-                if isinstance(video_file, bytes):
-                    temp_video.write(video_file)
-                else:
-                    # Assuming video_file is a path or file-like object
-                    with open(video_file, 'rb') as f:
-                        temp_video.write(f.read())
-            
-            # Process the video
-            logger.info(f"Starting video processing: {temp_video_path}")
-            frames = self.extract_frames(temp_video_path)
-            logger.info(f"Frame extraction complete. Analyzing {len(frames)} frames")
-            frame_descriptions = self.analyze_frames(frames)
-            logger.info("Frame analysis complete. Generating audio description")
-            audio_description = self.generate_audio_description(frame_descriptions)
-            logger.info("Audio description generation complete")
-            
+            temp_video_path = None
+            if isinstance(video_file, (str, os.PathLike)):
+                # Already on disk: OpenCV reads it in place
+                video_path = video_file
+            elif isinstance(getattr(video_file, "name", None), str) and os.path.isfile(video_file.name):
+                # File object backed by a named file (e.g. a disk-spooled upload)
+                video_path = video_file.name
+            else:
+                # Bytes or an in-memory stream: spool to disk in chunks
+                with tempfile.NamedTemporaryFile(delete=False, suffix='.mp4') as temp_video:
+                    temp_video_path = temp_video.name
+                    if isinstance(video_file, (bytes, bytearray)):
+                        temp_video.write(video_file)
+                    else:
+                        shutil.copyfileobj(video_file, temp_video, self.upload_chunk_size)
+                video_path = temp_video_path
+
+            try:
+                # Process the video
+                audio_description = self.process_video(video_path)
+            finally:
+                # Clean up the temporary file
+                if temp_video_path:
+                    os.unlink(temp_video_path)
+
             # Create output directory if it doesn't exist
-            output_dir = os.path.join(os.path.dirname(temp_video_path), "output")
+            output_dir = os.path.join(tempfile.gettempdir(), "output")
             os.makedirs(output_dir, exist_ok=True)
             
             # Save results to file
-            output_path = os.path.join(output_dir, f"{os.path.basename(temp_video_path)}_description.json")
+            output_path = os.path.join(output_dir, f"{os.path.basename(video_path)}_description.json")
             self.save_results(output_path, audio_description)
             logger.info(f"Results saved to {output_path}")
             
-            # Clean up the temporary file
-            os.unlink(temp_video_path)
-            
             return {
                 "status": "success",
                 "description": audio_description["narrative"],
                 "scenes": audio_description.get("scenes", []),
+                "frame_selection": audio_description.get("frame_selection"),
+                "duration": audio_description.get("duration"),
+                "timeline": audio_description.get("timeline", []),
+                "cached": audio_description.get("cached", False),
                 "output_file": output_path
             }
         
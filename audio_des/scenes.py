@@ -0,0 +1,125 @@
+import math
+import re
+from collections import Counter
+from typing import Any, Dict, Iterable, Iterator, List, Mapping, Optional
+
+import numpy as np
+
+try:
+    from .keyframes import histogram_distance
+except ImportError:  # running from inside audio_des/
+    from keyframes import histogram_distance
+
+
+STOP_WORDS = frozenset(
+    """
+    a an the and or but of in on at to from with by for as is are was were be been being
+    this that these those it its there their they he she his her them while into onto
+    image frame shows showing shown appears seen visible scene view camera
+    """.split()
+)
+
+
+def description_terms(text: str) -> Counter:
+    words = re.findall(r"[a-z0-9']+", text.lower())
+    return Counter(w for w in words if w not in STOP_WORDS and len(w) > 2)
+
+
+def cosine_similarity(a: Counter, b: Counter) -> float:
+    if not a or not b:
+        return 0.0
+    dot = sum(count * b[term] for term, count in a.items() if term in b)
+    norm = math.sqrt(sum(c * c for c in a.values())) * math.sqrt(sum(c * c for c in b.values()))
+    return dot / norm
+
+
+def iter_scenes(
+    frame_descriptions: Iterable[Dict[str, Any]],
+    signatures: Optional[Mapping[int, np.ndarray]] = None,
+    visual_threshold: float = 0.35,
+    text_threshold: float = 0.15,
+    max_scene_seconds: float = 60.0,
+) -> Iterator[Dict[str, Any]]:
+    """
+    Split frame descriptions into scenes without calling a model.
+
+    A new scene starts between two consecutive frames when their color
+    histograms (from `signatures`, keyed by frame number) are further apart
+    than `visual_threshold`, or, for frames without a signature, when the
+    term cosine similarity of their descriptions drops below
+    `text_threshold`. Scenes longer than `max_scene_seconds` are split so
+    narration stays anchored to the timeline.
+
+    A scene's description is that of its most representative frame, the one
+    whose terms are closest to the scene's combined terms, rather than
+    whichever frame happened to open it.
+
+    Each scene is yielded as soon as the frame starting the next one is
+    seen, so descriptions can be consumed while they are still arriving.
+
+    Args:
+        frame_descriptions: Frame analysis results in frame order
+        signatures: Optional histograms of the frames, as kept by KeyframeFilter
+
+    Yields:
+        Scenes with start/end times and frames and a description
+    """
+    if signatures is None:
+        # A mapping that is still filling up (KeyframeFilter.signatures while
+        # frames stream in) is used as is, even when empty at first
+        signatures = {}
+    current = None
+    members: List[tuple] = []  # (terms, description) of the current scene's frames
+    previous, previous_terms = None, None
+
+    for desc in frame_descriptions:
+        terms = description_terms(desc["description"])
+        if current is None:
+            boundary = True
+        elif desc["timestamp"] - current["start_time"] >= max_scene_seconds:
+            boundary = True
+        else:
+            hist = signatures.get(desc["frame_number"])
+            previous_hist = signatures.get(previous["frame_number"])
+            if hist is not None and previous_hist is not None:
+                boundary = histogram_distance(hist, previous_hist) >= visual_threshold
+            else:
+                boundary = cosine_similarity(terms, previous_terms) < text_threshold
+
+        if boundary:
+            if current is not None:
+                yield _finish(current, members)
+            members = []
+            current = {
+                "start_time": desc["timestamp"],
+                "end_time": desc["timestamp"],
+                "start_frame": desc["frame_number"],
+                "end_frame": desc["frame_number"],
+                "description": desc["description"],
+            }
+        else:
+            current["end_time"] = desc["timestamp"]
+            current["end_frame"] = desc["frame_number"]
+        members.append((terms, desc["description"]))
+        previous, previous_terms = desc, terms
+
+    if current is not None:
+        yield _finish(current, members)
+
+
+def _finish(scene: Dict[str, Any], members: List[tuple]) -> Dict[str, Any]:
+    if len(members) > 2:
+        combined = Counter()
+        for terms, _ in members:
+            combined.update(terms)
+        scene["description"] = max(members, key=lambda m: cosine_similarity(m[0], combined))[1]
+    return scene
+
+
+def segment_scenes(
+    frame_descriptions: List[Dict[str, Any]],
+    signatures: Optional[Mapping[int, np.ndarray]] = None,
+    **options,
+) -> List[Dict[str, Any]]:
+    """List form of iter_scenes"""
+    return list(iter_scenes(frame_descriptions, signatures, **options))
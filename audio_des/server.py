@@ -0,0 +1,93 @@
+import os
+
+from fastapi import FastAPI, File, HTTPException, UploadFile
+from fastapi.responses import StreamingResponse
+from dotenv import load_dotenv
+
+from processor import AudioDescriptionProcessor
+from jobs import create_job_queue
+from timeline import iter_srt, iter_webvtt
+
+load_dotenv()
+
+# --- Job queue ---
+# Videos are processed in the background; clients poll for status and result.
+# Run from the audio_des/ directory: uvicorn server:app
+processor = AudioDescriptionProcessor()
+jobs = create_job_queue(processor)
+
+app = FastAPI()
+
+
+@app.on_event("startup")
+def start_jobs():
+    jobs.start()
+
+
+@app.on_event("shutdown")
+def stop_jobs():
+    jobs.stop(timeout=5)
+    if processor.cache is not None:
+        processor.cache.flush()
+
+
+@app.post("/jobs", status_code=202)
+def submit_job(file: UploadFile = File(...)):
+    """
+    Queue a video for audio description and return its job id right away.
+    """
+    suffix = os.path.splitext(file.filename or "")[1] or ".mp4"
+    job_id = jobs.submit(file.file, suffix=suffix)
+    return {"job_id": job_id, "status": "queued"}
+
+
+@app.get("/jobs/{job_id}")
+def job_status(job_id: str):
+    """
+    Status of a job: queued, running (with stage and frame counts), done or error.
+    """
+    status = jobs.status(job_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return status
+
+
+def finished_result(job_id: str) -> dict:
+    status = jobs.status(job_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if status["status"] == "error":
+        raise HTTPException(status_code=500, detail=status["error"])
+    if status["status"] != "done":
+        raise HTTPException(status_code=409, detail=f"Job is {status['status']}")
+    return jobs.result(job_id)
+
+
+@app.get("/jobs/{job_id}/result")
+def job_result(job_id: str):
+    """
+    Audio description of a finished job. Returns 409 while it is still in progress.
+    """
+    return finished_result(job_id)
+
+
+@app.get("/jobs/{job_id}/timeline")
+def job_timeline(job_id: str, format: str = "vtt"):
+    """
+    Narration cues with real start/end times, as WebVTT (format=vtt), SRT
+    (format=srt) or JSON (format=json). While a job is running this returns
+    the cues finished so far, which grow as frames are analyzed.
+    """
+    cues = jobs.partial_timeline(job_id)
+    if cues is None:
+        result = finished_result(job_id)
+        cues, duration, complete = result.get("timeline", []), result.get("duration"), True
+    else:
+        duration, complete = None, False
+    if format == "json":
+        return {"duration": duration, "cues": cues, "complete": complete}
+    if format == "vtt":
+        return StreamingResponse(iter_webvtt(cues), media_type="text/vtt")
+    if format == "srt":
+        return StreamingResponse(iter_srt(cues), media_type="application/x-subrip")
+    raise HTTPException(status_code=400, detail=f"Unknown timeline format: {format}")
@@ -1,3 +1,5 @@
+from itertools import islice
+
 from processor import AudioDescriptionProcessor  # Replace with actual module if needed
 
 # Path to your sample video
@@ -6,18 +8,18 @@ video_path = "sample_video.mp4"  # Make sure this file exists in the same direct
 # Initialize processor
 processor = AudioDescriptionProcessor()
 
-# Step 1: Extract frames
+# Step 1: Extract frames (lazily, as (frame_index, timestamp, frame) tuples)
 frames = processor.extract_frames(video_path)
 
 # Optional: limit to first few frames to reduce cost & speed up test
-test_frames = frames[:5] if len(frames) > 5 else frames
+test_frames = islice(frames, 5)
 
 # Step 2: Analyze frames with Vision model
 descriptions = processor.analyze_frames(test_frames)
 
 print("\n=== Frame Descriptions ===")
 for desc in descriptions:
-    print(f"Frame {desc['frame_number']}: {desc['description']}")
+    print(f"Frame {desc['frame_number']} ({desc['timestamp']:.2f}s): {desc['description']}")
 
 # Step 3: Generate audio description narrative
 result = processor.generate_audio_description(descriptions)
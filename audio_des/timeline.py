@@ -0,0 +1,94 @@
+import re
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+BLANK_LINES_RE = re.compile(r"\n\s*\n+")
+ARROW_RE = re.compile(r"-{2,}>")
+
+
+def format_timestamp(seconds: float, decimal: str = ".") -> str:
+    """HH:MM:SS.mmm (WebVTT) or HH:MM:SS,mmm (SRT)"""
+    millis = int(round(max(0.0, seconds) * 1000))
+    hours, millis = divmod(millis, 3_600_000)
+    minutes, millis = divmod(millis, 60_000)
+    secs, millis = divmod(millis, 1000)
+    return f"{hours:02d}:{minutes:02d}:{secs:02d}{decimal}{millis:03d}"
+
+
+def iter_cues(
+    scenes: Iterable[Dict[str, Any]],
+    duration: Optional[float] = None,
+    min_cue_seconds: float = 2.0,
+) -> Iterator[Dict[str, Any]]:
+    """
+    Turn scenes into narration cues with start/end times in seconds.
+
+    A cue lasts until the next scene starts; the last one lasts until
+    `duration` (the video length) when known, otherwise until its last
+    frame but at least `min_cue_seconds`. Scenes are consumed lazily, so a
+    cue is yielded as soon as the following scene is known.
+    """
+    index = 0
+    pending = None
+    for scene in scenes:
+        if pending is not None:
+            index += 1
+            yield _cue(index, pending, end=scene["start_time"])
+        pending = scene
+    if pending is not None:
+        if duration is not None and duration > pending["start_time"]:
+            end = duration
+        else:
+            end = max(pending["end_time"], pending["start_time"] + min_cue_seconds)
+        yield _cue(index + 1, pending, end=end)
+
+
+def _cue(index: int, scene: Dict[str, Any], end: float) -> Dict[str, Any]:
+    return {
+        "index": index,
+        "start": round(scene["start_time"], 3),
+        "end": round(max(end, scene["start_time"]), 3),
+        "text": cue_text(scene["description"]),
+    }
+
+
+def cue_text(text: str) -> str:
+    """
+    Cue text that is safe inside a WebVTT or SRT block: a blank line would
+    end the cue early and "-->" would be read as a timing line
+    """
+    text = BLANK_LINES_RE.sub("\n", text.strip().replace("\r\n", "\n").replace("\r", "\n"))
+    return ARROW_RE.sub("->", text)
+
+
+def build_timeline(scenes: Iterable[Dict[str, Any]], duration: Optional[float] = None) -> List[Dict[str, Any]]:
+    return list(iter_cues(scenes, duration))
+
+
+def iter_webvtt(cues: Iterable[Dict[str, Any]]) -> Iterator[str]:
+    """WebVTT document in pieces: the header, then one block per cue"""
+    yield "WEBVTT\n\n"
+    for cue in cues:
+        yield (
+            f"{cue['index']}\n"
+            f"{format_timestamp(cue['start'])} --> {format_timestamp(cue['end'])}\n"
+            f"{cue_text(cue['text'])}\n\n"
+        )
+
+
+def iter_srt(cues: Iterable[Dict[str, Any]]) -> Iterator[str]:
+    """SRT document in pieces, one block per cue"""
+    for cue in cues:
+        yield (
+            f"{cue['index']}\n"
+            f"{format_timestamp(cue['start'], ',')} --> {format_timestamp(cue['end'], ',')}\n"
+            f"{cue_text(cue['text'])}\n\n"
+        )
+
+
+def to_webvtt(cues: Iterable[Dict[str, Any]]) -> str:
+    return "".join(iter_webvtt(cues))
+
+
+def to_srt(cues: Iterable[Dict[str, Any]]) -> str:
+    return "".join(iter_srt(cues))
+
@@ -1,62 +1,189 @@
+import asyncio
+import json
 import os
-from fastapi import FastAPI, File, HTTPException, UploadFile
-from pydantic import BaseModel
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, File, Form, Header, HTTPException, Request, UploadFile
+from fastapi.responses import JSONResponse, StreamingResponse
+from pydantic import BaseModel, Field
 from typing import Optional
 import openai
-from preorder_chatbot.main import PreorderAgent, AudioProcessor
+from preorder_chatbot.main import PreorderAgent, AudioProcessor, ConversationMemory
+from preorder_chatbot.speech import TranscriptionError
+from report_chatbot.captioning import CaptionServiceBusy
+from report_chatbot.image_pipeline import ImageRejected, ImageTooLarge
 from report_chatbot.main import EmergencyReportingBot
+from session_store import create_session_store
 from dotenv import load_dotenv
 
 load_dotenv()
 openai.api_key = os.environ.get("OPENAI_API_KEY")
 
 # --- Instantiate the Chatbot Agent ---
-# This is created once when the server starts
+# This is created once when the server starts. Datasets and models are
+# loaded on first use, so the server answers as soon as it is up.
 preorder_chatbot = PreorderAgent()
 report_chatbot = EmergencyReportingBot()
 audio_processor = AudioProcessor()
 
+# Components to load in the background at startup, e.g. WARMUP=report,audio
+# (or "all"); /ready answers 503 until they are loaded
+COMPONENTS = {"preorder": preorder_chatbot, "report": report_chatbot, "audio": audio_processor}
+WARMUP = [name.strip() for name in os.environ.get("WARMUP", "").split(",") if name.strip()]
+if WARMUP == ["all"]:
+    WARMUP = list(COMPONENTS)
+for name in WARMUP:
+    if name not in COMPONENTS:
+        raise ValueError(f"Unknown WARMUP component: {name}")
+warmup_status = {name: {"status": "pending"} for name in WARMUP}
+
+
+def warm_up_components():
+    for name in WARMUP:
+        start = time.perf_counter()
+        try:
+            COMPONENTS[name].warm_up()
+            warmup_status[name] = {"status": "ready", "seconds": round(time.perf_counter() - start, 2)}
+        except Exception as e:
+            print(f"Error warming up {name}: {e}")
+            warmup_status[name] = {"status": "failed", "error": str(e)}
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if WARMUP:
+        threading.Thread(target=warm_up_components, name="warmup", daemon=True).start()
+    yield
+
+
 # Start FastAPI
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 # --- Pydantic Models for Request/Response ---
 
 
 class ChatRequest(BaseModel):
     query: str
-    image_data: Optional[str] = None  # Optional base64 encoded image
+    # Optional base64 encoded image, no longer than the image pipeline accepts
+    image_data: Optional[str] = Field(None, max_length=report_chatbot.images.max_base64_chars)
+    session_id: Optional[str] = None  # Alternative to the X-Session-ID header
 
 
 class ChatResponse(BaseModel):
     response: str
+    session_id: str
+
+
+# Store conversation memory per session and per chatbot
+REPORT_HISTORY_TURNS = int(os.environ.get("REPORT_HISTORY_TURNS", 50))
+sessions = create_session_store(
+    channels={
+        "preorder": ConversationMemory,
+        "report": lambda: deque(maxlen=REPORT_HISTORY_TURNS),
+    }
+)
+
+
+def resolve_session_id(*candidates: Optional[str]) -> str:
+    """Use the first session id the client sent, or start a new session"""
+    for candidate in candidates:
+        if candidate:
+            return candidate
+    return uuid.uuid4().hex
+
+
+# With SESSION_STORE=sqlite, loading and saving sessions is blocking disk
+# I/O, so the helpers below run store calls in a worker thread
+
+
+async def load_session(session_id: str):
+    return await asyncio.to_thread(sessions.get, session_id)
+
+
+async def run_preorder_turn(session_id: str, query: str) -> dict:
+    """Run one preorder chat turn against the session's own memory"""
+    session = await load_session(session_id)
+    result = await preorder_chatbot.aprocess_order(
+        query=query,
+        memory_input=session.channel("preorder"),
+        order_intent=session.state.get("order_intent"),
+    )
+    await save_preorder_turn(session, result)
+    return result
+
+
+async def save_preorder_turn(session, result: dict):
+    def save():
+        sessions.persist(session, "preorder", result["new_interactions"])
+        sessions.set_state(session, "order_intent", result["order_intent"])
+
+    await asyncio.to_thread(save)
 
 
-# Store conversation memory for each chatbot
-preorder_memory = []
-report_memory = []
+async def save_report_turn(session, result: dict):
+    """Append only the turns added by this message to the session"""
+    history = session.channel("report")
+    new_turns = result["conversation"][len(history):]
+    history.extend(new_turns)
+    await asyncio.to_thread(sessions.persist, session, "report", new_turns)
+
+
+async def run_report_turn(session_id: str, query: str, image_data=None) -> dict:
+    """Run one emergency report turn against the session's own history"""
+    session = await load_session(session_id)
+    result = await report_chatbot.aprocess_message(
+        message=query,
+        image_data=image_data,
+        conversation_history=session.channel("report"),
+        session_id=session_id,
+    )
+    await save_report_turn(session, result)
+    return result
+
+
+def image_rejected(e: ImageRejected) -> HTTPException:
+    """413 for images over the size limits, 415 for anything that is not a supported image"""
+    status_code = 413 if isinstance(e, ImageTooLarge) else 415
+    return HTTPException(status_code=status_code, detail=str(e))
+
+
+def sse_event(data: dict, event: Optional[str] = None) -> str:
+    """Format one server-sent event"""
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+def sse_response(events) -> StreamingResponse:
+    return StreamingResponse(
+        events,
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 
 # --- API Endpoint ---
 @app.post("/preorder-chat", response_model=ChatResponse)
-async def handle_chat(request: ChatRequest):
+async def handle_chat(
+    request: ChatRequest, x_session_id: Optional[str] = Header(None)
+):
     """
     Process a user query using the preorder chatbot.
 
     - **query**: The user's message.
     - **image_data**: Optional base64 encoded image.
+    - **session_id**: Optional session id (or `X-Session-ID` header); a new
+      one is returned when omitted.
     """
-    global preorder_memory
+    session_id = resolve_session_id(request.session_id, x_session_id)
 
     try:
-        result = preorder_chatbot.process_order(
-            query=request.query, memory_input=preorder_memory
-        )
-
-        # Update global memory with new conversation
-        preorder_memory = result["memory"]
+        result = await run_preorder_turn(session_id, request.query)
 
         # Return only the response
-        return {"response": result["response"]}
+        return {"response": result["response"], "session_id": session_id}
 
     except Exception as e:
         print(f"Error processing request: {e}")  # Log the exception
@@ -64,36 +191,160 @@ async def handle_chat(request: ChatRequest):
 
 
 @app.post("/report-chat", response_model=ChatResponse)
-async def handle_emergency_report(request: ChatRequest):
+async def handle_emergency_report(
+    request: ChatRequest, x_session_id: Optional[str] = Header(None)
+):
     """
     Process a query using the emergency reporting chatbot.
 
     - **query**: The user's message.
     - **image_data**: Optional base64 encoded image.
+    - **session_id**: Optional session id (or `X-Session-ID` header).
     """
-    global report_memory
+    session_id = resolve_session_id(request.session_id, x_session_id)
 
     try:
-        # Call the bot's processing method
-        result = report_chatbot.process_message(
-            message=request.query,
-            image_data=request.image_data,
-            conversation_history=report_memory,
-        )
+        result = await run_report_turn(session_id, request.query, request.image_data)
 
-        # Update memory
-        report_memory = result["conversation"]
+        # Return only the response
+        return {"response": result["response"], "session_id": session_id}
+
+    except ImageRejected as e:
+        raise image_rejected(e)
+    except CaptionServiceBusy:
+        raise HTTPException(status_code=503, detail="Image analysis is busy, please retry shortly")
+    except Exception as e:
+        print(f"Error processing request: {e}")
+        raise HTTPException(status_code=500, detail=f"Internal Server Error: {e}")
+
+
+@app.post("/report-chat/upload", response_model=ChatResponse)
+async def handle_emergency_report_upload(
+    query: str = Form(...),
+    image: Optional[UploadFile] = File(None),
+    session_id: Optional[str] = Form(None),
+    x_session_id: Optional[str] = Header(None),
+):
+    """
+    /report-chat with the photo sent as a multipart file instead of base64.
+
+    - **query**: The user's message.
+    - **image**: Optional JPEG, PNG or WebP photo, at most IMAGE_MAX_MB.
+    - **session_id**: Optional session id (or `X-Session-ID` header).
+    """
+    session_id = resolve_session_id(session_id, x_session_id)
+
+    image_data = None
+    if image is not None:
+        max_bytes = report_chatbot.images.max_bytes
+        image_data = await image.read(max_bytes + 1)
+        if len(image_data) > max_bytes:
+            raise HTTPException(status_code=413, detail=f"Image is larger than {max_bytes} bytes")
+
+    try:
+        result = await run_report_turn(session_id, query, image_data or None)
 
         # Return only the response
-        return {"response": result["response"]}
+        return {"response": result["response"], "session_id": session_id}
 
+    except ImageRejected as e:
+        raise image_rejected(e)
+    except CaptionServiceBusy:
+        raise HTTPException(status_code=503, detail="Image analysis is busy, please retry shortly")
     except Exception as e:
         print(f"Error processing request: {e}")
         raise HTTPException(status_code=500, detail=f"Internal Server Error: {e}")
 
 
+@app.post("/preorder-chat/stream")
+async def handle_chat_stream(
+    request: ChatRequest, x_session_id: Optional[str] = Header(None)
+):
+    """
+    Streaming variant of /preorder-chat using server-sent events.
+
+    Sends `data: {"token": ...}` events as the answer is generated, then an
+    `event: done` with the full response and session id. Memory is saved
+    once the stream completes.
+    """
+    session_id = resolve_session_id(request.session_id, x_session_id)
+    session = await load_session(session_id)
+
+    async def events():
+        try:
+            async for event in preorder_chatbot.astream_order(
+                query=request.query,
+                memory_input=session.channel("preorder"),
+                order_intent=session.state.get("order_intent"),
+            ):
+                if event["type"] == "token":
+                    yield sse_event({"token": event["content"]})
+                else:
+                    await save_preorder_turn(session, event["result"])
+                    yield sse_event(
+                        {"response": event["result"]["response"], "session_id": session_id},
+                        event="done",
+                    )
+        except Exception as e:
+            print(f"Error streaming request: {e}")
+            yield sse_event({"detail": f"Internal Server Error: {e}"}, event="error")
+
+    return sse_response(events())
+
+
+@app.post("/report-chat/stream")
+async def handle_emergency_report_stream(
+    request: ChatRequest, x_session_id: Optional[str] = Header(None)
+):
+    """
+    Streaming variant of /report-chat using server-sent events.
+
+    The report is saved and the session updated once the stream completes.
+    """
+    session_id = resolve_session_id(request.session_id, x_session_id)
+    session = await load_session(session_id)
+    stream = report_chatbot.astream_message(
+        message=request.query,
+        image_data=request.image_data,
+        conversation_history=session.channel("report"),
+        session_id=session_id,
+    )
+    # The photo is decoded and captioned before the first event, so a rejected
+    # image or a busy captioner can still get a 4xx/503 before the stream starts
+    try:
+        first = await stream.__anext__()
+    except ImageRejected as e:
+        raise image_rejected(e)
+    except CaptionServiceBusy:
+        raise HTTPException(status_code=503, detail="Image analysis is busy, please retry shortly")
+
+    async def chain():
+        yield first
+        async for event in stream:
+            yield event
+
+    async def events():
+        try:
+            async for event in chain():
+                if event["type"] == "token":
+                    yield sse_event({"token": event["content"]})
+                else:
+                    await save_report_turn(session, event["result"])
+                    yield sse_event(
+                        {"response": event["result"]["response"], "session_id": session_id},
+                        event="done",
+                    )
+        except Exception as e:
+            print(f"Error streaming request: {e}")
+            yield sse_event({"detail": f"Internal Server Error: {e}"}, event="error")
+
+    return sse_response(events())
+
+
 @app.post("/audio-chat", response_model=ChatResponse)
-async def handle_audio_chat(file: UploadFile = File(...)):
+async def handle_audio_chat(
+    file: UploadFile = File(...), x_session_id: Optional[str] = Header(None)
+):
     """
     Process an audio file by:
     1. Converting speech to text
@@ -102,36 +353,142 @@ async def handle_audio_chat(file: UploadFile = File(...)):
 
     - **audio**: An audio file containing speech
     """
-    global preorder_memory
+    session_id = resolve_session_id(x_session_id)
 
     try:
         # Convert speech to text
         print(f"received {file.filename}")
-        transcribed_text = audio_processor.transcribe_audio(file.file)
+        transcribed_text = await audio_processor.atranscribe_audio(file.file, file.filename)
 
         print(f"Transcribed text: {transcribed_text}")
 
         # Process the transcribed text with the preorder chatbot
-        result = preorder_chatbot.process_order(
-            query=transcribed_text, memory_input=preorder_memory
-        )
-
-        # Update global memory with new conversation
-        preorder_memory = result["memory"]
+        result = await run_preorder_turn(session_id, transcribed_text)
 
         # Return only the response
-        return {"response": result["response"]}
+        return {"response": result["response"], "session_id": session_id}
 
+    except TranscriptionError as e:
+        print(f"Error transcribing audio: {e}")
+        raise HTTPException(status_code=422, detail=str(e))
     except Exception as e:
         print(f"Error processing audio request: {e}")  # Log the exception
         raise HTTPException(status_code=500, detail=f"Internal Server Error: {e}")
 
 
+@app.post("/audio-chat/stream", response_model=ChatResponse)
+async def handle_audio_chat_stream(
+    request: Request,
+    x_session_id: Optional[str] = Header(None),
+    x_filename: Optional[str] = Header(None),
+):
+    """
+    /audio-chat with the audio sent as the raw request body.
+
+    The body is transcribed while it uploads (with STT_BACKEND=local), so a
+    chunked upload from a recording client gets its reply sooner.
+
+    - **X-Filename**: Optional file name; its extension tells the OpenAI
+      backend the format
+    """
+    session_id = resolve_session_id(x_session_id)
+
+    try:
+        transcribed_text = await audio_processor.atranscribe_stream(request.stream(), x_filename)
+        print(f"Transcribed text: {transcribed_text}")
+
+        result = await run_preorder_turn(session_id, transcribed_text)
+        return {"response": result["response"], "session_id": session_id}
+
+    except TranscriptionError as e:
+        print(f"Error transcribing audio: {e}")
+        raise HTTPException(status_code=422, detail=str(e))
+    except Exception as e:
+        print(f"Error processing audio request: {e}")
+        raise HTTPException(status_code=500, detail=f"Internal Server Error: {e}")
+
+
 @app.post("/clear")
-async def clear_memory():
-    """Clear the chatbot's memory"""
-    global preorder_memory
-    global report_memory
-    preorder_memory = []
-    report_memory = []
+async def clear_memory(x_session_id: Optional[str] = Header(None)):
+    """Clear the chatbot memory of the session given by the `X-Session-ID` header"""
+    if not x_session_id:
+        # Without an id this would wipe every fan's session
+        raise HTTPException(status_code=400, detail="X-Session-ID header is required")
+    await asyncio.to_thread(sessions.clear, x_session_id)
     return {"message": "chatbot memory cleared successfully"}
+
+
+@app.get("/incidents")
+async def list_incidents(
+    status: Optional[str] = None,
+    since_minutes: Optional[float] = None,
+    session_id: Optional[str] = None,
+    limit: int = 100,
+):
+    """
+    Emergency incidents for operators, most recently updated first.
+
+    - **status**: e.g. `open`
+    - **since_minutes**: only incidents updated in the last N minutes
+    - **session_id**: only incidents of one chat session
+    """
+    since = time.time() - since_minutes * 60 if since_minutes is not None else None
+    return await asyncio.to_thread(
+        report_chatbot.reports.list_incidents, status, since, session_id, min(limit, 1000)
+    )
+
+
+@app.get("/incidents/next")
+async def next_incidents(limit: int = 10):
+    """
+    Active incidents ranked for responders, highest priority first.
+
+    Reports of the same event from several users are merged into one entry
+    with a reporter count. Served from memory.
+    """
+    return report_chatbot.triage.next(min(limit, 100))
+
+
+@app.post("/incidents/{incident_id}/resolve")
+async def resolve_incident(incident_id: str):
+    """Take an incident off the triage queue and mark it and its merged reports resolved"""
+    entry = report_chatbot.triage.resolve(incident_id)
+    incident_ids = entry["incident_ids"] if entry else [incident_id]
+    updated = [
+        await asyncio.to_thread(report_chatbot.reports.set_status, iid, "resolved")
+        for iid in incident_ids
+    ]
+    if entry is None and not any(updated):
+        raise HTTPException(status_code=404, detail="Incident not found")
+    return {"incident_id": incident_id, "resolved": incident_ids}
+
+
+@app.get("/incidents/{incident_id}")
+async def get_incident(incident_id: str):
+    """One incident with all of its turns"""
+    incident = await asyncio.to_thread(report_chatbot.reports.get_incident, incident_id)
+    if incident is None:
+        raise HTTPException(status_code=404, detail="Incident not found")
+    return incident
+
+
+@app.get("/ready")
+async def ready():
+    """Readiness probe: 200 once every component listed in WARMUP is loaded"""
+    is_ready = all(state["status"] == "ready" for state in warmup_status.values())
+    body = {
+        "ready": is_ready,
+        "warm_up": warmup_status,
+        "loaded": {"report_model": report_chatbot.loaded, "speech_model": audio_processor.loaded},
+    }
+    return JSONResponse(body, status_code=200 if is_ready else 503)
+
+
+@app.get("/metrics")
+async def get_metrics():
+    """Routing decisions and response cache stats of the preorder chatbot"""
+    return {
+        "preorder_mode": preorder_chatbot.mode,
+        "routing": preorder_chatbot.teacher.stats.snapshot(),
+        "response_cache": preorder_chatbot.cache.stats(),
+    }
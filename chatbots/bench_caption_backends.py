@@ -0,0 +1,122 @@
+"""
+Comparison of the BLIP captioning backends on CPU.
+
+Loads each backend in its own process and reports load time, resident
+memory after loading, per-image caption latency (p50/p95) and agreement
+with the fp32 captions (exact matches and mean word overlap). Pass a
+directory of photos with --images for meaningful agreement numbers;
+otherwise synthetic images are used.
+
+Run from the chatbots/ directory:
+
+    python bench_caption_backends.py --images ~/stadium_photos --image-sizes 384 224
+"""
+
+import argparse
+import glob
+import multiprocessing
+import os
+import resource
+import time
+
+import numpy as np
+from PIL import Image
+
+
+def load_images(directory, count: int):
+    if directory:
+        paths = sorted(glob.glob(os.path.join(directory, "*")))[:count]
+        return [Image.open(path).convert("RGB") for path in paths]
+    rng = np.random.default_rng(0)
+    return [Image.fromarray(rng.integers(0, 255, (480, 640, 3), dtype=np.uint8)) for _ in range(count)]
+
+
+def rss_mb() -> float:
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * resource.getpagesize() / 2 ** 20
+
+
+def run_backend(config, images_dir, count, results):
+    import torch
+
+    from report_chatbot.caption_backends import load_caption_model
+
+    backend, max_tokens, image_size = config
+    images = load_images(images_dir, count)
+
+    start = time.perf_counter()
+    processor, model, generate_kwargs = load_caption_model(backend, max_tokens, image_size)
+    load_seconds = time.perf_counter() - start
+    memory = rss_mb()
+
+    captions, latencies = [], []
+    with torch.inference_mode():
+        for i, image in enumerate([images[0]] + images):
+            start = time.perf_counter()
+            inputs = processor(images=image, return_tensors="pt")
+            out = model.generate(**inputs, **generate_kwargs)
+            caption = processor.decode(out[0], skip_special_tokens=True)
+            if i:  # the first call is a warm-up
+                latencies.append(time.perf_counter() - start)
+                captions.append(caption)
+
+    latencies.sort()
+    results.put({
+        "config": config,
+        "load_seconds": load_seconds,
+        "rss_mb": memory,
+        "p50": latencies[len(latencies) // 2],
+        "p95": latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))],
+        "captions": captions,
+    })
+
+
+def word_overlap(a: str, b: str) -> float:
+    a, b = set(a.split()), set(b.split())
+    return len(a & b) / len(a | b) if a | b else 1.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--images", help="directory of test photos (default: synthetic)")
+    parser.add_argument("--count", type=int, default=20)
+    parser.add_argument("--backends", nargs="+", default=["fp32", "int8", "onnx"])
+    parser.add_argument("--max-tokens", type=int, nargs="+", default=[20])
+    parser.add_argument("--image-sizes", type=int, nargs="+", default=[384])
+    args = parser.parse_args()
+
+    configs = [("fp32", 20, 384)] + [
+        (backend, max_tokens, image_size)
+        for backend in args.backends
+        for max_tokens in args.max_tokens
+        for image_size in args.image_sizes
+        if (backend, max_tokens, image_size) != ("fp32", 20, 384)
+    ]
+
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    runs = []
+    for config in configs:
+        process = context.Process(target=run_backend, args=(config, args.images, args.count, results))
+        process.start()
+        runs.append(results.get())
+        process.join()
+
+    reference = runs[0]["captions"]
+    print(
+        f"{'backend':>8} {'tokens':>6} {'size':>5} {'load (s)':>9} {'RSS (MB)':>9} "
+        f"{'p50 (s)':>8} {'p95 (s)':>8} {'exact':>6} {'overlap':>8}"
+    )
+    for run in runs:
+        backend, max_tokens, image_size = run["config"]
+        pairs = list(zip(reference, run["captions"]))
+        exact = sum(a == b for a, b in pairs) / len(pairs)
+        overlap = sum(word_overlap(a, b) for a, b in pairs) / len(pairs)
+        print(
+            f"{backend:>8} {max_tokens:>6} {image_size:>5} {run['load_seconds']:>9.1f} "
+            f"{run['rss_mb']:>9.0f} {run['p50']:>8.3f} {run['p95']:>8.3f} {exact:>6.0%} {overlap:>8.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
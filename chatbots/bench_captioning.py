@@ -0,0 +1,82 @@
+"""
+Throughput benchmark for BLIP image captioning on CPU.
+
+Compares the previous serial path (one image per generate call, in the
+caller's thread, without inference mode) with the micro-batching
+CaptionService under a number of concurrent clients, and reports
+images/sec and the mean batch size formed.
+
+Run from the chatbots/ directory:
+
+    python bench_captioning.py --images 64 --clients 16 --max-batch 8
+"""
+
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from PIL import Image
+from transformers import BlipForConditionalGeneration, BlipProcessor
+
+from report_chatbot.captioning import CaptionService
+
+MODEL = "Salesforce/blip-image-captioning-base"
+
+
+def sample_images(count: int):
+    rng = np.random.default_rng(0)
+    return [
+        Image.fromarray(rng.integers(0, 255, (480, 640, 3), dtype=np.uint8))
+        for _ in range(count)
+    ]
+
+
+def run_serial(processor, model, images) -> float:
+    start = time.perf_counter()
+    for image in images:
+        inputs = processor(image, return_tensors="pt")
+        out = model.generate(**inputs)
+        processor.decode(out[0], skip_special_tokens=True)
+    return len(images) / (time.perf_counter() - start)
+
+
+def run_service(service: CaptionService, images, clients: int) -> float:
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        list(pool.map(service.caption, images))
+    return len(images) / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--images", type=int, default=64)
+    parser.add_argument("--clients", type=int, default=16, help="concurrent requests")
+    parser.add_argument("--max-batch", type=int, nargs="+", default=[4, 8, 16])
+    parser.add_argument("--max-wait-ms", type=float, default=10)
+    args = parser.parse_args()
+
+    processor = BlipProcessor.from_pretrained(MODEL)
+    model = BlipForConditionalGeneration.from_pretrained(MODEL)
+    images = sample_images(args.images)
+
+    # Warm up both paths before timing
+    run_serial(processor, model, images[:1])
+    serial = run_serial(processor, model, images)
+    print(f"{'path':>24} {'images/s':>9} {'mean batch':>11}")
+    print(f"{'serial':>24} {serial:>9.2f} {1:>11.1f}")
+
+    for max_batch in args.max_batch:
+        service = CaptionService(
+            processor, model, max_batch_size=max_batch, max_wait_ms=args.max_wait_ms,
+            max_queue=max(args.images, 1),
+        )
+        throughput = run_service(service, images, args.clients)
+        stats = service.stats()
+        service.close()
+        label = f"batched (max {max_batch})"
+        print(f"{label:>24} {throughput:>9.2f} {stats['mean_batch_size']:>11.1f}")
+
+
+if __name__ == "__main__":
+    main()
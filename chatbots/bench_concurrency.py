@@ -0,0 +1,140 @@
+"""
+Load-test benchmark for the chat endpoints.
+
+Starts the FastAPI app in-process with uvicorn, replaces the OpenAI chat call
+with a fake that takes a fixed amount of time, and fires batches of concurrent
+requests at /preorder-chat. With the async request path, throughput should
+grow roughly linearly with the number of in-flight requests; with --blocking
+the fake LLM call sleeps synchronously (like the old code path) and
+throughput stays flat at ~1 / latency.
+
+Run from the chatbots/ directory:
+
+    python bench_concurrency.py --latency 0.5 --concurrency 1 4 16 64
+"""
+
+import argparse
+import asyncio
+import os
+import socket
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import openai
+import requests
+import uvicorn
+from openai.util import convert_to_openai_object
+
+# Keep the benchmark's LLM decisions out of the real routing log, and the
+# router from training on its canned labels
+os.environ.setdefault("ROUTER_LOG_PATH", os.path.join(tempfile.mkdtemp(), "routing_log.jsonl"))
+
+
+def _fake_completion(messages):
+    # The classification prompt asks for a single category word
+    content = "general" if "Classify the query" in messages[0]["content"] else "ok"
+    return convert_to_openai_object(
+        {"choices": [{"message": {"role": "assistant", "content": content}}]}
+    )
+
+
+def patch_openai(latency: float, blocking: bool):
+    """Replace the OpenAI chat calls with fakes that take `latency` seconds"""
+
+    async def fake_acreate(*args, **kwargs):
+        if blocking:
+            time.sleep(latency)
+        else:
+            await asyncio.sleep(latency)
+        return _fake_completion(kwargs["messages"])
+
+    def fake_create(*args, **kwargs):
+        time.sleep(latency)
+        return _fake_completion(kwargs["messages"])
+
+    openai.ChatCompletion.acreate = fake_acreate
+    openai.ChatCompletion.create = fake_create
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(port: int) -> uvicorn.Server:
+    from backend import app
+
+    server = uvicorn.Server(
+        uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning")
+    )
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+    return server
+
+
+def run_level(url: str, concurrency: int, requests_per_worker: int) -> dict:
+    """Send concurrency * requests_per_worker requests with `concurrency` in flight"""
+
+    def worker(_):
+        latencies = []
+        with requests.Session() as session:
+            for _ in range(requests_per_worker):
+                start = time.perf_counter()
+                response = session.post(url, json={"query": "hello"})
+                response.raise_for_status()
+                latencies.append(time.perf_counter() - start)
+        return latencies
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        latencies = [lat for lats in pool.map(worker, range(concurrency)) for lat in lats]
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "throughput": len(latencies) / elapsed,
+        "p50": latencies[len(latencies) // 2],
+        "p95": latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--latency", type=float, default=0.5, help="simulated LLM latency (s)")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16, 64])
+    parser.add_argument("--requests-per-worker", type=int, default=3)
+    parser.add_argument(
+        "--blocking",
+        action="store_true",
+        help="simulate the old blocking LLM call to compare against",
+    )
+    args = parser.parse_args()
+
+    patch_openai(args.latency, args.blocking)
+    port = _free_port()
+    server = start_server(port)
+    url = f"http://127.0.0.1:{port}/preorder-chat"
+
+    mode = "blocking" if args.blocking else "async"
+    print(f"mode={mode} simulated LLM latency={args.latency}s (2 calls per turn)")
+    print(f"{'concurrency':>11} {'requests':>8} {'req/s':>8} {'p50 (s)':>8} {'p95 (s)':>8}")
+    try:
+        for concurrency in args.concurrency:
+            stats = run_level(url, concurrency, args.requests_per_worker)
+            print(
+                f"{stats['concurrency']:>11} {stats['requests']:>8} "
+                f"{stats['throughput']:>8.2f} {stats['p50']:>8.2f} {stats['p95']:>8.2f}"
+            )
+    finally:
+        server.should_exit = True
+
+
+if __name__ == "__main__":
+    main()
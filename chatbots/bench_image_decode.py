@@ -0,0 +1,75 @@
+"""
+Per-image decode cost of report photos before captioning.
+
+Compares the previous path (base64 decode, full PIL decode, convert to
+RGB) with ImagePipeline's draft-mode decode straight to the captioner's
+input size, on a synthetic 12 MP phone-style JPEG or a photo passed with
+--image. Reports time per image and the size of the decoded RGB buffer
+handed to the captioner.
+
+Run from the chatbots/ directory:
+
+    python bench_image_decode.py --image ~/stadium_photo.jpg
+"""
+
+import argparse
+import base64
+import io
+import time
+
+import numpy as np
+from PIL import Image
+
+from report_chatbot.image_pipeline import ImagePipeline
+
+
+def sample_jpeg(width: int = 4032, height: int = 3024) -> bytes:
+    rng = np.random.default_rng(0)
+    gradient = np.linspace(0, 255, width, dtype=np.float32)[None, :, None]
+    pixels = gradient + rng.normal(0, 6, (height, width, 3))
+    buffer = io.BytesIO()
+    Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8)).save(buffer, "JPEG", quality=90)
+    return buffer.getvalue()
+
+
+def previous_decode(image_data: str) -> Image.Image:
+    return Image.open(io.BytesIO(base64.b64decode(image_data))).convert("RGB")
+
+
+def measure(decode, payload, repeats: int):
+    decode(payload)  # warm-up
+    start = time.perf_counter()
+    for _ in range(repeats):
+        image = decode(payload)
+    return (time.perf_counter() - start) / repeats, image
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--image", help="JPEG to decode (default: synthetic 12 MP)")
+    parser.add_argument("--repeats", type=int, default=10)
+    parser.add_argument("--target-size", type=int, default=384)
+    args = parser.parse_args()
+
+    if args.image:
+        with open(args.image, "rb") as f:
+            data = f.read()
+    else:
+        data = sample_jpeg()
+    encoded = base64.b64encode(data).decode()
+    pipeline = ImagePipeline(target_size=args.target_size)
+
+    print(f"input: {len(data) / 2 ** 20:.1f} MB, {Image.open(io.BytesIO(data)).size}")
+    print(f"{'path':>16} {'ms/image':>9} {'decoded size':>14} {'RGB MB':>7}")
+    for label, decode, payload in [
+        ("previous", previous_decode, encoded),
+        ("pipeline base64", pipeline.prepare, encoded),
+        ("pipeline upload", pipeline.prepare, data),
+    ]:
+        seconds, image = measure(decode, payload, args.repeats)
+        size = f"{image.width}x{image.height}"
+        print(f"{label:>16} {seconds * 1000:>9.1f} {size:>14} {image.width * image.height * 3 / 2 ** 20:>7.1f}")
+
+
+if __name__ == "__main__":
+    main()
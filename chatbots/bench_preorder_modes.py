@@ -0,0 +1,131 @@
+"""
+Latency benchmark for the preorder chat modes.
+
+Replaces the OpenAI chat call with a fake that sleeps for a fixed routing or
+answer latency and returns the correct category for each benchmark query,
+then runs the same turns through every PreorderAgent mode and reports
+p50/p95 latency per turn and the number of LLM calls made.
+
+Run from the chatbots/ directory:
+
+    python bench_preorder_modes.py --route-latency 0.4 --answer-latency 1.2
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+
+import openai
+from openai.util import convert_to_openai_object
+
+# Keep the benchmark's LLM decisions out of the real routing log
+os.environ.setdefault("ROUTER_LOG_PATH", os.path.join(tempfile.mkdtemp(), "routing_log.jsonl"))
+
+from preorder_chatbot.main import PreorderAgent
+
+# (query, category the LLM would pick). The first LOCAL_QUERIES are routed
+# locally by the keyword rules; the rest need the LLM to decide.
+QUERIES = [
+    ("what are the offside rules", "sports"),
+    ("lyrics of the chant", "chants"),
+    ("show me the menu", "food"),
+    ("who is the best goalkeeper", "player_history"),
+    ("hello", "general"),
+    ("I want to order kabsa", "place_order"),
+    ("how did we do against Argentina", "club_history"),
+    ("what time does the match start", "general"),
+    ("is there something light to grab before kick-off", "food"),
+    ("who scored for Al-Hilal last night", "player_history"),
+]
+CATEGORY_BY_QUERY = dict(QUERIES)
+LOCAL_QUERIES = 6
+
+
+def check_local_routing():
+    """Stop if the split above no longer holds, since the results depend on it"""
+    classifier = PreorderAgent().teacher.classifier
+    wrong = []
+    for i, (query, category) in enumerate(QUERIES):
+        expected = category if i < LOCAL_QUERIES else None
+        routed = classifier.classify(query)["category"]
+        if routed != expected:
+            wrong.append(f"{query!r}: routed locally to {routed}, expected {expected}")
+    if wrong:
+        raise SystemExit("Local routing does not match the benchmark split:\n" + "\n".join(wrong))
+
+
+def patch_openai(route_latency: float, answer_latency: float, calls: list):
+    async def fake_acreate(*args, **kwargs):
+        messages = kwargs["messages"]
+        query = messages[-1]["content"]
+        category = CATEGORY_BY_QUERY.get(query, "general")
+
+        if "Classify the query" in messages[0]["content"]:
+            calls.append("route")
+            await asyncio.sleep(route_latency)
+            return convert_to_openai_object({"choices": [{"message": {"content": category}}]})
+
+        calls.append("answer")
+        await asyncio.sleep(answer_latency)
+        if "functions" in kwargs:
+            arguments = json.dumps({"category": category, "response": "ok"})
+            message = {"content": None, "function_call": {"name": "answer", "arguments": arguments}}
+        else:
+            message = {"content": "ok"}
+        return convert_to_openai_object({"choices": [{"message": message}]})
+
+    openai.ChatCompletion.acreate = fake_acreate
+
+
+async def run_mode(mode: str, rounds: int, calls: list) -> dict:
+    agent = PreorderAgent(mode=mode)
+    latencies = []
+    calls.clear()
+    for _ in range(rounds):
+        for query, _ in QUERIES:
+            start = time.perf_counter()
+            await agent.aprocess_order(query, memory_input=[])
+            latencies.append(time.perf_counter() - start)
+    latencies.sort()
+    return {
+        "mode": mode,
+        "turns": len(latencies),
+        "p50": latencies[len(latencies) // 2],
+        "p95": latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))],
+        "calls_per_turn": len(calls) / len(latencies),
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--route-latency", type=float, default=0.4)
+    parser.add_argument("--answer-latency", type=float, default=1.2)
+    parser.add_argument("--rounds", type=int, default=1)
+    parser.add_argument(
+        "--no-local-router",
+        action="store_true",
+        help="disable the local classifier so every turn needs the LLM to route",
+    )
+    args = parser.parse_args()
+
+    if args.no_local_router:
+        os.environ["ROUTER_CONFIDENCE"] = "2"
+    else:
+        check_local_routing()
+
+    calls = []
+    patch_openai(args.route_latency, args.answer_latency, calls)
+    print(f"{'mode':>12} {'turns':>6} {'p50 (s)':>8} {'p95 (s)':>8} {'calls/turn':>10}")
+    for mode in PreorderAgent.MODES:
+        stats = await run_mode(mode, args.rounds, calls)
+        print(
+            f"{stats['mode']:>12} {stats['turns']:>6} {stats['p50']:>8.2f} "
+            f"{stats['p95']:>8.2f} {stats['calls_per_turn']:>10.2f}"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,67 @@
+"""
+Cold-start benchmark for the chatbot server.
+
+Each run is a fresh Python process that imports backend.py (what uvicorn
+does before it can accept requests) and then warms up each component the
+way its first request would. Reports the median time of every phase, and
+whether torch/transformers were already imported when the server came up.
+The sum of all phases is roughly what startup cost when everything was
+loaded eagerly.
+
+Run from the chatbots/ directory:
+
+    python bench_startup.py --repeats 3 --components preorder report
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+CHILD = """
+import json, sys, time
+start = time.perf_counter()
+import backend
+phases = {"import backend": time.perf_counter() - start}
+heavy = sorted(m for m in ("torch", "transformers") if m in sys.modules)
+for name in sys.argv[1:]:
+    start = time.perf_counter()
+    backend.COMPONENTS[name].warm_up()
+    phases[f"first use: {name}"] = time.perf_counter() - start
+print(json.dumps({"phases": phases, "heavy_imports": heavy}))
+"""
+
+
+def run_once(components):
+    env = dict(os.environ, WARMUP="")
+    output = subprocess.run(
+        [sys.executable, "-c", CHILD, *components],
+        capture_output=True, text=True, env=env, check=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument(
+        "--components", nargs="*", default=["preorder", "report", "audio"],
+        help="components to warm up after import",
+    )
+    args = parser.parse_args()
+
+    runs = [run_once(args.components) for _ in range(args.repeats)]
+    print(f"heavy modules imported at startup: {', '.join(runs[0]['heavy_imports']) or 'none'}")
+    print(f"{'phase':>24} {'seconds':>8}")
+    total = 0.0
+    for phase in runs[0]["phases"]:
+        seconds = statistics.median(run["phases"][phase] for run in runs)
+        total += seconds
+        print(f"{phase:>24} {seconds:>8.2f}")
+    print(f"{'eager equivalent':>24} {total:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,328 @@
+import json
+import os
+import re
+import threading
+from collections import Counter, deque
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+try:
+    from .retrieval import normalize_text, tokenize
+except ImportError:  # running from inside preorder_chatbot/
+    from retrieval import normalize_text, tokenize
+
+
+# ===================== Keyword Rules =====================
+
+# (pattern, weight). Strong, unambiguous cues weigh 2, weaker hints weigh 1.
+# Patterns are matched against normalize_text(query), so Arabic is written
+# without hamza/diacritic variants.
+CATEGORY_RULES: Dict[str, List[Tuple[str, float]]] = {
+    "place_order": [
+        # A bare confirmation only; "confirm my seat number" is not an order
+        (r"^\s*(yes|yeah|yep|confirm|نعم|ايوه|اكد)( please| it| the order)?\s*[.!]*$", 2),
+        (r"\b(place|make|submit|confirm)\b.*\border\b", 2),
+        (r"\b(want|like|need) to order\b", 2),
+        (r"\b(i'?d like|i would like|i want|can i get|get me)\b", 1),
+        (r"\border\b", 1),
+        (r"\b(ابغي|ابي|اطلب|طلب)\b", 2),
+    ],
+    "food": [
+        (r"\b(menu|restaurants?|food|eat|hungry|snacks?|drinks?|coffee|calories|vegan|vegetarian|halal)\b", 2),
+        (r"\b(burger|pizza|kabsa|shawarma|sandwich|juice|water|dessert|price)\b", 1),
+        (r"(مطعم|اكل|قائمه|منيو|جوعان|مشروب|قهوه)", 2),
+    ],
+    "sports": [
+        (r"\b(rules?|offside|penalty|foul|referee|var|handball|yellow card|red card|free kick)\b", 2),
+        (r"(قانون|قوانين|تسلل|ضربه جزاء|حكم|بطاقه)", 2),
+    ],
+    "club_history": [
+        (r"\b(fifa ranking|ranking|national team|squad|coach|manager|achievements?|world cup|asian cup)\b", 2),
+        (r"\b(team|club|history)\b", 1),
+        (r"(المنتخب|الفريق|تصنيف|المدرب|انجازات|كاس العالم)", 2),
+    ],
+    "player_history": [
+        (r"\b(goalkeeper|striker|midfielder|defender|winger|career|caps|born)\b", 2),
+        (r"\b(player|he|his)\b", 1),
+        (r"(لاعب|اللاعب|هداف|حارس)", 2),
+    ],
+    "chants": [
+        (r"\b(chants?|songs?|lyrics|anthem|sing|singing)\b", 2),
+        (r"(هتاف|اهازيج|اهزوجه|نشيد|اغنيه|كلمات)", 2),
+    ],
+    "general": [
+        (r"^\s*(hi|hello|hey|thanks|thank you|good (morning|evening))\b", 2),
+        (r"^\s*(مرحبا|السلام عليكم|شكرا|هلا)", 2),
+    ],
+}
+
+
+# A reply that confirms the pending order: starts with a yes and takes nothing back
+CONFIRMATION_RE = re.compile(normalize_text(r"^\s*(yes|yeah|yep|sure|ok|okay|confirm|نعم|ايوه|اكد|تمام)\b"))
+NEGATION_RE = re.compile(normalize_text(r"\b(no|not|don'?t|cancel|stop|wait|لا|الغ|الغي|الغاء)\b"))
+
+
+def is_confirmation(query: str) -> bool:
+    text = normalize_text(query)
+    return bool(CONFIRMATION_RE.search(text)) and not NEGATION_RE.search(text)
+
+
+# Categories whose cues are expected inside another's queries and do not
+# compete with it: "I want to order kabsa" names a dish but is an order
+SUBSUMED = {"place_order": frozenset({"food"})}
+
+
+class KeywordRules:
+    """
+    Weighted regex rules.
+
+    When no other category matched, confidence is the top category's
+    evidence over STRONG, so one strong cue (or two weak hints) is enough and
+    a lone weak hint is not. When categories compete, it is the top
+    category's share of the evidence plus PRIOR, which keeps mixed signals
+    below the default 0.8 threshold.
+    """
+
+    STRONG = 2.0
+    PRIOR = 1.0
+
+    def __init__(
+        self,
+        rules: Dict[str, List[Tuple[str, float]]],
+        keywords: Optional[Dict[str, Iterable[str]]] = None,
+    ):
+        self.rules = {
+            category: [(re.compile(normalize_text(pattern)), weight) for pattern, weight in patterns]
+            for category, patterns in rules.items()
+        }
+        # Dataset vocabulary (player names, restaurants, dishes) as exact-word rules
+        for category, words in (keywords or {}).items():
+            words = sorted({normalize_text(w) for w in words if len(w) > 2}, key=len, reverse=True)
+            if words:
+                pattern = r"\b(" + "|".join(re.escape(w) for w in words) + r")\b"
+                self.rules.setdefault(category, []).append((re.compile(pattern), 2))
+
+    def classify(self, query: str) -> Tuple[Optional[str], float]:
+        text = normalize_text(query)
+        scores = Counter()
+        for category, patterns in self.rules.items():
+            for pattern, weight in patterns:
+                if pattern.search(text):
+                    scores[category] += weight
+        if not scores:
+            return None, 0.0
+        category, top = scores.most_common(1)[0]
+        subsumed = SUBSUMED.get(category, ())
+        competing = sum(
+            score for other, score in scores.items() if other != category and other not in subsumed
+        )
+        if not competing:
+            return category, min(1.0, top / self.STRONG)
+        return category, top / (top + competing + self.PRIOR)
+
+
+# ===================== TF-IDF Model =====================
+
+
+class TfidfCentroidModel:
+    """Nearest-centroid classifier over TF-IDF vectors, trained from logged queries"""
+
+    def __init__(self, temperature: float = 0.1):
+        self.temperature = temperature
+        self.vocabulary: Dict[str, int] = {}
+        self.idf = None
+        self.centroids = None
+        self.labels: List[str] = []
+
+    def fit(self, queries: List[str], labels: List[str]) -> "TfidfCentroidModel":
+        docs = [tokenize(q) for q in queries]
+        self.vocabulary = {term: i for i, term in enumerate(sorted({t for d in docs for t in d}))}
+        self.labels = sorted(set(labels))
+        label_ids = {label: i for i, label in enumerate(self.labels)}
+
+        df = np.zeros(len(self.vocabulary), dtype=np.float32)
+        for doc in docs:
+            df[[self.vocabulary[t] for t in set(doc)]] += 1
+        self.idf = np.log((1 + len(docs)) / (1 + df)) + 1
+
+        # Per-class sums of the sparse document vectors; no documents x vocabulary matrix
+        sums = np.zeros((len(self.labels), len(self.vocabulary)), dtype=np.float32)
+        counts = np.zeros((len(self.labels), 1), dtype=np.float32)
+        for doc, label in zip(docs, labels):
+            term_ids, weights = self._vectorize(doc)
+            sums[label_ids[label], term_ids] += weights
+            counts[label_ids[label]] += 1
+        centroids = sums / np.maximum(counts, 1)
+        norms = np.linalg.norm(centroids, axis=1, keepdims=True)
+        self.centroids = centroids / np.maximum(norms, 1e-12)
+        return self
+
+    def _vectorize(self, tokens: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+        """Unit TF-IDF vector of known terms, as (term ids, weights)"""
+        counts = Counter(t for t in tokens if t in self.vocabulary)
+        term_ids = np.array([self.vocabulary[t] for t in counts], dtype=np.int64)
+        weights = np.array(list(counts.values()), dtype=np.float32) * self.idf[term_ids]
+        norm = np.linalg.norm(weights)
+        return term_ids, (weights / norm if norm else weights)
+
+    def classify(self, query: str) -> Tuple[Optional[str], float]:
+        if self.centroids is None:
+            return None, 0.0
+        term_ids, weights = self._vectorize(tokenize(query))
+        if not term_ids.size:
+            return None, 0.0
+        logits = self.centroids[:, term_ids] @ weights / self.temperature
+        probs = np.exp(logits - logits.max())
+        probs /= probs.sum()
+        best = int(probs.argmax())
+        return self.labels[best], float(probs[best])
+
+
+# ===================== Intent Classifier =====================
+
+
+class IntentClassifier:
+    """
+    Local fast path for query routing.
+
+    Keyword rules run first, then a TF-IDF model trained on the LLM's past
+    routing decisions. A prediction below `threshold` returns no category and
+    the caller falls back to the LLM, whose answer is logged as training data.
+    Retraining runs in a background thread and swaps the new model in when
+    it is ready, so classify() never waits for it.
+    """
+
+    def __init__(
+        self,
+        keywords: Optional[Dict[str, Iterable[str]]] = None,
+        threshold: Optional[float] = None,
+        log_path: Optional[str] = None,
+        min_examples: int = 20,
+        retrain_every: int = 50,
+        max_examples: int = 5000,
+    ):
+        if threshold is None:
+            threshold = float(os.environ.get("ROUTER_CONFIDENCE", 0.8))
+        if log_path is None:
+            log_path = os.environ.get(
+                "ROUTER_LOG_PATH",
+                os.path.join(os.path.dirname(os.path.abspath(__file__)), "routing_log.jsonl"),
+            )
+
+        self.threshold = threshold
+        self.log_path = log_path
+        self.min_examples = min_examples
+        self.retrain_every = retrain_every
+        self.rules = KeywordRules(CATEGORY_RULES, keywords)
+        self.model = TfidfCentroidModel()
+        self._examples = deque(self._load_log(), maxlen=max_examples)
+        self._untrained = 0
+        self._training = False
+        self._lock = threading.Lock()
+        self._train()
+
+    def _load_log(self) -> List[Tuple[str, str]]:
+        examples = []
+        if self.log_path and os.path.exists(self.log_path):
+            with open(self.log_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                        examples.append((entry["query"], entry["category"]))
+                    except (ValueError, KeyError):
+                        continue
+        return examples
+
+    def _train(self):
+        with self._lock:
+            examples = list(self._examples)
+        labels = {category for _, category in examples}
+        if len(examples) >= self.min_examples and len(labels) > 1:
+            queries, categories = zip(*examples)
+            self.model = TfidfCentroidModel().fit(list(queries), list(categories))
+
+    def _train_in_background(self):
+        try:
+            self._train()
+        except Exception as e:
+            print(f"Router retraining failed: {e}")
+        finally:
+            with self._lock:
+                self._training = False
+
+    def classify(self, query: str) -> Dict[str, object]:
+        """
+        Returns:
+            Dictionary with the category (None when not confident), the
+            confidence and the source ("rules" or "model")
+        """
+        category, confidence = self.rules.classify(query)
+        if category and confidence >= self.threshold:
+            return {"category": category, "confidence": confidence, "source": "rules"}
+
+        model_category, model_confidence = self.model.classify(query)
+        if model_category and model_confidence >= self.threshold:
+            return {"category": model_category, "confidence": model_confidence, "source": "model"}
+
+        # Not confident: report the best local guess so callers can still use it
+        if model_confidence > confidence:
+            category, confidence = model_category, model_confidence
+        return {"category": None, "guess": category, "confidence": confidence, "source": "local"}
+
+    def record(self, query: str, category: str):
+        """
+        Log an LLM routing decision as a training example.
+
+        Writes to the routing log, so async callers should run it in a thread.
+        """
+        with self._lock:
+            self._examples.append((query, category))
+            if self.log_path:
+                try:
+                    with open(self.log_path, "a", encoding="utf-8") as f:
+                        f.write(json.dumps({"query": query, "category": category}, ensure_ascii=False) + "\n")
+                except OSError as e:
+                    print(f"Could not write routing log: {e}")
+            self._untrained += 1
+            if self._untrained < self.retrain_every or self._training:
+                return
+            self._untrained = 0
+            self._training = True
+        threading.Thread(target=self._train_in_background, name="router-train", daemon=True).start()
+
+
+# ===================== Routing Stats =====================
+
+
+class RoutingStats:
+    """Counts how each query was routed, to measure LLM round trips avoided"""
+
+    def __init__(self):
+        self.by_source = Counter()
+        self.by_category = Counter()
+        self.outcomes = Counter()
+        self._lock = threading.Lock()
+
+    def record(self, source: str, category: str):
+        with self._lock:
+            self.by_source[source] += 1
+            self.by_category[category] += 1
+
+    def record_outcome(self, outcome: str):
+        with self._lock:
+            self.outcomes[outcome] += 1
+
+    def snapshot(self) -> Dict[str, object]:
+        with self._lock:
+            total = sum(self.by_source.values())
+            local = self.by_source["rules"] + self.by_source["model"]
+            return {
+                "total": total,
+                "by_source": dict(self.by_source),
+                "by_category": dict(self.by_category),
+                "outcomes": dict(self.outcomes),
+                # A single-call turn replaces the routing call as well
+                "llm_calls_avoided": local + self.by_source["single_call"],
+                "local_ratio": local / total if total else 0.0,
+            }
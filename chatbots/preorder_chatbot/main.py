@@ -1,125 +1,291 @@
-from io import BytesIO
+import asyncio
+import hashlib
+from collections import deque
+from functools import cached_property
 import json
 import os
-import tempfile
-import uuid
+import threading
 import openai
-from typing import Dict, Any, Optional
+from typing import Any, AsyncIterable, Dict, Optional
+
+try:
+    from .intent import IntentClassifier, RoutingStats, is_confirmation
+    from .response_cache import ResponseCache, is_self_contained
+    from .retrieval import DatasetIndex
+    from .speech import AudioInput, atranscribe_chunks, create_stt_backend
+except ImportError:  # running from inside preorder_chatbot/
+    from intent import IntentClassifier, RoutingStats, is_confirmation
+    from response_cache import ResponseCache, is_self_contained
+    from retrieval import DatasetIndex
+    from speech import AudioInput, atranscribe_chunks, create_stt_backend
 
 class AudioProcessor:
-    """Handles audio transcription using OpenAI's Whisper API"""
-    
-    def _init_(self, api_key: Optional[str] = None):
-        """Initialize the audio processor with OpenAI API key"""
-        if api_key:
-            openai.api_key = api_key
-        # Otherwise, assumes API key is set via environment variable
-    
-    def transcribe_audio(self, audio_file: BytesIO) -> str:
-        """Transcribe audio file to text using OpenAI's Whisper model"""
-        try:
-            # Get a directory where we definitely have write permissions
-            temp_dir = os.path.join(os.path.expanduser('~'), 'Documents', 'AudioTemp')
-            os.makedirs(temp_dir, exist_ok=True)
-            
-            # Create a temporary file with a unique name in our custom directory
-            temp_file_path = os.path.join(temp_dir, f"audio_transcribe_{uuid.uuid4().hex}.wav")
-            
-        
-            # Write the audio data to our temporary file
-            with open(temp_file_path, 'wb') as temp_file:
-                # If we're getting a file-like object, read its content
-                if hasattr(audio_file, 'read'):
-                    audio_content = audio_file.read()
-                    if hasattr(audio_file, 'seek'):  # Reset the file pointer if possible
-                        audio_file.seek(0)
-                    temp_file.write(audio_content)
-                else:
-                    # If we're getting the raw content, write it directly
-                    temp_file.write(audio_file)
-            
-            # Open the file in binary read mode
-            with open(temp_file_path, 'rb') as audio:
-                transcript = openai.Audio.transcribe(
-                    model="whisper-1",
-                    file=audio
-                )
-            return transcript.text
-        except Exception as e:
-            print(f"Error transcribing audio: {str(e)[:500]}")
-            return f"Error transcribing audio: {str(e)[:500]}"
-        finally:
-            # Clean up the temporary file
-            if os.path.exists(temp_file_path):
-                try:
-                    os.remove(temp_file_path)
-                except:
-                    pass  # Ignore cleanup errors
+    """Speech-to-text for voice orders on the backend selected by STT_BACKEND"""
+
+    def __init__(self, backend=None):
+        """
+        Args:
+            backend: A speech backend from speech.py (default create_stt_backend(),
+                which uses OpenAI's API unless STT_BACKEND=local). The default
+                is created on first use, since the local one loads a model.
+        """
+        self._backend = backend
+        self._backend_lock = threading.Lock()
+
+    @property
+    def loaded(self) -> bool:
+        return self._backend is not None
+
+    @property
+    def backend(self):
+        if self._backend is None:
+            with self._backend_lock:
+                if self._backend is None:
+                    self._backend = create_stt_backend()
+        return self._backend
+
+    def warm_up(self):
+        """Create the speech backend now instead of on the first request"""
+        return self.backend
+
+    async def _abackend(self):
+        # Loading a local model must not block the event loop
+        if self._backend is None:
+            return await asyncio.to_thread(self.warm_up)
+        return self._backend
+
+    def transcribe_audio(self, audio_file: AudioInput, filename: Optional[str] = None) -> str:
+        """
+        Transcribe an audio path, bytes or file object to text
+
+        Raises:
+            TranscriptionError: the audio could not be transcribed
+        """
+        return self.backend.transcribe(audio_file, filename)
+
+    async def atranscribe_audio(self, audio_file: AudioInput, filename: Optional[str] = None) -> str:
+        """Async variant of transcribe_audio"""
+        backend = await self._abackend()
+        return await backend.atranscribe(audio_file, filename)
+
+    async def atranscribe_stream(self, chunks: AsyncIterable[bytes], filename: Optional[str] = None) -> str:
+        """Transcribe audio while it is still arriving, e.g. from a request body"""
+        return await atranscribe_chunks(await self._abackend(), chunks, filename)
 
 
 # ===================== Memory =====================
 
 
+try:
+    import tiktoken
+
+    _ENCODING = tiktoken.get_encoding("cl100k_base")
+except ImportError:  # optional; fall back to an estimate
+    _ENCODING = None
+
+
+def count_tokens(text: str) -> int:
+    """Token count with tiktoken when installed, otherwise ~4 UTF-8 bytes per token"""
+    if _ENCODING is not None:
+        return len(_ENCODING.encode(text))
+    return max(1, len(text.encode("utf-8")) // 4)
+
+
+def summarize_evicted(questions: list, evicted: list, max_tokens: int) -> list:
+    """Cheap local rolling summary: the questions asked in evicted turns, oldest first"""
+    questions = questions + [" ".join(i["user"].split())[:120] for i in evicted]
+    while len(questions) > 1 and count_tokens("; ".join(questions)) > max_tokens:
+        questions.pop(0)
+    return questions
+
+
 class ConversationMemory:
-    def __init__(self, max_history_length=10000):
-        self.memory = []
-        self.max_history_length = max_history_length
-        self.length = 0
+    """
+    Conversation history bounded by a token budget.
+
+    Interactions live in a deque with their rendered text and token count, so
+    adding a turn costs O(turn) and never re-renders or re-counts the rest of
+    the history. The context string is joined from the rendered turns when it
+    is next asked for and cached until the history changes. Interactions are
+    evicted oldest first until the history fits the budget; with
+    `summarize=True` the questions of evicted turns are kept as a short
+    rolling summary.
+    """
+
+    HEADER = "Conversation History:\n"
+
+    def __init__(
+        self,
+        max_history_tokens: Optional[int] = None,
+        summarize: Optional[bool] = None,
+        max_summary_tokens: int = 200,
+    ):
+        if max_history_tokens is None:
+            max_history_tokens = int(os.environ.get("MEMORY_MAX_TOKENS", 1500))
+        if summarize is None:
+            summarize = os.environ.get("MEMORY_SUMMARY", "0") == "1"
+
+        self.memory = deque()
+        self.max_history_tokens = max_history_tokens
+        self.summarize = summarize
+        self.max_summary_tokens = max_summary_tokens
+        self.tokens = 0
+        self.summary = ""
+        self._summary_questions = []
+        self._rendered = deque()  # (text, tokens) for each interaction in memory
+        self._context = None  # joined context, rebuilt after the history changes
 
     def add_interaction(self, user_query: str, bot_response: str):
+        text = f"User: {user_query}\nBot: {bot_response}\n"
+        tokens = count_tokens(text)
         self.memory.append({"user": user_query, "bot": bot_response})
-        self.length += len(str({"user": user_query, "bot": bot_response}))
-        if self.length > self.max_history_length:
-            self.length -= len(str(self.memory[0]))
-            self.memory = self.memory[1:]
+        self._rendered.append((text, tokens))
+        self.tokens += tokens
+        self._context = None
+
+        evicted = []
+        while self.tokens > self.max_history_tokens and len(self.memory) > 1:
+            evicted.append(self.memory.popleft())
+            _, old_tokens = self._rendered.popleft()
+            self.tokens -= old_tokens
+
+        if evicted and self.summarize:
+            self._summary_questions = summarize_evicted(
+                self._summary_questions, evicted, self.max_summary_tokens
+            )
+            self.summary = "; ".join(self._summary_questions)
+
+    def append(self, interaction: Dict[str, str]):
+        self.add_interaction(interaction["user"], interaction["bot"])
 
     def get_conversation_context(self) -> str:
-        context = "Conversation History:\n"
-        for interaction in self.memory:
-            context += f"User: {interaction['user']}\n"
-            context += f"Bot: {interaction['bot']}\n"
-        return context
+        if self._context is None:
+            body = "".join(text for text, _ in self._rendered)
+            if self.summary:
+                self._context = f"{self.HEADER}Earlier the user asked: {self.summary}\n{body}"
+            else:
+                self._context = self.HEADER + body
+        return self._context
 
 
 # ===================== Base Agent =====================
 
 
+DATASET_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "datasets")
+
+
 class BaseAgent:
+    ERROR_PREFIX = "Sorry, I encountered an error"
+
     def __init__(self, dataset_filename: str = None):
+        # The dataset, its index and version are loaded on first use
         self.dataset_filename = dataset_filename
-        self.dataset = self.load_dataset()
+
+    @cached_property
+    def dataset(self):
+        return self.load_dataset()
+
+    @cached_property
+    def index(self):
+        return DatasetIndex(self.dataset) if self.dataset else None
+
+    @cached_property
+    def dataset_version(self) -> str:
+        # Changes whenever the dataset content changes, invalidating cached answers
+        if not self.dataset:
+            return ""
+        return hashlib.sha1(json.dumps(self.dataset, sort_keys=True).encode("utf-8")).hexdigest()[:12]
+
+    def warm_up(self):
+        """Load the dataset and build its index now instead of on the first query"""
+        _ = self.index, self.dataset_version
 
     def load_dataset(self):
         if not self.dataset_filename:
             return None
         try:
-            path = os.path.join("preorder_chatbot\datasets", self.dataset_filename)
+            path = os.path.join(DATASET_DIR, self.dataset_filename)
             with open(path, "r", encoding="utf-8") as f:
                 return json.load(f)
         except Exception as e:
             print(f"Error loading dataset {self.dataset_filename}: {e}")
             return None
 
-    def get_relevant_dataset_info(self):
-        if self.dataset:
-            return f"Dataset info: {json.dumps(self.dataset)}"
+    def get_relevant_dataset_info(self, query: str = "") -> str:
+        """Return only the dataset records relevant to the query"""
+        if self.index:
+            return f"Dataset info: {self.index.format(self.index.search(query))}"
+        return ""
+
+    async def aget_relevant_dataset_info(self, query: str = "") -> str:
+        """get_relevant_dataset_info for async callers; any query embedding is awaited"""
+        if self.index:
+            return f"Dataset info: {self.index.format(await self.index.asearch(query))}"
         return ""
 
+    @staticmethod
+    def _retrieval_query(query: str, memory: "ConversationMemory") -> str:
+        # Include the previous question so follow-ups ("what about his goals?")
+        # still retrieve the record being discussed
+        if memory.memory:
+            return f"{memory.memory[-1]['user']} {query}"
+        return query
+
+    def build_messages(self, query: str, memory: "ConversationMemory") -> list:
+        dataset_info = self.get_relevant_dataset_info(self._retrieval_query(query, memory))
+        return self._messages(query, memory, dataset_info)
+
+    async def abuild_messages(self, query: str, memory: "ConversationMemory") -> list:
+        dataset_info = await self.aget_relevant_dataset_info(self._retrieval_query(query, memory))
+        return self._messages(query, memory, dataset_info)
+
+    def _messages(self, query: str, memory: "ConversationMemory", dataset_info: str) -> list:
+        return [
+            {"role": "system", "content": self.get_system_prompt()},
+            {"role": "system", "content": dataset_info},
+            {"role": "system", "content": memory.get_conversation_context()},
+            {"role": "user", "content": query},
+        ]
+
     def generate_response(self, query: str, memory: "ConversationMemory") -> str:
         try:
-            messages = [
-                {"role": "system", "content": self.get_system_prompt()},
-                {"role": "system", "content": self.get_relevant_dataset_info()},
-                {"role": "system", "content": memory.get_conversation_context()},
-                {"role": "user", "content": query},
-            ]
-
             response = openai.ChatCompletion.create(
-                model="gpt-3.5-turbo", messages=messages, max_tokens=300
+                model="gpt-3.5-turbo",
+                messages=self.build_messages(query, memory),
+                max_tokens=300,
+            )
+            return response.choices[0].message.content
+        except Exception as e:
+            return f"{self.ERROR_PREFIX}: {e}"
+
+    async def agenerate_response(self, query: str, memory: "ConversationMemory") -> str:
+        try:
+            response = await openai.ChatCompletion.acreate(
+                model="gpt-3.5-turbo",
+                messages=await self.abuild_messages(query, memory),
+                max_tokens=300,
             )
             return response.choices[0].message.content
         except Exception as e:
-            return f"Sorry, I encountered an error: {e}"
+            return f"{self.ERROR_PREFIX}: {e}"
+
+    async def astream_response(self, query: str, memory: "ConversationMemory"):
+        """
+        Yield the answer token by token as the model produces it
+
+        Errors are raised rather than yielded as text, possibly after some
+        tokens, so callers can tell a partial answer from a complete one.
+        """
+        response = await openai.ChatCompletion.acreate(
+            model="gpt-3.5-turbo",
+            messages=await self.abuild_messages(query, memory),
+            max_tokens=300,
+            stream=True,
+        )
+        async for chunk in response:
+            content = chunk.choices[0].delta.get("content")
+            if content:
+                yield content
 
     def get_system_prompt(self):
         raise NotImplementedError("Subclasses must implement this")
@@ -238,10 +404,43 @@ class LLMTeacher:
             "chants": ChantAgent(),
             "place_order": PlaceOrderAgent(),  # ✅ New
         }
-
-    def route_query(self, query: str) -> Dict[str, Any]:
-        try:
-            classification_prompt = """
+        self.stats = RoutingStats()
+
+    @cached_property
+    def classifier(self) -> IntentClassifier:
+        # Built on first use: its rules include vocabulary from the datasets
+        return IntentClassifier(keywords=self._dataset_keywords())
+
+    def warm_up(self):
+        """Load every dataset, index and the router now instead of on the first query"""
+        for agent in self.students.values():
+            agent.warm_up()
+        _ = self.classifier
+
+    def _dataset_keywords(self) -> Dict[str, list]:
+        """Vocabulary from the agents' datasets, used as extra routing rules"""
+        keywords = {"player_history": [], "food": []}
+        names = [
+            player.get("personal_info", {}).get("full_name", "").split()
+            for player in self.students["player_history"].dataset or []
+        ]
+        # Given names ("Ali", "Faisal") are shared by fans, so only full names,
+        # "first last" and distinctive last names identify a player
+        given_names = {parts[0].lower() for parts in names if parts}
+        for parts in names:
+            if len(parts) < 2:
+                continue
+            candidates = [" ".join(parts), f"{parts[0]} {parts[-1]}"]
+            if parts[-1].lower() not in given_names:
+                candidates.append(parts[-1])
+            for name in candidates:
+                keywords["player_history"].extend({name, name.replace("-", " ")})
+        for restaurant in self.students["food"].dataset or []:
+            keywords["food"].append(restaurant.get("name", ""))
+            keywords["food"].extend(item.get("item", "") for item in restaurant.get("menu", []))
+        return keywords
+
+    CLASSIFICATION_PROMPT = """
             Classify the query into one of the following categories:
             - food
             - sports
@@ -252,55 +451,433 @@ class LLMTeacher:
             - place_order
             Just respond with the category.
             """
+
+    def _classification_messages(self, query: str) -> list:
+        return [
+            {"role": "system", "content": self.CLASSIFICATION_PROMPT},
+            {"role": "user", "content": query},
+        ]
+
+    def _route(self, category: str, source: str, confidence: Optional[float]) -> Dict[str, Any]:
+        self.stats.record(source, category)
+        return {
+            "agent": self.students[category],
+            "category": category,
+            "source": source,
+            "confidence": confidence,
+        }
+
+    def route_locally(
+        self, query: str, prediction: Optional[Dict[str, Any]] = None
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Route with the local classifier, or return None when it is not confident.
+
+        Pass `prediction` when the query has already been classified this turn.
+        """
+        if prediction is None:
+            prediction = self.classifier.classify(query)
+        if prediction["category"] is None:
+            return None
+        return self._route(prediction["category"], prediction["source"], prediction["confidence"])
+
+    def _llm_category(self, content: str) -> Optional[str]:
+        """The category named in the LLM's reply, or None if it is not one of ours"""
+        category = content.strip().lower()
+        return category if category in self.students else None
+
+    def route_query(self, query: str, prediction: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        routed = self.route_locally(query, prediction)
+        if routed:
+            return routed
+        try:
             response = openai.ChatCompletion.create(
                 model="gpt-3.5-turbo",
-                messages=[
-                    {"role": "system", "content": classification_prompt},
-                    {"role": "user", "content": query},
-                ],
+                messages=self._classification_messages(query),
                 max_tokens=10,
             )
-            category = response.choices[0].message.content.strip().lower()
-            if category not in self.students:
-                category = "general"
-            return {"agent": self.students[category], "category": category}
+            category = self._llm_category(response.choices[0].message.content)
+            if category:
+                self.classifier.record(query, category)
+            return self._route(category or "general", "llm", None)
         except Exception as e:
             print(f"Routing failed: {e}")
-            return {"agent": self.students["general"], "category": "general"}
+            return self._route("general", "llm_error", None)
+
+    async def aroute_query(self, query: str, prediction: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        routed = self.route_locally(query, prediction)
+        if routed:
+            return routed
+        try:
+            response = await openai.ChatCompletion.acreate(
+                model="gpt-3.5-turbo",
+                messages=self._classification_messages(query),
+                max_tokens=10,
+            )
+            category = self._llm_category(response.choices[0].message.content)
+            if category:
+                # Appends to the routing log on disk, so not on the event loop
+                await asyncio.to_thread(self.classifier.record, query, category)
+            return self._route(category or "general", "llm", None)
+        except Exception as e:
+            print(f"Routing failed: {e}")
+            return self._route("general", "llm_error", None)
+
+
+    ANSWER_FUNCTION = {
+        "name": "answer",
+        "description": "Answer the user as the assistant for the chosen category",
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "category": {"type": "string"},
+                "response": {"type": "string"},
+            },
+            "required": ["category", "response"],
+        },
+    }
+
+    def _route_and_answer_messages(self, query: str, memory: "ConversationMemory") -> list:
+        """One prompt holding every agent's instructions and retrieved data"""
+        retrieval_query = BaseAgent._retrieval_query(query, memory)
+        found = {
+            category: agent.index.search(retrieval_query, top_k=2)
+            for category, agent in self.students.items()
+            if agent.index
+        }
+        return self._route_and_answer_prompt(query, memory, found)
+
+    async def _aroute_and_answer_messages(self, query: str, memory: "ConversationMemory") -> list:
+        retrieval_query = BaseAgent._retrieval_query(query, memory)
+        indexed = {category: agent for category, agent in self.students.items() if agent.index}
+        results = await asyncio.gather(
+            *(agent.index.asearch(retrieval_query, top_k=2) for agent in indexed.values())
+        )
+        return self._route_and_answer_prompt(query, memory, dict(zip(indexed, results)))
+
+    def _route_and_answer_prompt(
+        self, query: str, memory: "ConversationMemory", found: Dict[str, list]
+    ) -> list:
+        skills = "\n".join(
+            f"- {category}: {' '.join(agent.get_system_prompt().split())}"
+            for category, agent in self.students.items()
+        )
+        dataset_info = "\n".join(
+            f"[{category}] {self.students[category].index.format(chunks)}"
+            for category, chunks in found.items()
+        )
+        return [
+            {
+                "role": "system",
+                "content": "Pick the category whose assistant should handle the user's "
+                "message, then answer exactly as that assistant would. "
+                "Call the answer function with the category and your reply.\n"
+                f"Categories:\n{skills}",
+            },
+            {"role": "system", "content": f"Dataset info:\n{dataset_info}"},
+            {"role": "system", "content": memory.get_conversation_context()},
+            {"role": "user", "content": query},
+        ]
+
+    def _parse_route_and_answer(self, message) -> Dict[str, Any]:
+        try:
+            arguments = json.loads(message["function_call"]["arguments"])
+            category = str(arguments.get("category", "")).strip().lower()
+            response = arguments["response"]
+        except (KeyError, TypeError, ValueError):
+            # The model answered in plain text instead of calling the function
+            category, response = "general", message.get("content") or ""
+        if category not in self.students:
+            category = "general"
+        routed = self._route(category, "single_call", None)
+        routed["response"] = response
+        return routed
+
+    def route_and_answer(self, query: str, memory: "ConversationMemory") -> Dict[str, Any]:
+        """Classify and answer in a single LLM call"""
+        response = openai.ChatCompletion.create(
+            model="gpt-3.5-turbo",
+            messages=self._route_and_answer_messages(query, memory),
+            functions=[self.ANSWER_FUNCTION],
+            function_call={"name": "answer"},
+            max_tokens=350,
+        )
+        return self._parse_route_and_answer(response.choices[0].message)
+
+    async def aroute_and_answer(self, query: str, memory: "ConversationMemory") -> Dict[str, Any]:
+        response = await openai.ChatCompletion.acreate(
+            model="gpt-3.5-turbo",
+            messages=await self._aroute_and_answer_messages(query, memory),
+            functions=[self.ANSWER_FUNCTION],
+            function_call={"name": "answer"},
+            max_tokens=350,
+        )
+        return self._parse_route_and_answer(response.choices[0].message)
 
 
 # ===================== Final Chatbot API Handler =====================
 class PreorderAgent:
-    def __init__(self):
+    """
+    Answers preorder chat turns.
+
+    Modes (PREORDER_MODE):
+        two_call: route the query, then ask the chosen agent (default)
+        single_call: one function-calling request both routes and answers
+        speculative: when the local router is unsure, ask the LLM router and
+            its best local guess at the same time, and only call the correct
+            agent again when the guess was wrong
+    In every mode a confident local routing decision needs only the answer call.
+    """
+
+    MODES = ("two_call", "single_call", "speculative")
+    # FAQ-style categories whose answers only depend on the question and dataset
+    CACHED_CATEGORIES = ("sports", "chants", "club_history", "player_history")
+
+    def __init__(self, mode: Optional[str] = None):
+        self.mode = mode or os.environ.get("PREORDER_MODE", "two_call")
+        if self.mode not in self.MODES:
+            raise ValueError(f"Unknown preorder mode: {self.mode}")
         self.teacher = LLMTeacher()
-        self.memory = ConversationMemory()
-        self.last_order_intent = None  # For tracking orders
+        self.cache = ResponseCache()
         self.conversations = {}
 
-    def process_order(self, query: str, memory_input: list):
-        if memory_input:
-            self.memory.memory = memory_input
+    def warm_up(self):
+        """Load datasets and the router now instead of on the first query"""
+        self.teacher.warm_up()
 
-        routing_result = self.teacher.route_query(query)
-        agent = routing_result["agent"]
-        category = routing_result["category"]
+    def process_order(
+        self, query: str, memory_input=None, order_intent: Optional[str] = None
+    ):
+        """
+        Answer one chat turn.
+
+        Args:
+            query: The user's message
+            memory_input: Either a list of previous interactions, which is copied,
+                or a ConversationMemory owned by the caller, which is updated in place
+            order_intent: The pending order awaiting confirmation, if any
 
-        response = agent.generate_response(query, self.memory)
-        self.memory.add_interaction(query, response)
+        Returns:
+            Dictionary with the response, the updated memory, the interactions
+            added this turn and the pending order intent
+
+        This blocking variant is safe to call whether or not an event loop is
+        running. Speculative mode needs concurrent requests, so here it
+        routes first and then answers, like two_call.
+        """
+        memory = self._as_memory(memory_input)
+        routing_result = self._route_and_respond(query, memory)
+        return self._record_turn(
+            query,
+            routing_result["agent"],
+            routing_result["category"],
+            routing_result["response"],
+            memory,
+            order_intent,
+        )
+
+    async def aprocess_order(
+        self, query: str, memory_input=None, order_intent: Optional[str] = None
+    ):
+        """Async variant of process_order; awaits the LLM instead of blocking the loop"""
+        memory = self._as_memory(memory_input)
+        routing_result = await self._aroute_and_respond(query, memory)
+        return self._record_turn(
+            query,
+            routing_result["agent"],
+            routing_result["category"],
+            routing_result["response"],
+            memory,
+            order_intent,
+        )
+
+    def _route_and_respond(self, query: str, memory: ConversationMemory) -> Dict[str, Any]:
+        prediction = self.teacher.classifier.classify(query)
+        if prediction["category"] is None and self.mode == "single_call":
+            try:
+                return self.teacher.route_and_answer(query, memory)
+            except Exception as e:
+                print(f"Single-call routing failed, falling back: {e}")
+
+        routing_result = self.teacher.route_query(query, prediction)
+        routing_result["response"] = self._answer(routing_result, query, memory)
+        return routing_result
+
+    async def _aroute_and_respond(self, query: str, memory: ConversationMemory) -> Dict[str, Any]:
+        """Route the query and generate the answer according to the configured mode"""
+        # Classified once here; the routing calls below reuse the prediction
+        prediction = self.teacher.classifier.classify(query)
+        if prediction["category"] is None:
+            if self.mode == "single_call":
+                try:
+                    return await self.teacher.aroute_and_answer(query, memory)
+                except Exception as e:
+                    print(f"Single-call routing failed, falling back: {e}")
+            elif self.mode == "speculative":
+                return await self._aspeculate(query, memory, prediction)
+
+        routing_result = await self.teacher.aroute_query(query, prediction)
+        routing_result["response"] = await self._aanswer(routing_result, query, memory)
+        return routing_result
+
+    def _is_cacheable(self, category: str, query: str) -> bool:
+        return category in self.CACHED_CATEGORIES and is_self_contained(query)
+
+    def _store_response(self, routing_result: Dict[str, Any], query: str, response: str):
+        agent, category = routing_result["agent"], routing_result["category"]
+        if self._is_cacheable(category, query) and not response.startswith(agent.ERROR_PREFIX):
+            self.cache.put(category, query, agent.dataset_version, response)
+
+    def _lookup_response(self, routing_result: Dict[str, Any], query: str) -> Optional[str]:
+        agent, category = routing_result["agent"], routing_result["category"]
+        if self._is_cacheable(category, query):
+            return self.cache.get(category, query, agent.dataset_version)
+        return None
+
+    def _answer(self, routing_result: Dict[str, Any], query: str, memory: ConversationMemory) -> str:
+        cached = self._lookup_response(routing_result, query)
+        if cached is not None:
+            return cached
+
+        response = routing_result["agent"].generate_response(query, memory)
+        self._store_response(routing_result, query, response)
+        return response
+
+    async def _aanswer(
+        self, routing_result: Dict[str, Any], query: str, memory: ConversationMemory
+    ) -> str:
+        """Ask the routed agent, serving repeated FAQ-style questions from the cache"""
+        cached = self._lookup_response(routing_result, query)
+        if cached is not None:
+            return cached
+
+        response = await routing_result["agent"].agenerate_response(query, memory)
+        self._store_response(routing_result, query, response)
+        return response
+
+    async def _aspeculate(
+        self, query: str, memory: ConversationMemory, prediction: Dict[str, Any]
+    ) -> Dict[str, Any]:
+        guess = prediction.get("guess") or "general"
+        cached = self._lookup_response(
+            {"agent": self.teacher.students[guess], "category": guess}, query
+        )
+        if cached is not None:
+            # The guessed answer is already cached, so there is nothing to speculate on
+            routing_result = await self.teacher.aroute_query(query, prediction)
+            if routing_result["category"] == guess:
+                routing_result["response"] = cached
+            else:
+                routing_result["response"] = await self._aanswer(routing_result, query, memory)
+            return routing_result
+
+        routing_result, speculative_response = await asyncio.gather(
+            self.teacher.aroute_query(query, prediction),
+            self.teacher.students[guess].agenerate_response(query, memory),
+        )
+        if routing_result["category"] == guess:
+            self.teacher.stats.record_outcome("speculative_hit")
+            routing_result["response"] = speculative_response
+            self._store_response(routing_result, query, speculative_response)
+        else:
+            self.teacher.stats.record_outcome("speculative_miss")
+            routing_result["response"] = await self._aanswer(routing_result, query, memory)
+        return routing_result
+
+    async def astream_order(
+        self, query: str, memory_input=None, order_intent: Optional[str] = None
+    ):
+        """
+        Streaming variant of aprocess_order.
+
+        Yields {"type": "token", "content": ...} events while the answer is
+        generated, then a single {"type": "done", "result": ...} event holding
+        the same result dictionary as process_order. Memory is only updated
+        once the answer is complete. If the answer fails part way, an error
+        message follows the partial tokens and the turn is neither cached
+        nor added to memory; the result then has no new interactions.
+        """
+        memory = self._as_memory(memory_input)
+        routing_result = await self.teacher.aroute_query(query)
+
+        response = self._lookup_response(routing_result, query)
+        if response is not None:
+            yield {"type": "token", "content": response}
+        else:
+            parts = []
+            try:
+                async for token in routing_result["agent"].astream_response(query, memory):
+                    parts.append(token)
+                    yield {"type": "token", "content": token}
+            except Exception as e:
+                error = f"{routing_result['agent'].ERROR_PREFIX}: {e}"
+                if parts:
+                    error = f"\n\n{error}"
+                yield {"type": "token", "content": error}
+                yield {
+                    "type": "done",
+                    "result": {
+                        "response": "".join(parts) + error,
+                        "memory": memory.memory,
+                        "new_interactions": [],
+                        "category": routing_result["category"],
+                        "order_intent": order_intent,
+                    },
+                }
+                return
+            response = "".join(parts)
+            self._store_response(routing_result, query, response)
+
+        result = self._record_turn(
+            query,
+            routing_result["agent"],
+            routing_result["category"],
+            response,
+            memory,
+            order_intent,
+        )
+        if result["response"] != response:
+            # The order was confirmed after the answer streamed
+            yield {"type": "token", "content": f"\n\n{result['response']}"}
+        yield {"type": "done", "result": result}
+
+    def _as_memory(self, memory_input) -> ConversationMemory:
+        if isinstance(memory_input, ConversationMemory):
+            return memory_input
+        memory = ConversationMemory()
+        for interaction in memory_input or []:
+            memory.append(interaction)
+        return memory
+
+    def _record_turn(
+        self,
+        query: str,
+        agent: BaseAgent,
+        category: str,
+        response: str,
+        memory: ConversationMemory,
+        order_intent: Optional[str],
+    ):
+        new_interactions = [{"user": query, "bot": response}]
 
         if category == "place_order":
-            if "yes" in query.lower():
+            if is_confirmation(query):
                 # Confirming previous order
-                if self.last_order_intent:
-                    order_number = agent.save_order(self.last_order_intent)
+                if order_intent:
+                    order_number = agent.save_order(order_intent)
                     response = f"✅ Your order has been placed successfully. Your order number is: {order_number}."
-                    self.memory.add_interaction(query, response)
-                    self.last_order_intent = None
+                    new_interactions.append({"user": query, "bot": response})
+                    order_intent = None
             else:
-                self.last_order_intent = query  # Save what the user asked to order
+                order_intent = query  # Save what the user asked to order
+
+        for interaction in new_interactions:
+            memory.append(interaction)
 
         return {
             "response": response,
-            "memory": self.memory.memory,
+            "memory": memory.memory,
+            "new_interactions": new_interactions,
             "category": category,
+            "order_intent": order_intent,
         }
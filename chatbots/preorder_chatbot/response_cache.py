@@ -0,0 +1,146 @@
+import os
+import threading
+from collections import Counter, OrderedDict, defaultdict
+from typing import Dict, FrozenSet, Optional, Tuple
+
+try:
+    from .retrieval import tokenize
+except ImportError:  # running from inside preorder_chatbot/
+    from retrieval import tokenize
+
+
+# Words that point back into the conversation ("what about his goals?").
+# Answers to such follow-ups depend on the fan's history and are not cached.
+FOLLOW_UP_WORDS = frozenset(
+    "he him his she her it its they them their that this those these هو هي هذا هذه ذلك".split()
+)
+
+
+# Words whose presence doesn't change what is being asked; near-duplicate
+# queries may differ only in these. Question words are not among them:
+# "when" and "where" ask different things.
+STOPWORDS = frozenset(
+    "a an the is are was were be of to in on at for and or me my i you your we our us "
+    "please can could would will do does did tell show give about any some there here "
+    "في على عن الى هل لو سمحت ممكن ابي ابغي يا".split()
+)
+
+
+def normalize_query(query: str) -> str:
+    return " ".join(tokenize(query))
+
+
+def char_ngrams(text: str, n: int = 3) -> FrozenSet[str]:
+    padded = f" {text} "
+    return frozenset(padded[i:i + n] for i in range(max(1, len(padded) - n + 1)))
+
+
+def is_self_contained(query: str) -> bool:
+    return not FOLLOW_UP_WORDS.intersection(tokenize(query))
+
+
+class ResponseCache:
+    """
+    LRU cache of answers keyed on (category, normalized query, dataset version).
+
+    Lookups try the exact key first, then the closest cached query in the same
+    category and dataset version by character n-gram Jaccard similarity. A
+    near match is only used when the two queries differ in stopwords alone,
+    so a different name, number or year ("asian cup 1984" vs "1988") is
+    always a miss however similar the spelling. An inverted n-gram index
+    keeps the near-duplicate search proportional to the number of
+    overlapping entries rather than the cache size.
+    """
+
+    def __init__(
+        self,
+        max_entries: Optional[int] = None,
+        similarity: Optional[float] = None,
+        ngram: int = 3,
+    ):
+        if max_entries is None:
+            max_entries = int(os.environ.get("RESPONSE_CACHE_SIZE", 2048))
+        if similarity is None:
+            similarity = float(os.environ.get("RESPONSE_CACHE_SIMILARITY", 0.85))
+
+        self.max_entries = max_entries
+        self.similarity = similarity
+        self.ngram = ngram
+        # key -> (response, n-grams, tokens)
+        self._entries: "OrderedDict[Tuple[str, str, str], Tuple[str, FrozenSet[str], FrozenSet[str]]]" = OrderedDict()
+        self._postings: Dict[Tuple[str, str, str], set] = defaultdict(set)
+        self._lock = threading.Lock()
+        self.hits = Counter()
+        self.misses = 0
+
+    def get(self, category: str, query: str, version: str) -> Optional[str]:
+        normalized = normalize_query(query)
+        key = (category, normalized, version)
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits["exact"] += 1
+                return self._entries[key][0]
+
+            match = self._nearest(
+                category, version, char_ngrams(normalized, self.ngram), frozenset(normalized.split())
+            )
+            if match is not None:
+                self._entries.move_to_end(match)
+                self.hits["near"] += 1
+                return self._entries[match][0]
+
+            self.misses += 1
+            return None
+
+    def _nearest(self, category: str, version: str, grams: FrozenSet[str], tokens: FrozenSet[str]):
+        overlaps = Counter()
+        for gram in grams:
+            overlaps.update(self._postings.get((category, version, gram), ()))
+
+        best, best_score = None, self.similarity
+        for key, overlap in overlaps.items():
+            _, other, other_tokens = self._entries[key]
+            if (tokens ^ other_tokens) - STOPWORDS:
+                continue  # asks about a different entity, number or thing
+            score = overlap / (len(grams) + len(other) - overlap)
+            if score >= best_score:
+                best, best_score = key, score
+        return best
+
+    def put(self, category: str, query: str, version: str, response: str):
+        normalized = normalize_query(query)
+        key = (category, normalized, version)
+        grams = char_ngrams(normalized, self.ngram)
+        tokens = frozenset(normalized.split())
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self._entries[key] = (response, grams, tokens)
+                return
+            self._entries[key] = (response, grams, tokens)
+            for gram in grams:
+                self._postings[(category, version, gram)].add(key)
+            while len(self._entries) > self.max_entries:
+                self._evict()
+
+    def _evict(self):
+        key, (_, grams, _) = self._entries.popitem(last=False)
+        category, _, version = key
+        for gram in grams:
+            posting = self._postings.get((category, version, gram))
+            if posting is not None:
+                posting.discard(key)
+                if not posting:
+                    del self._postings[(category, version, gram)]
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            lookups = sum(self.hits.values()) + self.misses
+            return {
+                "entries": len(self._entries),
+                "exact_hits": self.hits["exact"],
+                "near_hits": self.hits["near"],
+                "misses": self.misses,
+                "hit_rate": sum(self.hits.values()) / lookups if lookups else 0.0,
+            }
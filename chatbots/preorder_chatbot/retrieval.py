@@ -0,0 +1,233 @@
+import hashlib
+import json
+import math
+import os
+import re
+from collections import Counter, defaultdict
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import openai
+
+
+# ===================== Tokenization =====================
+
+TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+ARABIC_DIACRITICS_RE = re.compile("[\u064B-\u0652\u0640]")  # harakat and tatweel
+ARABIC_LETTER_MAP = str.maketrans({"أ": "ا", "إ": "ا", "آ": "ا", "ة": "ه", "ى": "ي"})
+
+
+def normalize_text(text: str) -> str:
+    """Lowercase, with Arabic diacritics and letter variants normalized"""
+    return ARABIC_DIACRITICS_RE.sub("", text.lower()).translate(ARABIC_LETTER_MAP)
+
+
+def tokenize(text: str) -> List[str]:
+    return TOKEN_RE.findall(normalize_text(text))
+
+
+# ===================== Chunking =====================
+
+
+def chunk_dataset(dataset: Any) -> List[Any]:
+    """
+    Split a dataset into one chunk per record.
+
+    Top-level lists (players, restaurants, chants, rules) give one chunk per
+    item. Top-level dicts give one chunk per key, except lists of records
+    such as a squad, which give one chunk per record tagged with the key.
+    """
+    if isinstance(dataset, list):
+        return list(dataset)
+    if isinstance(dataset, dict):
+        chunks = []
+        for key, value in dataset.items():
+            if isinstance(value, list) and value and all(isinstance(v, dict) for v in value):
+                chunks.extend({key: record} for record in value)
+            else:
+                chunks.append({key: value})
+        return chunks
+    return [dataset]
+
+
+def chunk_text(chunk: Any) -> str:
+    return json.dumps(chunk, ensure_ascii=False)
+
+
+# ===================== BM25 =====================
+
+
+class BM25Index:
+    """Okapi BM25 over a fixed set of documents, scored with NumPy postings"""
+
+    def __init__(self, documents: List[str], k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.num_docs = len(documents)
+
+        doc_tokens = [tokenize(doc) for doc in documents]
+        doc_lengths = np.array([len(tokens) for tokens in doc_tokens], dtype=np.float32)
+        avg_length = float(doc_lengths.mean()) if self.num_docs else 0.0
+        norm = k1 * (1 - b + b * doc_lengths / max(avg_length, 1.0))
+
+        postings = defaultdict(lambda: ([], []))
+        for doc_id, tokens in enumerate(doc_tokens):
+            for term, tf in Counter(tokens).items():
+                postings[term][0].append(doc_id)
+                postings[term][1].append(tf)
+
+        # Precompute the per-posting BM25 weight so a query is a few scatter-adds
+        self.postings: Dict[str, tuple] = {}
+        for term, (doc_ids, tfs) in postings.items():
+            doc_ids = np.array(doc_ids, dtype=np.int32)
+            tfs = np.array(tfs, dtype=np.float32)
+            df = len(doc_ids)
+            idf = math.log(1 + (self.num_docs - df + 0.5) / (df + 0.5))
+            weights = idf * tfs * (k1 + 1) / (tfs + norm[doc_ids])
+            self.postings[term] = (doc_ids, weights)
+
+    def score(self, query: str) -> np.ndarray:
+        scores = np.zeros(self.num_docs, dtype=np.float32)
+        for term in set(tokenize(query)):
+            if term in self.postings:
+                doc_ids, weights = self.postings[term]
+                scores[doc_ids] += weights
+        return scores
+
+
+# ===================== Embeddings =====================
+
+
+class EmbeddingIndex:
+    """Cosine similarity over OpenAI embeddings, cached on disk per dataset"""
+
+    def __init__(
+        self,
+        documents: List[str],
+        cache_dir: str,
+        model: str = "text-embedding-ada-002",
+        batch_size: int = 64,
+    ):
+        self.model = model
+        digest = hashlib.sha256(
+            (model + "\0" + "\0".join(documents)).encode("utf-8")
+        ).hexdigest()[:16]
+        cache_path = os.path.join(cache_dir, f"{digest}.npy")
+
+        if os.path.exists(cache_path):
+            self.vectors = np.load(cache_path)
+        else:
+            vectors = []
+            for start in range(0, len(documents), batch_size):
+                vectors.extend(self._embed(documents[start:start + batch_size]))
+            self.vectors = self._normalize(np.array(vectors, dtype=np.float32))
+            os.makedirs(cache_dir, exist_ok=True)
+            np.save(cache_path, self.vectors)
+
+    def _embed(self, texts: List[str]) -> List[List[float]]:
+        response = openai.Embedding.create(model=self.model, input=texts)
+        return [item["embedding"] for item in response["data"]]
+
+    async def _aembed(self, texts: List[str]) -> List[List[float]]:
+        response = await openai.Embedding.acreate(model=self.model, input=texts)
+        return [item["embedding"] for item in response["data"]]
+
+    @staticmethod
+    def _normalize(vectors: np.ndarray) -> np.ndarray:
+        norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
+
+    def _score_vector(self, embedding: List[float]) -> np.ndarray:
+        return self.vectors @ self._normalize(np.array(embedding, dtype=np.float32))
+
+    def score(self, query: str) -> np.ndarray:
+        return self._score_vector(self._embed([query])[0])
+
+    async def ascore(self, query: str) -> np.ndarray:
+        """score() without blocking the event loop on the embedding request"""
+        return self._score_vector((await self._aembed([query]))[0])
+
+
+# ===================== Dataset Index =====================
+
+
+class DatasetIndex:
+    """
+    Retrieval layer over a single agent dataset.
+
+    The dataset is chunked and indexed once at load; each query then returns
+    only the top-k relevant records instead of the whole dataset.
+    """
+
+    EMBEDDINGS_CACHE_DIR = os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), ".embeddings_cache"
+    )
+
+    def __init__(
+        self,
+        dataset: Any,
+        top_k: Optional[int] = None,
+        use_embeddings: Optional[bool] = None,
+    ):
+        if top_k is None:
+            top_k = int(os.environ.get("RETRIEVAL_TOP_K", 3))
+        if use_embeddings is None:
+            use_embeddings = os.environ.get("RETRIEVAL_EMBEDDINGS", "0") == "1"
+
+        self.top_k = top_k
+        self.chunks = chunk_dataset(dataset)
+        self.texts = [chunk_text(chunk) for chunk in self.chunks]
+        self.bm25 = BM25Index(self.texts)
+
+        self.embeddings = None
+        if use_embeddings:
+            try:
+                self.embeddings = EmbeddingIndex(self.texts, self.EMBEDDINGS_CACHE_DIR)
+            except Exception as e:
+                print(f"Embedding index unavailable, using BM25 only: {e}")
+
+    def search(self, query: str, top_k: Optional[int] = None) -> List[Any]:
+        """Return the most relevant chunks for `query`, best first"""
+        top_k = top_k or self.top_k
+        if len(self.chunks) <= top_k:
+            return self.chunks
+
+        scores = self._bm25_scores(query)
+        if self.embeddings is not None:
+            try:
+                scores = 0.5 * scores + 0.5 * self.embeddings.score(query)
+            except Exception as e:
+                print(f"Embedding search failed, using BM25 only: {e}")
+        return self._top(scores, top_k)
+
+    async def asearch(self, query: str, top_k: Optional[int] = None) -> List[Any]:
+        """search() for async callers; the query embedding is awaited, not blocking"""
+        top_k = top_k or self.top_k
+        if len(self.chunks) <= top_k:
+            return self.chunks
+
+        scores = self._bm25_scores(query)
+        if self.embeddings is not None:
+            try:
+                scores = 0.5 * scores + 0.5 * await self.embeddings.ascore(query)
+            except Exception as e:
+                print(f"Embedding search failed, using BM25 only: {e}")
+        return self._top(scores, top_k)
+
+    def _bm25_scores(self, query: str) -> np.ndarray:
+        scores = self.bm25.score(query)
+        if scores.max() > 0:
+            scores = scores / scores.max()
+        return scores
+
+    def _top(self, scores: np.ndarray, top_k: int) -> List[Any]:
+        if scores.max() <= 0:
+            # Nothing matched; the leading records are usually the overview
+            return self.chunks[:top_k]
+
+        best = np.argpartition(-scores, top_k - 1)[:top_k]
+        best = best[np.argsort(-scores[best], kind="stable")]
+        return [self.chunks[i] for i in best]
+
+    def format(self, chunks: List[Any]) -> str:
+        return "\n".join(chunk_text(chunk) for chunk in chunks)
@@ -0,0 +1,379 @@
+import asyncio
+import os
+import queue
+import shutil
+import subprocess
+import tempfile
+import threading
+from collections import deque
+from contextlib import contextmanager
+from io import BytesIO
+from typing import AsyncIterable, BinaryIO, Iterable, Iterator, List, Optional, Union
+
+import numpy as np
+import openai
+
+SAMPLE_RATE = 16000  # Whisper's input rate
+READ_CHUNK_SIZE = 64 * 1024
+
+AudioInput = Union[str, os.PathLike, bytes, bytearray, BinaryIO]
+
+
+class TranscriptionError(RuntimeError):
+    """Audio could not be turned into text (bad input, no speech or backend failure)"""
+
+
+def iter_audio_chunks(audio_file: AudioInput, chunk_size: int = READ_CHUNK_SIZE) -> Iterator[bytes]:
+    """Read a path, bytes or file object in chunks"""
+    if isinstance(audio_file, (str, os.PathLike)):
+        with open(audio_file, "rb") as f:
+            yield from iter(lambda: f.read(chunk_size), b"")
+    elif isinstance(audio_file, (bytes, bytearray)):
+        for start in range(0, len(audio_file), chunk_size):
+            yield bytes(audio_file[start:start + chunk_size])
+    else:
+        yield from iter(lambda: audio_file.read(chunk_size), b"")
+
+
+class NamedUpload:
+    """File object proxy that adds a `name` without copying the underlying data"""
+
+    def __init__(self, file: BinaryIO, name: str):
+        self._file = file
+        self.name = name
+
+    def __getattr__(self, attr):
+        return getattr(self._file, attr)
+
+
+class OpenAIWhisperBackend:
+    """Transcription with OpenAI's hosted whisper-1"""
+
+    model = "whisper-1"
+
+    @contextmanager
+    def _as_named_file(self, audio_file: AudioInput, filename: Optional[str] = None):
+        """
+        Yield a readable file object with a `.name` for the Whisper API
+
+        Paths are opened directly and file objects are passed through as is,
+        so the upload is never copied into memory or a second file. Only the
+        name is supplied when missing, since the API infers the format from
+        its extension.
+        """
+        if isinstance(audio_file, (str, os.PathLike)):
+            with open(audio_file, "rb") as f:
+                yield f
+            return
+        if isinstance(audio_file, (bytes, bytearray)):
+            audio_file = BytesIO(audio_file)
+        name = filename or getattr(audio_file, "name", None)
+        if not isinstance(name, str) or not os.path.splitext(name)[1]:
+            name = "audio.wav"
+        yield NamedUpload(audio_file, os.path.basename(name))
+
+    def transcribe(self, audio_file: AudioInput, filename: Optional[str] = None) -> str:
+        try:
+            with self._as_named_file(audio_file, filename) as audio:
+                transcript = openai.Audio.transcribe(model=self.model, file=audio)
+        except Exception as e:
+            raise TranscriptionError(f"Whisper API request failed: {str(e)[:500]}") from e
+        return transcript.text
+
+    async def atranscribe(self, audio_file: AudioInput, filename: Optional[str] = None) -> str:
+        try:
+            with self._as_named_file(audio_file, filename) as audio:
+                transcript = await openai.Audio.atranscribe(model=self.model, file=audio)
+        except Exception as e:
+            raise TranscriptionError(f"Whisper API request failed: {str(e)[:500]}") from e
+        return transcript.text
+
+    def transcribe_chunks(self, chunks: Iterable[bytes], filename: Optional[str] = None) -> str:
+        """The API needs the whole file, so chunks are spooled (to disk past 8 MB) first"""
+        with tempfile.SpooledTemporaryFile(max_size=8 * 2 ** 20) as spool:
+            for chunk in chunks:
+                spool.write(chunk)
+            spool.seek(0)
+            return self.transcribe(spool, filename)
+
+
+def decode_audio_stream(
+    chunks: Iterable[bytes],
+    sample_rate: int = SAMPLE_RATE,
+    block_seconds: float = 0.5,
+) -> Iterator[np.ndarray]:
+    """
+    Decode any container/codec ffmpeg understands to mono float32 PCM
+
+    Encoded chunks are fed to ffmpeg's stdin from a writer thread while PCM
+    blocks are yielded from its stdout, so decoding keeps pace with the
+    upload instead of waiting for it. Formats that need seeking (e.g. MP4
+    with the index at the end) fail with TranscriptionError.
+    """
+    proc = subprocess.Popen(
+        [
+            "ffmpeg", "-loglevel", "error", "-i", "pipe:0",
+            "-f", "s16le", "-ac", "1", "-ar", str(sample_rate), "pipe:1",
+        ],
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+    )
+    errors: List[BaseException] = []
+    stderr = bytearray()
+
+    def write():
+        try:
+            for chunk in chunks:
+                proc.stdin.write(chunk)
+        except BrokenPipeError:
+            pass  # ffmpeg gave up; its exit code and stderr say why
+        except BaseException as e:
+            errors.append(e)
+        finally:
+            try:
+                proc.stdin.close()
+            except BrokenPipeError:
+                pass
+
+    def drain_stderr():
+        stderr.extend(proc.stderr.read())
+
+    threads = [threading.Thread(target=write, daemon=True), threading.Thread(target=drain_stderr, daemon=True)]
+    for thread in threads:
+        thread.start()
+
+    block_bytes = int(sample_rate * block_seconds) * 2
+    try:
+        while True:
+            data = proc.stdout.read(block_bytes)
+            if not data:
+                break
+            data = data[: len(data) // 2 * 2]
+            yield np.frombuffer(data, dtype=np.int16).astype(np.float32) / 32768.0
+        proc.wait()
+        for thread in threads:
+            thread.join()
+        if errors:
+            raise TranscriptionError(f"Failed to read the audio upload: {errors[0]}") from errors[0]
+        if proc.returncode != 0:
+            detail = stderr.decode("utf-8", "replace").strip()[-500:]
+            raise TranscriptionError(f"Could not decode the audio: {detail}")
+    finally:
+        if proc.poll() is None:
+            proc.kill()
+            proc.wait()
+
+
+class EnergyVAD:
+    """
+    Energy-based voice activity detection that cuts PCM into utterances
+
+    A frame is speech when its RMS is above `threshold`. An utterance ends
+    after `min_silence_ms` of silence or at `max_segment_seconds` (Whisper
+    sees at most 30 s at a time), keeps `padding_ms` of audio on both
+    sides, and is dropped if it has less than `min_speech_ms` of speech.
+    """
+
+    def __init__(
+        self,
+        sample_rate: int = SAMPLE_RATE,
+        threshold: Optional[float] = None,
+        frame_ms: int = 30,
+        min_silence_ms: int = 600,
+        min_speech_ms: int = 250,
+        padding_ms: int = 200,
+        max_segment_seconds: float = 25.0,
+    ):
+        if threshold is None:
+            threshold = float(os.environ.get("STT_VAD_THRESHOLD", 0.01))
+        self.threshold = threshold
+        self.frame_size = sample_rate * frame_ms // 1000
+        self.min_silence_frames = max(1, min_silence_ms // frame_ms)
+        self.min_speech_frames = max(1, min_speech_ms // frame_ms)
+        self.padding_frames = padding_ms // frame_ms
+        self.max_segment_frames = int(max_segment_seconds * 1000 // frame_ms)
+
+    def segments(self, blocks: Iterable[np.ndarray]) -> Iterator[np.ndarray]:
+        """Yield each utterance as soon as it ends"""
+        leftover = np.zeros(0, dtype=np.float32)
+        padding = deque(maxlen=self.padding_frames or 1)
+        current: List[np.ndarray] = []
+        speech_frames = silence_run = 0
+
+        def finish():
+            segment = np.concatenate(current) if speech_frames >= self.min_speech_frames else None
+            current.clear()
+            return segment
+
+        for block in blocks:
+            samples = np.concatenate([leftover, block])
+            count = len(samples) // self.frame_size
+            leftover = samples[count * self.frame_size:]
+            if not count:
+                continue
+            frames = samples[: count * self.frame_size].reshape(count, self.frame_size)
+            voiced = np.sqrt(np.mean(frames ** 2, axis=1)) > self.threshold
+
+            for frame, is_speech in zip(frames, voiced):
+                if not current:
+                    if not is_speech:
+                        if self.padding_frames:
+                            padding.append(frame)
+                        continue
+                    current.extend(padding)
+                    padding.clear()
+                    speech_frames = silence_run = 0
+
+                current.append(frame)
+                if is_speech:
+                    speech_frames += 1
+                    silence_run = 0
+                else:
+                    silence_run += 1
+
+                trailing = max(0, silence_run - self.padding_frames)
+                if silence_run >= self.min_silence_frames or len(current) >= self.max_segment_frames:
+                    if trailing:
+                        del current[-trailing:]
+                    segment = finish()
+                    if segment is not None:
+                        yield segment
+
+        if current:
+            segment = finish()
+            if segment is not None:
+                yield segment
+
+
+class LocalWhisperBackend:
+    """
+    On-device Whisper with transformers, loaded once and kept warm
+
+    Uploads are decoded by ffmpeg as they arrive, split into utterances by
+    EnergyVAD, and each utterance is transcribed as soon as it ends, so the
+    first words are being decoded while the rest of the audio is still
+    uploading. Inference is serialized with a lock: one request at a time
+    gets all of the CPU threads.
+    """
+
+    def __init__(
+        self,
+        model_name: Optional[str] = None,
+        int8: Optional[bool] = None,
+        language: Optional[str] = None,
+        vad: Optional[EnergyVAD] = None,
+    ):
+        import torch
+        from transformers import WhisperForConditionalGeneration, WhisperProcessor
+
+        if model_name is None:
+            model_name = os.environ.get("STT_MODEL", "openai/whisper-base")
+        if int8 is None:
+            int8 = os.environ.get("STT_INT8", "0") == "1"
+        if language is None:
+            language = os.environ.get("STT_LANGUAGE") or None
+        if shutil.which("ffmpeg") is None:
+            raise RuntimeError("The local speech-to-text backend needs ffmpeg on PATH")
+
+        self.torch = torch
+        self.processor = WhisperProcessor.from_pretrained(model_name)
+        self.model = WhisperForConditionalGeneration.from_pretrained(model_name).eval()
+        if int8:
+            # Dynamic int8 quantization of every Linear layer
+            self.model = torch.quantization.quantize_dynamic(
+                self.model, {torch.nn.Linear}, dtype=torch.qint8
+            )
+        self.generate_kwargs = {"task": "transcribe"}
+        if language:
+            self.generate_kwargs["language"] = language
+        self.vad = vad or EnergyVAD()
+        self._lock = threading.Lock()
+
+        # Warm up so the first request doesn't pay for lazy initialization
+        self.transcribe_pcm(np.zeros(SAMPLE_RATE, dtype=np.float32))
+
+    def transcribe_pcm(self, samples: np.ndarray) -> str:
+        """Transcribe one utterance of 16 kHz mono float32 PCM"""
+        inputs = self.processor(samples, sampling_rate=SAMPLE_RATE, return_tensors="pt")
+        with self._lock, self.torch.inference_mode():
+            ids = self.model.generate(inputs.input_features, **self.generate_kwargs)
+        return self.processor.batch_decode(ids, skip_special_tokens=True)[0].strip()
+
+    def transcribe_chunks(self, chunks: Iterable[bytes], filename: Optional[str] = None) -> str:
+        texts = [
+            self.transcribe_pcm(segment)
+            for segment in self.vad.segments(decode_audio_stream(chunks))
+        ]
+        text = " ".join(t for t in texts if t)
+        if not text:
+            raise TranscriptionError("No speech detected in the audio")
+        return text
+
+    def transcribe(self, audio_file: AudioInput, filename: Optional[str] = None) -> str:
+        return self.transcribe_chunks(iter_audio_chunks(audio_file), filename)
+
+    async def atranscribe(self, audio_file: AudioInput, filename: Optional[str] = None) -> str:
+        return await asyncio.to_thread(self.transcribe, audio_file, filename)
+
+
+STT_BACKENDS = {
+    "openai": OpenAIWhisperBackend,
+    "local": LocalWhisperBackend,
+}
+
+
+def create_stt_backend(name: Optional[str] = None):
+    """The speech-to-text backend selected by STT_BACKEND (openai or local; default openai)"""
+    name = (name or os.environ.get("STT_BACKEND", "openai")).lower()
+    if name not in STT_BACKENDS:
+        raise ValueError(f"Unknown STT_BACKEND: {name}")
+    return STT_BACKENDS[name]()
+
+
+async def atranscribe_chunks(backend, chunks: AsyncIterable[bytes], filename: Optional[str] = None) -> str:
+    """
+    Transcribe an async stream of encoded audio (e.g. a request body)
+
+    The backend runs in a worker thread and pulls chunks through a small
+    bounded queue, so it starts on the first chunk and back-pressure
+    reaches the client if transcription falls behind.
+    """
+    loop = asyncio.get_running_loop()
+    pending: "queue.Queue[Optional[bytes]]" = queue.Queue(maxsize=16)
+    stop = threading.Event()
+
+    def iter_pending() -> Iterator[bytes]:
+        while True:
+            chunk = pending.get()
+            if chunk is None:
+                return
+            yield chunk
+
+    def run() -> str:
+        try:
+            return backend.transcribe_chunks(iter_pending(), filename)
+        finally:
+            stop.set()
+            # Unblock the producer if the backend stopped reading early
+            while not pending.empty():
+                pending.get_nowait()
+
+    def put(chunk: Optional[bytes]):
+        while not stop.is_set():
+            try:
+                pending.put(chunk, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    task = asyncio.ensure_future(asyncio.to_thread(run))
+    try:
+        async for chunk in chunks:
+            if task.done():
+                break
+            if chunk:
+                await loop.run_in_executor(None, put, chunk)
+    finally:
+        await loop.run_in_executor(None, put, None)
+    return await task
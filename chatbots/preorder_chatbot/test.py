@@ -9,6 +9,8 @@ API_KEY = ""
 
 def run_chatbot():
     bot = PreorderAgent()
+    memory = []
+    order_intent = None
 
     print("🤖 Welcome to the Multi-Agent Chatbot!")
     print("Type 'exit' to quit.\n")
@@ -19,7 +21,11 @@ def run_chatbot():
             print("👋 Goodbye!")
             break
 
-        result = bot.process_order(user_input, memory_input=[])
+        result = bot.process_order(
+            user_input, memory_input=memory, order_intent=order_intent
+        )
+        memory = result["memory"]
+        order_intent = result["order_intent"]
         print(f"\n📦 Category: {result['category']}")
         print(f"🤖 Bot: {result['response']}\n")
 
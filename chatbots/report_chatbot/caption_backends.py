@@ -0,0 +1,139 @@
+import os
+from typing import Any, Dict, Optional, Tuple
+
+import torch
+from transformers import BlipForConditionalGeneration, BlipProcessor
+from transformers.modeling_outputs import BaseModelOutputWithPooling
+
+MODEL_NAME = "Salesforce/blip-image-captioning-base"
+BACKENDS = ("fp32", "int8", "onnx")
+
+# BLIP base is trained at 384x384; smaller inputs need position interpolation
+NATIVE_IMAGE_SIZE = 384
+
+
+class OnnxVisionEncoder(torch.nn.Module):
+    """Drop-in for BLIP's vision model that runs the exported encoder with ONNX Runtime"""
+
+    def __init__(self, session):
+        super().__init__()
+        self.session = session
+        self.input_name = session.get_inputs()[0].name
+
+    def forward(self, pixel_values, **kwargs):
+        (hidden_states,) = self.session.run(None, {self.input_name: pixel_values.cpu().numpy()})
+        hidden_states = torch.from_numpy(hidden_states)
+        return BaseModelOutputWithPooling(
+            last_hidden_state=hidden_states,
+            pooler_output=hidden_states[:, 0, :],
+        )
+
+
+def quantize_int8(model):
+    """Dynamic int8 quantization of every Linear layer (weights int8, activations quantized on the fly)"""
+    # In place: the ONNX backend's encoder holds a runtime session that cannot be deep-copied
+    return torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+
+
+def export_vision_encoder(model, path: str, image_size: int):
+    """Export BLIP's vision encoder to ONNX once; later loads reuse the file"""
+    if os.path.exists(path):
+        return
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    class Encoder(torch.nn.Module):
+        def __init__(self, vision_model):
+            super().__init__()
+            self.vision_model = vision_model
+
+        def forward(self, pixel_values):
+            return self.vision_model(
+                pixel_values=pixel_values,
+                interpolate_pos_encoding=image_size != NATIVE_IMAGE_SIZE,
+            )[0]
+
+    dummy = torch.zeros(1, 3, image_size, image_size)
+    with torch.no_grad():
+        torch.onnx.export(
+            Encoder(model.vision_model),
+            (dummy,),
+            path,
+            input_names=["pixel_values"],
+            output_names=["last_hidden_state"],
+            dynamic_axes={"pixel_values": {0: "batch"}, "last_hidden_state": {0: "batch"}},
+            opset_version=17,
+        )
+
+
+def load_onnx_vision_encoder(model, image_size: int, threads: Optional[int]) -> OnnxVisionEncoder:
+    import onnxruntime as ort
+
+    cache_dir = os.environ.get(
+        "CAPTION_ONNX_DIR",
+        os.path.join(os.path.dirname(os.path.abspath(__file__)), ".onnx_cache"),
+    )
+    path = os.path.join(cache_dir, f"blip_vision_{image_size}.onnx")
+    export_vision_encoder(model, path, image_size)
+
+    options = ort.SessionOptions()
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    if threads:
+        options.intra_op_num_threads = threads
+    session = ort.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+    return OnnxVisionEncoder(session)
+
+
+def load_caption_model(
+    backend: Optional[str] = None,
+    max_tokens: Optional[int] = None,
+    image_size: Optional[int] = None,
+) -> Tuple[Any, Any, Dict[str, Any]]:
+    """
+    Load the BLIP captioner for the selected CPU backend
+
+    Backends:
+        fp32: the model as published
+        int8: dynamic int8 quantization of all Linear layers
+        onnx: vision encoder exported to ONNX and run by ONNX Runtime, with
+            the int8-quantized text decoder in PyTorch
+
+    Args:
+        backend: One of BACKENDS (default CAPTION_BACKEND, "fp32")
+        max_tokens: Longest caption in tokens (default CAPTION_MAX_TOKENS, 20)
+        image_size: Input resolution in pixels (default CAPTION_IMAGE_SIZE, 384);
+            smaller is faster but needs interpolated position embeddings
+
+    Returns:
+        (processor, model, generate_kwargs) for CaptionService
+    """
+    if backend is None:
+        backend = os.environ.get("CAPTION_BACKEND", "fp32").lower()
+    if max_tokens is None:
+        max_tokens = int(os.environ.get("CAPTION_MAX_TOKENS", 20))
+    if image_size is None:
+        image_size = int(os.environ.get("CAPTION_IMAGE_SIZE", NATIVE_IMAGE_SIZE))
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown CAPTION_BACKEND: {backend}")
+    threads = int(os.environ["CAPTION_THREADS"]) if os.environ.get("CAPTION_THREADS") else None
+
+    processor = BlipProcessor.from_pretrained(MODEL_NAME)
+    model = BlipForConditionalGeneration.from_pretrained(MODEL_NAME).eval()
+
+    generate_kwargs: Dict[str, Any] = {"max_new_tokens": max_tokens, "num_beams": 1}
+    if image_size != NATIVE_IMAGE_SIZE:
+        processor.image_processor.size = {"height": image_size, "width": image_size}
+        generate_kwargs["interpolate_pos_encoding"] = True
+
+    if backend == "int8":
+        model = quantize_int8(model)
+    elif backend == "onnx":
+        try:
+            vision_encoder = load_onnx_vision_encoder(model, image_size, threads)
+        except ImportError:
+            print("onnxruntime is not installed; using the int8 backend instead")
+        else:
+            model.vision_model = vision_encoder
+            generate_kwargs.pop("interpolate_pos_encoding", None)  # baked into the export
+        model = quantize_int8(model)
+
+    return processor, model, generate_kwargs
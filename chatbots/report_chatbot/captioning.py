@@ -0,0 +1,147 @@
+import asyncio
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Dict, List, Optional, Tuple
+
+from PIL import Image
+
+
+class CaptionServiceBusy(RuntimeError):
+    """Raised when the caption queue stays full for longer than the submit timeout"""
+
+
+class CaptionService:
+    """
+    Micro-batching image captioning worker.
+
+    Requests go into a bounded queue. A single worker thread takes the first
+    waiting image, gathers more for up to `max_wait_ms` (or until
+    `max_batch_size`), and captions the whole batch in one `generate` call
+    under `torch.inference_mode()`. When the queue is full, submit() waits
+    up to `submit_timeout` seconds and then raises CaptionServiceBusy, so
+    overload pushes back on callers instead of growing memory; acaption()
+    raises it at once rather than block the event loop.
+    """
+
+    def __init__(
+        self,
+        processor,
+        model,
+        max_batch_size: Optional[int] = None,
+        max_wait_ms: Optional[float] = None,
+        max_queue: Optional[int] = None,
+        submit_timeout: float = 5.0,
+        threads: Optional[int] = None,
+        generate_kwargs: Optional[Dict[str, Any]] = None,
+        warmup: bool = True,
+    ):
+        if max_batch_size is None:
+            max_batch_size = int(os.environ.get("CAPTION_MAX_BATCH", 8))
+        if max_wait_ms is None:
+            max_wait_ms = float(os.environ.get("CAPTION_MAX_WAIT_MS", 10))
+        if max_queue is None:
+            max_queue = int(os.environ.get("CAPTION_QUEUE_SIZE", 64))
+        if threads is None and os.environ.get("CAPTION_THREADS"):
+            threads = int(os.environ["CAPTION_THREADS"])
+
+        self.processor = processor
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.submit_timeout = submit_timeout
+        self.generate_kwargs = generate_kwargs or {}
+        # Imported here so callers can catch CaptionServiceBusy without torch
+        import torch
+
+        self.torch = torch
+        if threads:
+            torch.set_num_threads(threads)
+
+        self.model.eval()
+        self._queue: "queue.Queue[Optional[Tuple[Image.Image, Future]]]" = queue.Queue(maxsize=max_queue)
+        self._stats_lock = threading.Lock()
+        self.batches = 0
+        self.images = 0
+
+        if warmup:
+            # First generate call pays for lazy initialization; do it before serving
+            self._caption_batch([Image.new("RGB", (64, 64))])
+
+        self._worker = threading.Thread(target=self._run, name="caption-worker", daemon=True)
+        self._worker.start()
+
+    def submit(self, image: Image.Image, block: bool = True) -> Future:
+        """Queue an image; the returned future resolves to its caption"""
+        future: Future = Future()
+        try:
+            if block:
+                self._queue.put((image, future), timeout=self.submit_timeout)
+            else:
+                self._queue.put_nowait((image, future))
+        except queue.Full:
+            raise CaptionServiceBusy("Caption queue is full")
+        return future
+
+    def caption(self, image: Image.Image, timeout: Optional[float] = None) -> str:
+        return self.submit(image).result(timeout)
+
+    async def acaption(self, image: Image.Image) -> str:
+        return await asyncio.wrap_future(self.submit(image, block=False))
+
+    def close(self):
+        self._queue.put(None)
+        self._worker.join()
+
+    def _caption_batch(self, images: List[Image.Image]) -> List[str]:
+        with self.torch.inference_mode():
+            inputs = self.processor(images=images, return_tensors="pt")
+            out = self.model.generate(**inputs, **self.generate_kwargs)
+        return self.processor.batch_decode(out, skip_special_tokens=True)
+
+    def _collect(self, first) -> Tuple[List[Tuple[Image.Image, Future]], bool]:
+        """Gather a batch starting with `first`; also reports whether close() was called"""
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def _run(self):
+        stop = False
+        while not stop:
+            item = self._queue.get()
+            if item is None:
+                return
+            batch, stop = self._collect(item)
+            batch = [(image, future) for image, future in batch if future.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            try:
+                captions = self._caption_batch([image for image, _ in batch])
+                for (_, future), caption in zip(batch, captions):
+                    future.set_result(caption.strip())
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+            with self._stats_lock:
+                self.batches += 1
+                self.images += len(batch)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            return {
+                "queued": self._queue.qsize(),
+                "batches": self.batches,
+                "images": self.images,
+                "mean_batch_size": self.images / self.batches if self.batches else 0.0,
+            }
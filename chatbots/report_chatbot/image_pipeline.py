@@ -0,0 +1,96 @@
+import asyncio
+import base64
+import binascii
+import io
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Union
+
+from PIL import Image, ImageOps
+
+ALLOWED_FORMATS = {"JPEG", "PNG", "WEBP", "MPO"}  # MPO: some phone cameras' JPEGs
+
+
+class ImageRejected(ValueError):
+    """The upload is too large, too many pixels or not a supported image"""
+
+
+class ImageTooLarge(ImageRejected):
+    """The upload is over the byte or pixel limit"""
+
+
+class ImagePipeline:
+    """
+    Turns uploaded report photos into captioner-sized RGB images.
+
+    Limits are checked before any pixel is decoded: the encoded size
+    against `max_bytes` and the header's dimensions against `max_pixels`.
+    JPEGs are then decoded with PIL's draft mode, which lets libjpeg scale
+    by 1/2, 1/4 or 1/8 during decoding, so a 12 MP phone photo is decoded
+    at about 1 MP instead of being fully decoded and thrown away by the
+    captioner's resize. The result is downscaled so its shorter side is
+    `target_size`. Decoding runs on a bounded thread pool.
+    """
+
+    def __init__(
+        self,
+        target_size: int = 384,
+        max_bytes: Optional[int] = None,
+        max_pixels: Optional[int] = None,
+        workers: int = 2,
+    ):
+        if max_bytes is None:
+            max_bytes = int(float(os.environ.get("IMAGE_MAX_MB", 15)) * 2 ** 20)
+        if max_pixels is None:
+            max_pixels = int(float(os.environ.get("IMAGE_MAX_MEGAPIXELS", 50)) * 10 ** 6)
+        self.target_size = target_size
+        self.max_bytes = max_bytes
+        self.max_pixels = max_pixels
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="image")
+
+    @property
+    def max_base64_chars(self) -> int:
+        """Longest base64 string (plus a data URL prefix) that can hold max_bytes"""
+        return (self.max_bytes + 2) // 3 * 4 + 100
+
+    def decode_base64(self, image_data: str) -> bytes:
+        # Remove data URL prefix if present
+        if "base64," in image_data:
+            image_data = image_data.split("base64,", 1)[1]
+        if len(image_data) > self.max_base64_chars:
+            raise ImageTooLarge(f"Image is larger than {self.max_bytes} bytes")
+        try:
+            return base64.b64decode(image_data)
+        except (binascii.Error, ValueError) as e:
+            raise ImageRejected(f"Invalid base64 image data: {e}")
+
+    def prepare(self, image: Union[str, bytes]) -> Image.Image:
+        """Decode a base64 string or raw bytes to a downscaled RGB image"""
+        data = self.decode_base64(image) if isinstance(image, str) else image
+        if len(data) > self.max_bytes:
+            raise ImageTooLarge(f"Image is larger than {self.max_bytes} bytes")
+
+        try:
+            img = Image.open(io.BytesIO(data))
+        except (Image.UnidentifiedImageError, OSError) as e:
+            raise ImageRejected(f"Unsupported image: {e}")
+        if img.format not in ALLOWED_FORMATS:
+            raise ImageRejected(f"Unsupported image format: {img.format}")
+        width, height = img.size
+        if width * height > self.max_pixels:
+            raise ImageTooLarge(f"Image has too many pixels ({width}x{height})")
+
+        # Only JPEG honours draft(); it keeps both sides >= the requested size
+        img.draft("RGB", (self.target_size, self.target_size))
+        img = ImageOps.exif_transpose(img).convert("RGB")
+
+        scale = self.target_size / min(img.size)
+        if scale < 1:
+            size = (max(1, round(img.width * scale)), max(1, round(img.height * scale)))
+            img = img.resize(size, Image.BICUBIC, reducing_gap=3.0)
+        return img
+
+    async def aprepare(self, image: Union[str, bytes]) -> Image.Image:
+        """prepare() on the pipeline's thread pool"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, self.prepare, image)
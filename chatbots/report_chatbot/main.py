@@ -1,31 +1,50 @@
 # File: report_chatbot/main.py
 
+import asyncio
 import openai
-import json
 import datetime
 import os
-import base64
-import io
+import threading
+import uuid
 from PIL import Image
-from transformers import BlipProcessor, BlipForConditionalGeneration
 from typing import List, Dict, Optional, Any, Union
 
+try:
+    from .captioning import CaptionServiceBusy
+    from .image_pipeline import ImagePipeline, ImageRejected
+    from .report_store import create_report_store
+    from .triage import TriageQueue
+except ImportError:  # running from inside report_chatbot/
+    from captioning import CaptionServiceBusy
+    from image_pipeline import ImagePipeline, ImageRejected
+    from report_store import create_report_store
+    from triage import TriageQueue
+
 
 class EmergencyReportingBot:
+    ERROR_RESPONSE = "عذراً، حدث خطأ في معالجة طلبك. حاول مرة أخرى لاحقاً. (Sorry, there was an error processing your request. Please try again later.)"
+
     def __init__(self):
         """Initialize the Emergency Reporting Bot"""
-        # Initialize image captioning model
-        self.processor = BlipProcessor.from_pretrained(
-            "Salesforce/blip-image-captioning-base"
-        )
-        self.image_model = BlipForConditionalGeneration.from_pretrained(
-            "Salesforce/blip-image-captioning-base"
+        # BLIP is loaded on the first image (or by warm_up()), so starting
+        # the bot doesn't import torch or read model weights
+        self._captioner = None
+        self._captioner_lock = threading.Lock()
+
+        # Size limits and reduced decoding straight to the captioner's input
+        # size, on a bounded pool so the async request path never decodes
+        # on the event loop
+        self.images = ImagePipeline(
+            target_size=int(os.environ.get("CAPTION_IMAGE_SIZE", 384)),  # BLIP's native size
+            workers=int(os.environ.get("BLIP_WORKERS", 2)),
         )
 
-        # Create reports directory if it doesn't exist
-        current_path = os.path.dirname(os.path.abspath(__file__))
-        self.reports_dir = os.path.join(current_path, "reports")
-        os.makedirs(self.reports_dir, exist_ok=True)
+        # Incident store: one record per incident, one appended row per turn
+        self.reports = create_report_store()
+        # Incident key for callers that don't track sessions (e.g. the CLI)
+        self.default_session_id = uuid.uuid4().hex
+        # Ranked, deduplicated view of active incidents for responders
+        self.triage = TriageQueue()
 
         # Define system prompt
         self.system_prompt = """
@@ -51,27 +70,55 @@ class EmergencyReportingBot:
         When location is provided, confirm receipt of the report with a message like "Your report has been sent. Stay safe" (تم ارسال البلاغ دمتم بسلام).
         """
 
-    def decode_image(self, image_data: str) -> Optional[Image.Image]:
-        """Decode base64 image data to PIL Image"""
+    @property
+    def loaded(self) -> bool:
+        return self._captioner is not None
+
+    @property
+    def captioner(self):
+        """Micro-batching BLIP worker shared by all requests, created on first use"""
+        if self._captioner is None:
+            with self._captioner_lock:
+                if self._captioner is None:
+                    self._captioner = self._load_captioner()
+        return self._captioner
+
+    def _load_captioner(self):
         try:
-            # Remove data URL prefix if present
-            if "base64," in image_data:
-                image_data = image_data.split("base64,")[1]
+            from .caption_backends import load_caption_model
+            from .captioning import CaptionService
+        except ImportError:  # running from inside report_chatbot/
+            from caption_backends import load_caption_model
+            from captioning import CaptionService
 
-            image_bytes = base64.b64decode(image_data)
-            image = Image.open(io.BytesIO(image_bytes)).convert("RGB")
-            return image
+        # Image captioning model on the backend chosen by CAPTION_BACKEND
+        processor, model, generate_kwargs = load_caption_model()
+        return CaptionService(processor, model, generate_kwargs=generate_kwargs)
+
+    def warm_up(self):
+        """Load the captioning model now instead of on the first image"""
+        return self.captioner
+
+    def decode_image(self, image_data: Union[str, bytes]) -> Optional[Image.Image]:
+        """
+        Decode base64 or raw image bytes to a captioner-sized PIL Image.
+
+        Raises ImageRejected for uploads that are too large or not a
+        supported image, so callers can tell the user; returns None if an
+        accepted image still fails to decode.
+        """
+        try:
+            return self.images.prepare(image_data)
+        except ImageRejected:
+            raise
         except Exception as e:
             print(f"Error decoding image: {str(e)}")
             return None
 
     def analyze_image(self, image: Image.Image) -> str:
-        """Analyze image using BLIP model"""
+        """Analyze image using BLIP model, batched with concurrent requests"""
         try:
-            inputs = self.processor(image, return_tensors="pt")
-            out = self.image_model.generate(**inputs)
-            caption = self.processor.decode(out[0], skip_special_tokens=True)
-            return caption
+            return self.captioner.caption(image)
         except Exception as e:
             print(f"Error analyzing image: {str(e)}")
             return "Unable to analyze the image content."
@@ -87,35 +134,171 @@ class EmergencyReportingBot:
             return response["choices"][0]["message"]["content"]
         except Exception as e:
             print(f"Error generating response: {str(e)}")
-            return "عذراً، حدث خطأ في معالجة طلبك. حاول مرة أخرى لاحقاً. (Sorry, there was an error processing your request. Please try again later.)"
+            return self.ERROR_RESPONSE
 
-    def save_report(self, data: Dict[str, Any]) -> str:
-        """Save report to JSON file"""
-        timestamp = datetime.datetime.now().isoformat().replace(":", "-")
-        report_path = os.path.join(self.reports_dir, f"report_{timestamp}.json")
-
-        with open(report_path, "w", encoding="utf-8") as f:
-            json.dump(data, f, ensure_ascii=False, indent=4)
+    async def agenerate_response(self, conversation: List[Dict[str, str]]) -> str:
+        """Generate response using GPT model without blocking the event loop"""
+        try:
+            response = await openai.ChatCompletion.acreate(
+                model="gpt-4",
+                messages=conversation,
+                temperature=0.7,
+            )
+            return response["choices"][0]["message"]["content"]
+        except Exception as e:
+            print(f"Error generating response: {str(e)}")
+            return self.ERROR_RESPONSE
 
-        return report_path
+    def save_report(self, data: Dict[str, Any], session_id: Optional[str] = None) -> str:
+        """Append this turn to the session's open incident, queue it for triage and return the incident id"""
+        session_id = session_id or self.default_session_id
+        incident_id = self.reports.record_turn(session_id, data)
+        self.triage.add(session_id, incident_id, data.get("user_message"), data.get("image_caption"))
+        return incident_id
 
     def process_message(
         self,
         message: str,
-        image_data: Optional[str] = None,
+        image_data: Optional[Union[str, bytes]] = None,
         conversation_history: List[Dict[str, str]] = None,
+        session_id: Optional[str] = None,
     ) -> Dict[str, Any]:
         """
         Process incoming message and generate a response
 
         Args:
             message: User's text message
-            image_data: Optional base64 encoded image data
+            image_data: Optional image, base64 encoded or raw bytes
             conversation_history: Previous conversation history
+            session_id: Chat session the incident belongs to
 
         Returns:
             Dictionary containing the response and updated conversation
         """
+        full_conversation = self._start_conversation(message, conversation_history)
+
+        # Process image if provided
+        image_caption = None
+        if image_data:
+            image = self.decode_image(image_data)
+            if image:
+                image_caption = self.analyze_image(image)
+                self._add_image_caption(full_conversation, image_caption)
+
+        # Generate AI response
+        ai_response = self.generate_response(full_conversation)
+
+        report_data = self._finish_conversation(
+            full_conversation, message, image_data, image_caption, ai_response
+        )
+
+        # Save report
+        incident_id = self.save_report(report_data, session_id)
+
+        return self._build_result(full_conversation, ai_response, incident_id)
+
+    async def aprocess_message(
+        self,
+        message: str,
+        image_data: Optional[Union[str, bytes]] = None,
+        conversation_history: List[Dict[str, str]] = None,
+        session_id: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        """
+        Async variant of process_message.
+
+        Image decoding and BLIP inference run on the bot's bounded thread pool,
+        the LLM call uses the async OpenAI client and the report is written
+        off the event loop.
+        """
+        loop = asyncio.get_running_loop()
+        full_conversation = self._start_conversation(message, conversation_history)
+
+        image_caption = await self._acaption_image(image_data)
+        if image_caption:
+            self._add_image_caption(full_conversation, image_caption)
+
+        ai_response = await self.agenerate_response(full_conversation)
+
+        report_data = self._finish_conversation(
+            full_conversation, message, image_data, image_caption, ai_response
+        )
+        incident_id = await loop.run_in_executor(None, self.save_report, report_data, session_id)
+
+        return self._build_result(full_conversation, ai_response, incident_id)
+
+    async def astream_message(
+        self,
+        message: str,
+        image_data: Optional[Union[str, bytes]] = None,
+        conversation_history: List[Dict[str, str]] = None,
+        session_id: Optional[str] = None,
+    ):
+        """
+        Streaming variant of aprocess_message.
+
+        Yields {"type": "token", "content": ...} events as the reply is
+        generated, then {"type": "done", "result": ...} once the report has
+        been saved.
+        """
+        loop = asyncio.get_running_loop()
+        full_conversation = self._start_conversation(message, conversation_history)
+
+        image_caption = await self._acaption_image(image_data)
+        if image_caption:
+            self._add_image_caption(full_conversation, image_caption)
+
+        parts = []
+        try:
+            response = await openai.ChatCompletion.acreate(
+                model="gpt-4",
+                messages=full_conversation,
+                temperature=0.7,
+                stream=True,
+            )
+            async for chunk in response:
+                content = chunk["choices"][0]["delta"].get("content")
+                if content:
+                    parts.append(content)
+                    yield {"type": "token", "content": content}
+        except Exception as e:
+            print(f"Error generating response: {str(e)}")
+            parts = [self.ERROR_RESPONSE]
+            yield {"type": "token", "content": self.ERROR_RESPONSE}
+        ai_response = "".join(parts)
+
+        report_data = self._finish_conversation(
+            full_conversation, message, image_data, image_caption, ai_response
+        )
+        incident_id = await loop.run_in_executor(None, self.save_report, report_data, session_id)
+
+        yield {
+            "type": "done",
+            "result": self._build_result(full_conversation, ai_response, incident_id),
+        }
+
+    async def _acaption_image(self, image_data: Optional[Union[str, bytes]]) -> Optional[str]:
+        """Decode an image on the bot's thread pool and caption it with the batching worker"""
+        if not image_data:
+            return None
+        loop = asyncio.get_running_loop()
+        image = await loop.run_in_executor(self.images.executor, self.decode_image, image_data)
+        if image is None:
+            return None
+        try:
+            # Loading the model on first use must not block the event loop
+            captioner = self._captioner or await loop.run_in_executor(None, self.warm_up)
+            return await captioner.acaption(image)
+        except CaptionServiceBusy:
+            raise
+        except Exception as e:
+            print(f"Error analyzing image: {str(e)}")
+            return "Unable to analyze the image content."
+
+    def _start_conversation(
+        self, message: str, conversation_history: Optional[List[Dict[str, str]]]
+    ) -> List[Dict[str, str]]:
+        """Build the message list sent to the model for this turn"""
         # Initialize conversation if not provided
         if conversation_history is None:
             conversation_history = []
@@ -128,47 +311,46 @@ class EmergencyReportingBot:
         if message:
             full_conversation.append({"role": "user", "content": message})
 
-        # Process image if provided
-        image_caption = None
-        if image_data:
-            image = self.decode_image(image_data)
-            if image:
-                image_caption = self.analyze_image(image)
-                # Add image description to conversation
-                full_conversation.append(
-                    {
-                        "role": "user",
-                        "content": f"[Image uploaded] Description: {image_caption}",
-                    }
-                )
+        return full_conversation
 
-        # Generate AI response
-        ai_response = self.generate_response(full_conversation)
+    def _add_image_caption(self, full_conversation: List[Dict[str, str]], image_caption: str):
+        """Add image description to conversation"""
+        full_conversation.append(
+            {
+                "role": "user",
+                "content": f"[Image uploaded] Description: {image_caption}",
+            }
+        )
 
+    def _finish_conversation(
+        self,
+        full_conversation: List[Dict[str, str]],
+        message: str,
+        image_data: Optional[Union[str, bytes]],
+        image_caption: Optional[str],
+        ai_response: str,
+    ) -> Dict[str, Any]:
+        """Append the AI response and build the report record for this turn"""
         # Add AI response to conversation
         full_conversation.append({"role": "assistant", "content": ai_response})
 
         # Create report data
-        report_data = {
+        return {
             "timestamp": datetime.datetime.now().isoformat(),
             "user_message": message,
             "image_provided": bool(image_data),
             "image_caption": image_caption,
             "ai_response": ai_response,
-            "conversation": full_conversation[
-                1:
-            ],  # Exclude system prompt from saved conversation
         }
 
-        # Save report
-        report_path = self.save_report(report_data)
-
-        # Return response
+    def _build_result(
+        self, full_conversation: List[Dict[str, str]], ai_response: str, incident_id: str
+    ) -> Dict[str, Any]:
         return {
             "response": ai_response,
             "conversation": full_conversation[
                 1:
             ],  # Return conversation without system prompt
             "report_saved": True,
-            "report_path": report_path,
+            "incident_id": incident_id,
         }
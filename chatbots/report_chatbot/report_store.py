@@ -0,0 +1,153 @@
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+
+
+class ReportStore:
+    """SQLite (WAL) store of emergency incidents.
+
+    Each chat session has at most one open incident. Every turn appends one
+    row with only that turn's messages, so a write costs O(turn size)
+    instead of rewriting the whole conversation. Incidents are indexed by
+    status, time and session for operator queries.
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS incidents (
+                incident_id TEXT PRIMARY KEY,
+                session_id TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'open',
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL,
+                turn_count INTEGER NOT NULL DEFAULT 0,
+                image_provided INTEGER NOT NULL DEFAULT 0,
+                last_message TEXT
+            );
+            CREATE TABLE IF NOT EXISTS turns (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                incident_id TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                user_message TEXT,
+                image_provided INTEGER NOT NULL,
+                image_caption TEXT,
+                ai_response TEXT
+            );
+            CREATE INDEX IF NOT EXISTS idx_incidents_status_updated ON incidents (status, updated_at);
+            CREATE INDEX IF NOT EXISTS idx_incidents_created ON incidents (created_at);
+            CREATE INDEX IF NOT EXISTS idx_incidents_session ON incidents (session_id, status);
+            CREATE INDEX IF NOT EXISTS idx_turns_incident ON turns (incident_id, id);
+            """
+        )
+        self.conn.commit()
+
+    def record_turn(self, session_id: str, turn: Dict[str, Any]) -> str:
+        """Append a turn to the session's open incident, opening one if needed; returns its id"""
+        now = time.time()
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT incident_id FROM incidents WHERE session_id = ? AND status = 'open' "
+                "ORDER BY created_at DESC LIMIT 1",
+                (session_id,),
+            ).fetchone()
+            if row is None:
+                incident_id = uuid.uuid4().hex
+                self.conn.execute(
+                    "INSERT INTO incidents (incident_id, session_id, created_at, updated_at) "
+                    "VALUES (?, ?, ?, ?)",
+                    (incident_id, session_id, now, now),
+                )
+            else:
+                incident_id = row["incident_id"]
+
+            self.conn.execute(
+                "INSERT INTO turns (incident_id, created_at, user_message, image_provided, image_caption, ai_response) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    incident_id,
+                    now,
+                    turn.get("user_message"),
+                    int(bool(turn.get("image_provided"))),
+                    turn.get("image_caption"),
+                    turn.get("ai_response"),
+                ),
+            )
+            self.conn.execute(
+                "UPDATE incidents SET updated_at = ?, turn_count = turn_count + 1, "
+                "image_provided = MAX(image_provided, ?), last_message = COALESCE(?, last_message) "
+                "WHERE incident_id = ?",
+                (now, int(bool(turn.get("image_provided"))), turn.get("user_message") or None, incident_id),
+            )
+            self.conn.commit()
+        return incident_id
+
+    def set_status(self, incident_id: str, status: str) -> bool:
+        with self._lock:
+            cursor = self.conn.execute(
+                "UPDATE incidents SET status = ?, updated_at = ? WHERE incident_id = ?",
+                (status, time.time(), incident_id),
+            )
+            self.conn.commit()
+        return cursor.rowcount > 0
+
+    def list_incidents(
+        self,
+        status: Optional[str] = None,
+        since: Optional[float] = None,
+        session_id: Optional[str] = None,
+        limit: int = 100,
+    ) -> List[Dict[str, Any]]:
+        """Incidents matching the filters, most recently updated first"""
+        clauses, params = [], []
+        if status is not None:
+            clauses.append("status = ?")
+            params.append(status)
+        if since is not None:
+            clauses.append("updated_at >= ?")
+            params.append(since)
+        if session_id is not None:
+            clauses.append("session_id = ?")
+            params.append(session_id)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        with self._lock:
+            rows = self.conn.execute(
+                f"SELECT * FROM incidents {where} ORDER BY updated_at DESC LIMIT ?",
+                (*params, limit),
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def get_incident(self, incident_id: str) -> Optional[Dict[str, Any]]:
+        """An incident with all of its turns in order"""
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT * FROM incidents WHERE incident_id = ?", (incident_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            turns = self.conn.execute(
+                "SELECT created_at, user_message, image_provided, image_caption, ai_response "
+                "FROM turns WHERE incident_id = ? ORDER BY id",
+                (incident_id,),
+            ).fetchall()
+        incident = dict(row)
+        incident["turns"] = [dict(turn) for turn in turns]
+        return incident
+
+
+def create_report_store() -> ReportStore:
+    """Open the report database at REPORT_DB_PATH (default report_chatbot/reports.db)"""
+    db_path = os.environ.get(
+        "REPORT_DB_PATH",
+        os.path.join(os.path.dirname(os.path.abspath(__file__)), "reports.db"),
+    )
+    return ReportStore(db_path)
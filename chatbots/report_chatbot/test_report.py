@@ -20,7 +20,7 @@ def main():
         conversation_history = result["conversation"]
 
         print(f"🤖 Bot: {result['response']}")
-        print("📝 Report saved at:", result["report_path"])
+        print("📝 Report saved to incident:", result["incident_id"])
         print("-" * 50)
 
 
@@ -0,0 +1,301 @@
+import heapq
+import math
+import os
+import re
+import threading
+import time
+from typing import Any, Dict, FrozenSet, List, Optional, Tuple
+
+# (pattern, severity, label). Matched against normalize_text(), so Arabic
+# is written without hamza/diacritic variants.
+PRIORITY_RULES: List[Tuple[str, float, str]] = [
+    (r"\b(faint(ed|ing)?|unconscious|collapsed?|not breathing|heart attack|seizure)\b", 5, "medical"),
+    (r"(اغمي|اغماء|فاقد الوعي|مغمي|لا يتنفس|نوبه)", 5, "medical"),
+    (r"\b(fire|smoke|burning|flames?)\b", 5, "fire"),
+    (r"(حريق|دخان|نار)", 5, "fire"),
+    (r"\b(crush|stampede|trampled|crowd surge)\b", 5, "crowd"),
+    (r"(تدافع|زحام شديد)", 5, "crowd"),
+    (r"\b(fight(ing)?|violence|knife|weapon|attack(ed)?|punch(ed)?)\b", 4, "violence"),
+    (r"(شجار|مضاربه|هوشه|سلاح|سكين|اعتداء)", 4, "violence"),
+    (r"\b(injur(ed|y)|blood|bleeding|fell|fallen|broken)\b", 3, "injury"),
+    (r"(اصابه|مصاب|دم|نزيف|سقط|طاح)", 3, "injury"),
+    (r"\b(lost (child|kid|boy|girl)|missing child)\b", 3, "lost_child"),
+    (r"(طفل ضايع|طفل مفقود|ضاع)", 3, "lost_child"),
+    (r"\b(suspicious|unattended (bag|package)|strange object)\b", 2, "suspicious"),
+    (r"(مشبوه|غريب|شنطه متروكه)", 2, "suspicious"),
+]
+
+# BLIP captions are English; these confirm what the text reports
+CAPTION_RULES: List[Tuple[str, float, str]] = [
+    (r"\b(fire|smoke|flames?)\b", 2, "fire"),
+    (r"\b(lying|laying) (on|in) the (ground|floor|stairs)\b", 2, "medical"),
+    (r"\b(blood|ambulance|stretcher)\b", 1, "injury"),
+    (r"\b(crowd|people) (of people )?(pushing|running)\b", 1, "crowd"),
+]
+
+ARABIC_VARIANTS = str.maketrans(
+    {"أ": "ا", "إ": "ا", "آ": "ا", "ة": "ه", "ى": "ي", **{chr(0x660 + d): str(d) for d in range(10)}}
+)
+ARABIC_DIACRITICS = re.compile(r"[ً-ْـ]")
+
+
+def normalize_text(text: str) -> str:
+    return ARABIC_DIACRITICS.sub("", (text or "").lower()).translate(ARABIC_VARIANTS)
+
+
+STOPWORDS = frozenset(
+    "the and there near with from for this that was were are has have had please help "
+    "someone somebody here now just very out broke happened عند في من على الى هنا فيه".split()
+)
+
+# Words that name a place in the stadium; with numbers they locate a report
+PLACE_WORDS = frozenset(
+    "gate section block row seat stand stands entrance exit court food toilet toilets "
+    "parking stairs tunnel vip north south east west "
+    "بوابه قسم مدرج مدخل مخرج مطعم دورات مواقف درج شمال جنوب شرق غرب".split()
+)
+DIRECTIONS = frozenset("north south east west شمال جنوب شرق غرب".split())
+
+
+def word_set(text: str) -> FrozenSet[str]:
+    # Numbers are kept whatever their length: they are gates, sections and rows
+    return frozenset(
+        w for w in re.findall(r"\w+", text)
+        if (len(w) > 2 or w.isdigit()) and w not in STOPWORDS
+    )
+
+
+def location_words(words) -> FrozenSet[str]:
+    return frozenset(w for w in words if w.isdigit() or w in PLACE_WORDS)
+
+
+def same_location(location, other) -> bool:
+    """Both name a place, share part of it and disagree on no number or direction"""
+    if not location & other:
+        return False
+    for kind in (str.isdigit, DIRECTIONS.__contains__):
+        mine = {w for w in location if kind(w)}
+        theirs = {w for w in other if kind(w)}
+        if mine and theirs and not mine & theirs:
+            return False
+    return True
+
+
+def score_text(text: str, caption: Optional[str] = None) -> Tuple[float, FrozenSet[str]]:
+    """Severity from keyword rules: the strongest match plus half of the others"""
+    matches = [
+        (weight, label)
+        for pattern, weight, label in PRIORITY_RULES
+        if re.search(pattern, text)
+    ]
+    if caption:
+        matches += [
+            (weight, label)
+            for pattern, weight, label in CAPTION_RULES
+            if re.search(pattern, caption.lower())
+        ]
+    if not matches:
+        return 1.0, frozenset()
+    weights = sorted((weight for weight, _ in matches), reverse=True)
+    return weights[0] + 0.5 * sum(weights[1:]), frozenset(label for _, label in matches)
+
+
+class TriageQueue:
+    """
+    In-memory ranked queue of active incidents for responders.
+
+    Each report is scored locally from keyword rules on its text and image
+    caption; turns matching no rule (greetings, thanks) are only used to
+    update their session's incident, e.g. with a location given later. A
+    report from a session that already has an active incident updates it;
+    otherwise it is merged into an active incident of the same category
+    reported within `dedup_window` seconds at the same location (shared
+    gate/section numbers or place words, with no conflicting number or
+    direction) whose wording overlaps by at least `similarity` (Jaccard),
+    so many fans reporting one event make one entry with a reporter count
+    while separate emergencies of the same kind stay apart. Priority is
+    severity (plus a bonus per extra reporter) halved every `half_life`
+    seconds since the last report.
+
+    Exponential decay scales every entry by the same factor as time passes,
+    so the ranking only changes when a report arrives. Entries are kept in
+    a heap keyed by log2(priority) at time zero; next() pops the top
+    `limit` entries and pushes them back, skipping versions superseded by
+    a later update, without rescoring the whole queue.
+    """
+
+    def __init__(
+        self,
+        dedup_window: Optional[float] = None,
+        similarity: float = 0.3,
+        half_life: float = 600.0,
+        max_age: float = 3600.0,
+    ):
+        if dedup_window is None:
+            dedup_window = float(os.environ.get("TRIAGE_DEDUP_WINDOW", 300))
+        self.dedup_window = dedup_window
+        self.similarity = similarity
+        self.half_life = half_life
+        self.max_age = max_age
+
+        self._incidents: Dict[str, Dict[str, Any]] = {}
+        self._by_session: Dict[str, str] = {}
+        self._heap: List[Tuple[float, int, str]] = []
+        self._version = 0
+        self._last_expiry = 0.0
+        self._lock = threading.Lock()
+
+    def add(
+        self,
+        session_id: str,
+        incident_id: str,
+        message: str,
+        image_caption: Optional[str] = None,
+        timestamp: Optional[float] = None,
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Score a report and add it to the queue
+
+        Returns:
+            The triage entry it landed in, or None for a turn with no emergency
+            keyword from a session without an active incident
+        """
+        now = timestamp or time.time()
+        text = normalize_text(message)
+        severity, labels = score_text(text, image_caption)
+        words = word_set(text) | word_set(normalize_text(image_caption))
+
+        with self._lock:
+            if now - self._last_expiry > 60:
+                self._expire(now)
+            entry = self._incidents.get(self._by_session.get(session_id, ""))
+            if entry is None and not labels:
+                return None
+            if entry is None:
+                entry = self._find_duplicate(labels, words, now)
+            if entry is None:
+                entry = {
+                    "triage_id": incident_id,
+                    "incident_ids": [],
+                    "sessions": set(),
+                    "severity": 0.0,
+                    "labels": set(),
+                    "words": set(),
+                    "messages": [],
+                    "first_reported": now,
+                    "last_reported": now,
+                }
+                self._incidents[incident_id] = entry
+
+            if incident_id not in entry["incident_ids"]:
+                entry["incident_ids"].append(incident_id)
+            entry["sessions"].add(session_id)
+            entry["severity"] = max(entry["severity"], severity)
+            entry["labels"] |= labels
+            entry["words"] |= words
+            if message:
+                entry["messages"] = (entry["messages"] + [message])[-5:]
+            if image_caption:
+                entry["image_caption"] = image_caption
+            entry["last_reported"] = max(entry["last_reported"], now)
+            self._by_session[session_id] = entry["triage_id"]
+            self._push(entry)
+            return self._public(entry, now)
+
+    def _find_duplicate(self, labels, words, now: float) -> Optional[Dict[str, Any]]:
+        best, best_score = None, self.similarity
+        location = location_words(words)
+        if not location:
+            return None  # can't tell one report of this kind from another
+        for entry in self._incidents.values():
+            if now - entry["last_reported"] > self.dedup_window:
+                continue
+            if not labels & entry["labels"]:
+                continue
+            if not same_location(location, location_words(entry["words"])):
+                continue
+            union = len(words | entry["words"])
+            score = len(words & entry["words"]) / union if union else 0.0
+            if score >= best_score:
+                best, best_score = entry, score
+        return best
+
+    def _rank_key(self, entry: Dict[str, Any]) -> float:
+        base = entry["severity"] + math.log2(len(entry["sessions"]))
+        return math.log2(base) + entry["last_reported"] / self.half_life
+
+    def _priority(self, entry: Dict[str, Any], now: float) -> float:
+        # Same as (severity + log2(reporters)) * 0.5 ** (age / half_life)
+        return 2 ** (entry["rank_key"] - now / self.half_life)
+
+    def _push(self, entry: Dict[str, Any]):
+        self._version += 1
+        entry["version"] = self._version
+        entry["rank_key"] = self._rank_key(entry)
+        heapq.heappush(self._heap, (-entry["rank_key"], self._version, entry["triage_id"]))
+        if len(self._heap) > 2 * len(self._incidents) + 64:
+            # Drop superseded versions
+            self._heap = [
+                (-e["rank_key"], e["version"], e["triage_id"]) for e in self._incidents.values()
+            ]
+            heapq.heapify(self._heap)
+
+    def _public(self, entry: Dict[str, Any], now: float) -> Dict[str, Any]:
+        return {
+            "triage_id": entry["triage_id"],
+            "incident_ids": list(entry["incident_ids"]),
+            "priority": round(self._priority(entry, now), 3),
+            "severity": entry["severity"],
+            "labels": sorted(entry["labels"]),
+            "reporters": len(entry["sessions"]),
+            "messages": list(entry["messages"]),
+            "image_caption": entry.get("image_caption"),
+            "first_reported": entry["first_reported"],
+            "last_reported": entry["last_reported"],
+        }
+
+    def next(self, limit: int = 10) -> List[Dict[str, Any]]:
+        """The `limit` highest-priority active incidents"""
+        now = time.time()
+        top, popped = [], []
+        with self._lock:
+            while self._heap and len(top) < limit:
+                item = heapq.heappop(self._heap)
+                entry = self._incidents.get(item[2])
+                if entry is None or entry["version"] != item[1]:
+                    continue
+                if now - entry["last_reported"] > self.max_age:
+                    self._drop(item[2])
+                    continue
+                popped.append(item)
+                top.append(self._public(entry, now))
+            for item in popped:
+                heapq.heappush(self._heap, item)
+        return top
+
+    def resolve(self, triage_id: str) -> Optional[Dict[str, Any]]:
+        """Remove an incident from the queue; returns it, or None if unknown"""
+        with self._lock:
+            entry = self._drop(triage_id)
+            return self._public(entry, time.time()) if entry else None
+
+    def _drop(self, triage_id: str) -> Optional[Dict[str, Any]]:
+        entry = self._incidents.pop(triage_id, None)
+        if entry is not None:
+            for session_id in entry["sessions"]:
+                if self._by_session.get(session_id) == triage_id:
+                    del self._by_session[session_id]
+        return entry
+
+    def _expire(self, now: float):
+        self._last_expiry = now
+        expired = [
+            triage_id
+            for triage_id, entry in self._incidents.items()
+            if now - entry["last_reported"] > self.max_age
+        ]
+        for triage_id in expired:
+            self._drop(triage_id)
+
+    def __len__(self) -> int:
+        return len(self._incidents)
@@ -0,0 +1,241 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, Optional
+
+
+# ===================== Session =====================
+
+
+class Session:
+    """Conversation state for a single fan, keyed by session id.
+
+    Each chatbot keeps its history in its own channel (e.g. "preorder",
+    "report"). Channel objects are created lazily by the store's factories and
+    are mutated in place, so a turn never copies the existing history.
+    """
+
+    def __init__(self, session_id: str, factories: Dict[str, Callable[[], Any]]):
+        self.session_id = session_id
+        self.state: Dict[str, Any] = {}
+        self.last_seen = time.time()
+        self._factories = factories
+        self._channels: Dict[str, Any] = {}
+
+    def channel(self, name: str):
+        if name not in self._channels:
+            self._channels[name] = self._factories[name]()
+        return self._channels[name]
+
+
+# ===================== In-process store =====================
+
+
+class InMemorySessionStore:
+    """Bounded session store with LRU and TTL eviction.
+
+    Sessions are kept in an OrderedDict ordered by last access, so both the
+    LRU victim and the expired sessions are always at the front.
+    """
+
+    def __init__(
+        self,
+        channels: Dict[str, Callable[[], Any]],
+        max_sessions: int = 10000,
+        ttl_seconds: float = 3600,
+    ):
+        self.channels = channels
+        self.max_sessions = max_sessions
+        self.ttl_seconds = ttl_seconds
+        self._sessions: "OrderedDict[str, Session]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def get(self, session_id: str) -> Session:
+        """Return the session for `session_id`, creating it if needed"""
+        now = time.time()
+        with self._lock:
+            self._evict_expired(now)
+            session = self._sessions.get(session_id)
+            if session is None:
+                session = self._load(session_id)
+                self._sessions[session_id] = session
+                while len(self._sessions) > self.max_sessions:
+                    self._sessions.popitem(last=False)
+            else:
+                self._sessions.move_to_end(session_id)
+            session.last_seen = now
+        self._touch(session)
+        return session
+
+    def persist(self, session: Session, channel: str, turns: Iterable[Dict[str, Any]]):
+        """Record turns that were already applied to `session.channel(channel)`"""
+
+    def set_state(self, session: Session, key: str, value: Any):
+        if value is None:
+            session.state.pop(key, None)
+        else:
+            session.state[key] = value
+
+    def clear(self, session_id: Optional[str] = None):
+        """Forget one session, or every session when no id is given"""
+        with self._lock:
+            if session_id is None:
+                self._sessions.clear()
+            else:
+                self._sessions.pop(session_id, None)
+
+    def _evict_expired(self, now: float):
+        while self._sessions:
+            oldest = next(iter(self._sessions.values()))
+            if now - oldest.last_seen <= self.ttl_seconds:
+                break
+            self._sessions.popitem(last=False)
+
+    def _load(self, session_id: str) -> Session:
+        return Session(session_id, self.channels)
+
+    def _touch(self, session: Session):
+        pass
+
+
+# ===================== SQLite store =====================
+
+
+class SQLiteSessionStore(InMemorySessionStore):
+    """Write-through SQLite store with the in-memory LRU as a hot cache.
+
+    Each turn is a single appended row, so a write costs O(turn size). Sessions
+    evicted from memory are rebuilt from their most recent turns on next use,
+    and sessions idle for longer than the TTL are purged from the file.
+    """
+
+    PURGE_INTERVAL = 60
+
+    def __init__(
+        self,
+        channels: Dict[str, Callable[[], Any]],
+        db_path: str,
+        max_sessions: int = 10000,
+        ttl_seconds: float = 3600,
+        max_loaded_turns: int = 200,
+    ):
+        super().__init__(channels, max_sessions, ttl_seconds)
+        self.db_path = db_path
+        self.max_loaded_turns = max_loaded_turns
+        self._db_lock = threading.Lock()
+        self._last_purge = 0.0
+
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS sessions (
+                session_id TEXT PRIMARY KEY,
+                state TEXT NOT NULL DEFAULT '{}',
+                last_seen REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS turns (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                session_id TEXT NOT NULL,
+                channel TEXT NOT NULL,
+                payload TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_turns_session ON turns (session_id, channel, id);
+            CREATE INDEX IF NOT EXISTS idx_sessions_last_seen ON sessions (last_seen);
+            """
+        )
+        self.conn.commit()
+
+    def persist(self, session: Session, channel: str, turns: Iterable[Dict[str, Any]]):
+        rows = [
+            (session.session_id, channel, json.dumps(turn, ensure_ascii=False))
+            for turn in turns
+        ]
+        with self._db_lock:
+            self.conn.executemany(
+                "INSERT INTO turns (session_id, channel, payload) VALUES (?, ?, ?)", rows
+            )
+            self.conn.commit()
+
+    def set_state(self, session: Session, key: str, value: Any):
+        super().set_state(session, key, value)
+        with self._db_lock:
+            self.conn.execute(
+                "UPDATE sessions SET state = ? WHERE session_id = ?",
+                (json.dumps(session.state, ensure_ascii=False), session.session_id),
+            )
+            self.conn.commit()
+
+    def clear(self, session_id: Optional[str] = None):
+        super().clear(session_id)
+        with self._db_lock:
+            if session_id is None:
+                self.conn.execute("DELETE FROM turns")
+                self.conn.execute("DELETE FROM sessions")
+            else:
+                self.conn.execute("DELETE FROM turns WHERE session_id = ?", (session_id,))
+                self.conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+            self.conn.commit()
+
+    def _load(self, session_id: str) -> Session:
+        session = Session(session_id, self.channels)
+        with self._db_lock:
+            row = self.conn.execute(
+                "SELECT state, last_seen FROM sessions WHERE session_id = ?", (session_id,)
+            ).fetchone()
+            if row is None or time.time() - row[1] > self.ttl_seconds:
+                return session
+            session.state = json.loads(row[0])
+            for channel in self.channels:
+                turns = self.conn.execute(
+                    "SELECT payload FROM turns WHERE session_id = ? AND channel = ? "
+                    "ORDER BY id DESC LIMIT ?",
+                    (session_id, channel, self.max_loaded_turns),
+                ).fetchall()
+                for (payload,) in reversed(turns):
+                    session.channel(channel).append(json.loads(payload))
+        return session
+
+    def _touch(self, session: Session):
+        with self._db_lock:
+            self.conn.execute(
+                "INSERT INTO sessions (session_id, last_seen) VALUES (?, ?) "
+                "ON CONFLICT(session_id) DO UPDATE SET last_seen = excluded.last_seen",
+                (session.session_id, session.last_seen),
+            )
+            if session.last_seen - self._last_purge > self.PURGE_INTERVAL:
+                self._purge_expired(session.last_seen)
+            self.conn.commit()
+
+    def _purge_expired(self, now: float):
+        cutoff = now - self.ttl_seconds
+        self.conn.execute(
+            "DELETE FROM turns WHERE session_id IN "
+            "(SELECT session_id FROM sessions WHERE last_seen < ?)",
+            (cutoff,),
+        )
+        self.conn.execute("DELETE FROM sessions WHERE last_seen < ?", (cutoff,))
+        self._last_purge = now
+
+
+def create_session_store(channels: Dict[str, Callable[[], Any]]) -> InMemorySessionStore:
+    """Build the session store selected by the SESSION_STORE environment variable"""
+    backend = os.environ.get("SESSION_STORE", "memory").lower()
+    max_sessions = int(os.environ.get("SESSION_MAX_SESSIONS", 10000))
+    ttl_seconds = float(os.environ.get("SESSION_TTL_SECONDS", 3600))
+
+    if backend == "sqlite":
+        db_path = os.environ.get(
+            "SESSION_DB_PATH",
+            os.path.join(os.path.dirname(os.path.abspath(__file__)), "sessions.db"),
+        )
+        return SQLiteSessionStore(channels, db_path, max_sessions, ttl_seconds)
+    if backend == "memory":
+        return InMemorySessionStore(channels, max_sessions, ttl_seconds)
+    raise ValueError(f"Unknown SESSION_STORE backend: {backend}")